@@ -81,6 +81,37 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Recomendaciones por usuario. Con varios workers conviene un backend
+# compartido (Redis/Memcached) para que la invalidación llegue a todos.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bookwise',
+    }
+}
+
+# Resultados de búsqueda: por defecto una caché LRU en memoria de cada proceso.
+# Indicar aquí un alias de CACHES (compartida) para repartirla entre workers;
+# con TTL = 0 no se cachean.
+BOOKWISE_CACHE_BUSQUEDAS = None
+BOOKWISE_CACHE_BUSQUEDAS_TTL = 5 * 60
+
+# Writer de Whoosh al reconstruir el índice completo (ver
+# `python manage.py benchmark_indexado` para elegir los valores de esta máquina)
+BOOKWISE_WHOOSH_PROCS = 1
+BOOKWISE_WHOOSH_LIMITMB = 256
+BOOKWISE_WHOOSH_MULTISEGMENT = False
+
+# Recomendaciones: 'contenido' (géneros y autores del perfil) o 'mixto', que
+# lo mezcla con el filtrado colaborativo ítem-ítem con el peso indicado. Los
+# vecinos se calculan con `python manage.py calcular_vecinos`.
+BOOKWISE_MODO_RECOMENDACION = 'contenido'
+BOOKWISE_PESO_COLABORATIVO = 0.5
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
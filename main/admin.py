@@ -1,18 +1,27 @@
 from django.contrib import admin
-from .models import Valoracion
+from .models import Libro, Valoracion, TareaScraping
+
+
+@admin.register(Libro)
+class LibroAdmin(admin.ModelAdmin):
+    list_display = ('titulo', 'autor', 'genero', 'url')
+    list_filter = ('genero',)
+    search_fields = ('titulo', 'autor', 'url')
+    readonly_fields = ('clave',)
 
 
 @admin.register(Valoracion)
 class ValoracionAdmin(admin.ModelAdmin):
-    list_display = ('usuario', 'titulo_libro', 'puntuacion', 'fecha')
+    list_display = ('usuario', 'libro', 'puntuacion', 'fecha')
     list_filter = ('puntuacion', 'fecha', 'usuario')
-    search_fields = ('titulo_libro', 'usuario__username')
+    search_fields = ('libro__titulo', 'usuario__username')
+    raw_id_fields = ('libro',)
     readonly_fields = ('fecha', 'actualizado')
     ordering = ('-fecha',)
     
     fieldsets = (
         ('Información del libro', {
-            'fields': ('titulo_libro',)
+            'fields': ('libro',)
         }),
         ('Valoración', {
             'fields': ('usuario', 'puntuacion')
@@ -22,3 +31,11 @@ class ValoracionAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+
+
+@admin.register(TareaScraping)
+class TareaScrapingAdmin(admin.ModelAdmin):
+    list_display = ('id', 'estado', 'progreso', 'mensaje', 'solicitada_por', 'fecha_creacion', 'fecha_fin')
+    list_filter = ('estado', 'fecha_creacion')
+    readonly_fields = ('fecha_creacion', 'fecha_inicio', 'fecha_fin')
+    ordering = ('-fecha_creacion',)
@@ -0,0 +1,222 @@
+# api.py
+"""
+API JSON de solo lectura sobre el catálogo.
+
+Endpoints:
+    /api/libros/           Búsqueda con los filtros de buscar_filtrado()
+    /api/generos/          Géneros con su número de libros
+    /api/recomendaciones/  Recomendaciones del usuario autenticado
+
+Los listados se paginan con un cursor opaco (?cursor=) que devuelve cada
+respuesta en `siguiente`; el cursor guarda la página y la generación del
+índice, así que deja de ser válido al reindexar (400). Con ?campos= se
+eligen los campos de cada libro (por defecto los de la tarjeta).
+
+Todas las respuestas llevan un ETag derivado de la generación del índice:
+un cliente o una CDN puede revalidar con If-None-Match y recibir un 304
+mientras el catálogo no cambie.
+"""
+import base64
+import binascii
+import hashlib
+import json
+import math
+
+from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_GET
+
+from main.models import PerfilUsuario
+from main.recommender import firma_recomendaciones, obtener_recomendaciones_y_perfil
+from main.whoosh_utils import (CAMPOS_ORDEN, CAMPOS_TARJETA, POR_PAGINA, buscar_filtrado_paginado,
+                               generacion_indice, obtener_catalogo)
+
+# Campos de un libro que se pueden pedir con ?campos=
+CAMPOS_LIBRO = CAMPOS_TARJETA + ('sinopsis',)
+CAMPOS_BUSQUEDA = ('titulo', 'autor', 'sinopsis')
+
+MAX_POR_PAGINA = 100
+MAX_RECOMENDACIONES = 50
+
+# Rango de los campos NUMERIC(numtype=int) del índice (num_votos)
+MAX_ENTERO_INDICE = 2 ** 31 - 1
+
+# Segundos que clientes y CDN pueden reutilizar una respuesta sin revalidar
+MAX_AGE_CATALOGO = 60
+
+
+class ParametroInvalido(ValueError):
+    """Parámetro de la petición con un valor no válido (respuesta 400)"""
+
+
+def _error(mensaje, status=400):
+    return JsonResponse({'error': mensaje}, status=status)
+
+
+def _lista(request, nombre):
+    """Valores de un parámetro separados por comas (?generos=a,b o ?generos=a&generos=b)"""
+    valores = []
+    for valor in request.GET.getlist(nombre):
+        valores.extend(v.strip() for v in valor.split(',') if v.strip())
+    return valores
+
+
+def _numero(request, nombre, tipo=int, minimo=None, maximo=None, defecto=None):
+    valor = request.GET.get(nombre, '')
+    if valor == '':
+        return defecto
+    try:
+        numero = tipo(valor)
+    except ValueError:
+        raise ParametroInvalido(f"'{nombre}' debe ser un número")
+    if not math.isfinite(numero):
+        raise ParametroInvalido(f"'{nombre}' debe ser un número finito")
+    if (minimo is not None and numero < minimo) or (maximo is not None and numero > maximo):
+        raise ParametroInvalido(f"'{nombre}' fuera de rango ({minimo}-{maximo})")
+    return numero
+
+
+def _campos_pedidos(request):
+    campos = _lista(request, 'campos')
+    if not campos:
+        return CAMPOS_TARJETA
+    desconocidos = [c for c in campos if c not in CAMPOS_LIBRO]
+    if desconocidos:
+        raise ParametroInvalido(f"Campos no válidos: {', '.join(desconocidos)}")
+    return tuple(campos)
+
+
+def codificar_cursor(pagina, por_pagina, generacion):
+    datos = json.dumps({'p': pagina, 'n': por_pagina, 'g': generacion}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(datos.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(cursor, generacion):
+    """
+    Retorna (pagina, por_pagina) de un cursor de esta generación del índice.
+
+    Raises:
+        ParametroInvalido: Si el cursor está mal formado o es de otra generación
+    """
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        datos = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        pagina, por_pagina, generacion_cursor = int(datos['p']), int(datos['n']), datos['g']
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise ParametroInvalido('Cursor no válido')
+    if generacion_cursor != generacion:
+        raise ParametroInvalido('El catálogo ha cambiado: vuelve a empezar sin cursor')
+    if pagina < 1 or not 1 <= por_pagina <= MAX_POR_PAGINA:
+        raise ParametroInvalido('Cursor no válido')
+    return pagina, por_pagina
+
+
+def _etag_catalogo(request, *args, **kwargs):
+    """ETag de una respuesta del catálogo: generación del índice y parámetros"""
+    generacion = generacion_indice() or ''
+    return hashlib.sha1(f'{generacion}|{request.get_full_path()}'.encode('utf-8')).hexdigest()
+
+
+def _etag_recomendaciones(request, *args, **kwargs):
+    """ETag de las recomendaciones: generación, modo y vecinos, usuario y versión de su perfil"""
+    if not request.user.is_authenticated:
+        return None
+    actualizado = (PerfilUsuario.objects.filter(usuario_id=request.user.id)
+                   .values_list('actualizado', flat=True).first())
+    base = (f'{generacion_indice() or ""}|{firma_recomendaciones()}|{request.user.id}|{actualizado}'
+            f'|{request.get_full_path()}')
+    return hashlib.sha1(base.encode('utf-8')).hexdigest()
+
+
+def _cachear(respuesta, privada=False):
+    """Cabeceras Cache-Control de las respuestas correctas"""
+    if respuesta.status_code == 200:
+        if privada:
+            patch_cache_control(respuesta, private=True, no_cache=True)
+        else:
+            patch_cache_control(respuesta, public=True, max_age=MAX_AGE_CATALOGO)
+    return respuesta
+
+
+@require_GET
+@condition(etag_func=_etag_catalogo)
+def libros(request):
+    """
+    Búsqueda paginada en el catálogo.
+
+    Parámetros: q, buscar_en, generos, valoracion_min, valoracion_max,
+    votos_min, fuente, orden (ej: -valoracion,titulo), campos, limite, cursor.
+    """
+    generacion = obtener_catalogo().generacion
+    try:
+        cursor = request.GET.get('cursor')
+        if cursor:
+            pagina, por_pagina = decodificar_cursor(cursor, generacion)
+        else:
+            pagina = 1
+            por_pagina = _numero(request, 'limite', minimo=1, maximo=MAX_POR_PAGINA, defecto=POR_PAGINA)
+
+        buscar_en = _lista(request, 'buscar_en')
+        if any(c not in CAMPOS_BUSQUEDA for c in buscar_en):
+            raise ParametroInvalido(f"'buscar_en' admite: {', '.join(CAMPOS_BUSQUEDA)}")
+        orden = _lista(request, 'orden')
+        if any(c.lstrip('-') not in CAMPOS_ORDEN for c in orden):
+            raise ParametroInvalido(f"'orden' admite: {', '.join(CAMPOS_ORDEN)} (con '-' para descendente)")
+
+        resultado = buscar_filtrado_paginado(
+            pagina=pagina,
+            por_pagina=por_pagina,
+            orden=orden or None,
+            campos_resultado=_campos_pedidos(request),
+            query_str=request.GET.get('q', '').strip(),
+            campos=buscar_en or None,
+            generos=_lista(request, 'generos') or None,
+            valoracion_min=_numero(request, 'valoracion_min', float),
+            valoracion_max=_numero(request, 'valoracion_max', float),
+            votos_min=_numero(request, 'votos_min', minimo=0, maximo=MAX_ENTERO_INDICE),
+            fuente=request.GET.get('fuente') or None,
+        )
+    except ParametroInvalido as e:
+        return _error(str(e))
+
+    # Una página pedida más allá de la última se recorta a la última: sin siguiente
+    siguiente = None
+    if resultado.siguiente and resultado.pagina == pagina:
+        siguiente = codificar_cursor(resultado.siguiente, por_pagina, generacion)
+
+    return _cachear(JsonResponse({
+        'total': resultado.total,
+        'libros': resultado.libros,
+        'siguiente': siguiente,
+    }))
+
+
+@require_GET
+@condition(etag_func=_etag_catalogo)
+def generos(request):
+    """Géneros del catálogo con su número de libros"""
+    catalogo = obtener_catalogo()
+    return _cachear(JsonResponse({
+        'generos': [{'nombre': g, 'libros': catalogo.conteo_generos[g]} for g in catalogo.generos],
+    }))
+
+
+@require_GET
+@condition(etag_func=_etag_recomendaciones)
+def recomendaciones(request):
+    """Recomendaciones del usuario autenticado (?n=, ?campos=)"""
+    if not request.user.is_authenticated:
+        return _error('Autenticación requerida', status=401)
+    try:
+        n = _numero(request, 'n', minimo=1, maximo=MAX_RECOMENDACIONES, defecto=4)
+        campos = _campos_pedidos(request)
+    except ParametroInvalido as e:
+        return _error(str(e))
+
+    recomendados, _ = obtener_recomendaciones_y_perfil(request.user.id, n=n)
+    return _cachear(JsonResponse({
+        'recomendaciones': [
+            {**{c: libro[c] for c in campos if c in libro}, 'score': libro['score'], 'motivo': libro['motivo']}
+            for libro in recomendados
+        ],
+    }), privada=True)
@@ -0,0 +1,193 @@
+# colaborativo.py
+"""
+Filtrado colaborativo ítem-ítem.
+
+Fuera de las peticiones (`python manage.py calcular_vecinos`):
+1. Matriz dispersa usuarios x libros con las valoraciones de los usuarios
+   (LibroUsuario.valoracion de 1 a 5 y Valoracion.puntuacion de 1 a 10,
+   pasada a la misma escala)
+2. Similitud coseno entre libros con un producto disperso X^T X, amortiguada
+   para los pares con pocos lectores en común
+3. Se guardan los K libros más parecidos a cada uno (VecinoLibro)
+
+En cada petición solo se leen los vecinos de los libros que el usuario ha
+valorado, así que el coste no depende del número de usuarios ni de libros.
+"""
+import numpy as np
+from scipy import sparse
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from main.models import LibroUsuario, Valoracion, VecinoLibro
+
+NUM_VECINOS = 20
+
+# Pares de libros con menos lectores en común no se consideran parecidos
+MIN_LECTORES_COMUNES = 2
+
+# La similitud se multiplica por comunes / (comunes + AMORTIGUACION)
+AMORTIGUACION = 5
+
+TAM_LOTE = 1000
+
+
+def leer_valoraciones(usuario_id=None):
+    """
+    Valoraciones en la escala de la librería (1 - 5).
+
+    Si un libro está valorado en la librería y en Valoracion, manda la de la
+    librería, que es la que el usuario mantiene desde la web.
+
+    Returns:
+        dict: (usuario_id, libro_id) -> valoración
+    """
+    puntuaciones = Valoracion.objects.all()
+    libreria = LibroUsuario.objects.filter(estado='leido', valoracion__isnull=False)
+    if usuario_id is not None:
+        puntuaciones = puntuaciones.filter(usuario_id=usuario_id)
+        libreria = libreria.filter(usuario_id=usuario_id)
+
+    valoraciones = {
+        (usuario, libro): puntuacion / 2
+        for usuario, libro, puntuacion in puntuaciones.values_list('usuario_id', 'libro_id', 'puntuacion').iterator()
+    }
+    valoraciones.update(
+        ((usuario, libro), valoracion)
+        for usuario, libro, valoracion in libreria.values_list('usuario_id', 'libro_id', 'valoracion').iterator()
+    )
+    return valoraciones
+
+
+def matriz_valoraciones(valoraciones):
+    """
+    Retorna (matriz CSR usuarios x libros, id de Libro de cada columna).
+
+    Las valoraciones de 0 o menos no se guardan (no caben en una matriz dispersa).
+    """
+    pares = [(u, l, v) for (u, l), v in valoraciones.items() if v > 0]
+    if not pares:
+        return sparse.csr_matrix((0, 0)), np.empty(0, dtype=np.int64)
+
+    usuarios, libros, valores = zip(*pares)
+    _, filas = np.unique(np.array(usuarios, dtype=np.int64), return_inverse=True)
+    libro_ids, columnas = np.unique(np.array(libros, dtype=np.int64), return_inverse=True)
+    matriz = sparse.csr_matrix(
+        (np.array(valores, dtype=np.float64), (filas, columnas)),
+        shape=(filas.max() + 1, len(libro_ids)),
+    )
+    return matriz, libro_ids
+
+
+def similitudes(matriz, min_comunes=MIN_LECTORES_COMUNES, amortiguacion=AMORTIGUACION):
+    """
+    Similitud coseno amortiguada entre las columnas (libros) de la matriz.
+
+    Returns:
+        sparse.csr_matrix: libros x libros, sin diagonal ni pares con menos
+        de min_comunes lectores en común
+    """
+    productos = (matriz.T @ matriz).tocsr()
+    leidos = matriz.copy()
+    leidos.data[:] = 1.0
+    comunes = (leidos.T @ leidos).tocsr()
+    # Todas las valoraciones son positivas: los dos productos tienen los mismos
+    # elementos no nulos, así que con los índices ordenados sus datos coinciden
+    productos.sort_indices()
+    comunes.sort_indices()
+
+    normas = np.sqrt(np.asarray(matriz.multiply(matriz).sum(axis=0)).ravel())
+    filas = np.repeat(np.arange(productos.shape[0]), np.diff(productos.indptr))
+    columnas = productos.indices
+    valores = (productos.data / (normas[filas] * normas[columnas])
+               * comunes.data / (comunes.data + amortiguacion))
+
+    validos = (filas != columnas) & (comunes.data >= min_comunes) & (valores > 0)
+    return sparse.csr_matrix(
+        (valores[validos], (filas[validos], columnas[validos])),
+        shape=productos.shape,
+    )
+
+
+def top_vecinos(similitud, k=NUM_VECINOS):
+    """Genera (fila, columna, similitud) de las k columnas más parecidas de cada fila"""
+    for fila in range(similitud.shape[0]):
+        inicio, fin = similitud.indptr[fila], similitud.indptr[fila + 1]
+        valores = similitud.data[inicio:fin]
+        columnas = similitud.indices[inicio:fin]
+        if len(valores) > k:
+            mejores = np.argpartition(-valores, k - 1)[:k]
+            valores, columnas = valores[mejores], columnas[mejores]
+        for columna, valor in zip(columnas, valores):
+            yield fila, columna, float(valor)
+
+
+def calcular_vecinos(k=NUM_VECINOS, min_comunes=MIN_LECTORES_COMUNES):
+    """
+    Recalcula y guarda los vecinos de todos los libros.
+
+    Todos los pares se guardan con la misma fecha de cálculo, que pasa a ser
+    la versión de los vecinos (version_vecinos()).
+
+    Returns:
+        int: Pares (libro, vecino) guardados
+    """
+    matriz, libro_ids = matriz_valoraciones(leer_valoraciones())
+    calculado = timezone.now()
+    vecinos = [
+        VecinoLibro(libro_id=int(libro_ids[fila]), vecino_id=int(libro_ids[columna]), similitud=valor,
+                    calculado=calculado)
+        for fila, columna, valor in top_vecinos(similitudes(matriz, min_comunes), k)
+    ]
+    with transaction.atomic():
+        VecinoLibro.objects.all().delete()
+        VecinoLibro.objects.bulk_create(vecinos, batch_size=TAM_LOTE)
+    return len(vecinos)
+
+
+def version_vecinos():
+    """
+    Versión de los vecinos guardados: la fecha del último calcular_vecinos()
+    (None si no hay vecinos). Se lee de la base de datos, así que todos los
+    procesos ven la misma.
+    """
+    return VecinoLibro.objects.aggregate(version=Max('calculado'))['version']
+
+
+def peso_valoracion(valoracion):
+    """(valoración - 3) / 2: positivo si el libro gustó, negativo si no (3 estrellas, neutro)"""
+    return (valoracion - 3) / 2
+
+
+def afinidades(usuario_id):
+    """
+    Afinidad del usuario con los libros parecidos a los que ha valorado.
+
+    La afinidad de un libro es la suma de similitud * peso_valoracion() sobre
+    los libros valorados de los que es vecino. Dos consultas: las
+    valoraciones del usuario y los vecinos de esos libros.
+
+    Returns:
+        dict: id de Libro -> (afinidad > 0, id del libro valorado que más aporta)
+    """
+    pesos = {}
+    for (_, libro_id), valoracion in leer_valoraciones(usuario_id).items():
+        pesos[libro_id] = peso_valoracion(valoracion)
+    if not any(pesos.values()):
+        return {}
+
+    acumulado = {}
+    mejor = {}
+    vecinos = VecinoLibro.objects.filter(libro_id__in=[l for l, p in pesos.items() if p])
+    for libro_id, vecino_id, similitud in vecinos.values_list('libro_id', 'vecino_id', 'similitud'):
+        if vecino_id in pesos:
+            continue
+        aporte = similitud * pesos[libro_id]
+        acumulado[vecino_id] = acumulado.get(vecino_id, 0.0) + aporte
+        if aporte > mejor.get(vecino_id, (0.0, None))[0]:
+            mejor[vecino_id] = (aporte, libro_id)
+
+    return {
+        libro_id: (afinidad, mejor[libro_id][1])
+        for libro_id, afinidad in acumulado.items()
+        if afinidad > 0
+    }
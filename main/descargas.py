@@ -0,0 +1,387 @@
+# descargas.py
+"""
+Descarga concurrente de páginas para el scraping.
+
+Separa la parte de red (lenta y limitada por la latencia) del parseo: las
+páginas se piden en paralelo con un pool de hilos, respetando un máximo de
+conexiones simultáneas y un retardo mínimo entre peticiones por host, y
+reintentando los errores transitorios.
+
+Las respuestas se guardan en una caché en disco (CacheHttp) y se revalidan
+con If-None-Match / If-Modified-Since cuando caducan, de modo que las
+páginas que no han cambiado no se vuelven a descargar ni a parsear.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+USER_AGENT = 'Mozilla/5.0'
+
+# Caché HTTP en disco
+USAR_CACHE_HTTP = True
+CACHE_DIR = os.path.join(os.path.dirname(__file__), '..', 'HttpCache')
+
+# Tiempo (segundos) durante el que una página cacheada se usa sin consultar al servidor
+TTL_POR_TIPO = {
+    'listado': 12 * 60 * 60,        # rankings: cambian a menudo
+    'detalle': 7 * 24 * 60 * 60,    # fichas de libro: casi nunca cambian
+}
+TTL_POR_DEFECTO = 60 * 60
+
+# Limpieza de la caché al terminar cada scraping (CacheHttp.limpiar): se
+# borran las entradas que no se han usado en MAX_EDAD_ENTRADA segundos y los
+# cuerpos y parseos que ya no referencia ninguna entrada. Los ficheros más
+# recientes que MARGEN_LIMPIEZA se respetan, por si otro proceso los está
+# escribiendo (guardar() escribe el cuerpo antes que su entrada).
+MAX_EDAD_ENTRADA = 30 * 24 * 60 * 60
+MARGEN_LIMPIEZA = 60 * 60
+
+MAX_HILOS = 8
+MAX_CONEXIONES_POR_HOST = 4
+RETARDO_CORTESIA = 0.25      # segundos mínimos entre peticiones al mismo host
+REINTENTOS = 3
+ESPERA_REINTENTO = 1.0       # se duplica en cada reintento
+TIMEOUT = 20
+
+# Máximo de descargas lanzadas por delante de la que se está consumiendo, para
+# que recorrer muchas páginas no acumule en memoria todas las respuestas
+VENTANA_DESCARGAS = 32
+
+# Códigos HTTP que merece la pena reintentar
+CODIGOS_TRANSITORIOS = {429, 500, 502, 503, 504}
+
+
+class LimitadorHost:
+    """Limita la concurrencia y el ritmo de peticiones a un mismo host"""
+
+    def __init__(self, max_conexiones, retardo):
+        self._semaforo = threading.BoundedSemaphore(max_conexiones)
+        self._lock = threading.Lock()
+        self._retardo = retardo
+        self._siguiente = 0.0
+
+    def __enter__(self):
+        self._semaforo.acquire()
+        # Reservar el siguiente hueco libre y esperar fuera del lock
+        with self._lock:
+            ahora = time.monotonic()
+            turno = max(ahora, self._siguiente)
+            self._siguiente = turno + self._retardo
+        if turno > ahora:
+            time.sleep(turno - ahora)
+        return self
+
+    def __exit__(self, *exc):
+        self._semaforo.release()
+        return False
+
+
+class CacheHttp:
+    """
+    Caché de respuestas HTTP en disco.
+
+    Estructura del directorio:
+        cuerpos/<sha256>              contenido de cada respuesta (direccionado por contenido)
+        entradas/<sha256 de la url>   metadatos: url, hash del cuerpo, ETag, Last-Modified, fecha
+        parseados/<tipo>/<sha256>     resultado de parsear un cuerpo, en JSON
+
+    Las escrituras son atómicas (fichero temporal + os.replace), así que varios
+    hilos o procesos pueden compartir el mismo directorio. limpiar() quita lo
+    que ya no se usa para que el directorio no crezca sin límite.
+    """
+
+    def __init__(self, directorio=None):
+        self.directorio = directorio or CACHE_DIR
+
+    def _ruta(self, *partes):
+        return os.path.join(self.directorio, *partes)
+
+    def _escribir(self, ruta, datos):
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporal, 'wb') as f:
+            f.write(datos)
+        os.replace(temporal, ruta)
+
+    def _ruta_entrada(self, url):
+        return self._ruta('entradas', hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+    def entrada(self, url):
+        """Metadatos cacheados de una URL, o None si no está (o falta su cuerpo)"""
+        try:
+            with open(self._ruta_entrada(url), encoding='utf-8') as f:
+                entrada = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(self._ruta('cuerpos', entrada['hash'])):
+            return None
+        return entrada
+
+    def vigente(self, entrada, tipo=None):
+        """True si la entrada no ha superado el TTL de su tipo de página"""
+        ttl = TTL_POR_TIPO.get(tipo, TTL_POR_DEFECTO)
+        return time.time() - entrada['fecha'] < ttl
+
+    def cuerpo(self, entrada):
+        with open(self._ruta('cuerpos', entrada['hash']), 'rb') as f:
+            return f.read()
+
+    def guardar(self, url, contenido, etag=None, last_modified=None):
+        """Guarda una respuesta nueva y devuelve su entrada"""
+        hash_cuerpo = hashlib.sha256(contenido).hexdigest()
+        ruta_cuerpo = self._ruta('cuerpos', hash_cuerpo)
+        if not os.path.exists(ruta_cuerpo):
+            self._escribir(ruta_cuerpo, contenido)
+        entrada = {
+            'url': url,
+            'hash': hash_cuerpo,
+            'etag': etag,
+            'last_modified': last_modified,
+            'fecha': time.time(),
+        }
+        self._escribir(self._ruta_entrada(url), json.dumps(entrada).encode('utf-8'))
+        return entrada
+
+    def revalidada(self, entrada):
+        """Marca una entrada como confirmada por el servidor (respuesta 304)"""
+        entrada = dict(entrada, fecha=time.time())
+        self._escribir(self._ruta_entrada(entrada['url']), json.dumps(entrada).encode('utf-8'))
+        return entrada
+
+    def parseado(self, tipo, contenido, funcion):
+        """
+        Devuelve funcion(contenido), reutilizando el resultado si ese mismo
+        contenido ya se parseó antes. El resultado debe ser serializable en JSON.
+        """
+        ruta = self._ruta('parseados', tipo, hashlib.sha256(contenido).hexdigest())
+        try:
+            with open(ruta, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+        resultado = funcion(contenido)
+        self._escribir(ruta, json.dumps(resultado, ensure_ascii=False).encode('utf-8'))
+        return resultado
+
+    def _antiguo(self, ruta, limite):
+        try:
+            return os.path.getmtime(ruta) < limite
+        except OSError:
+            return False
+
+    def _borrar(self, ruta, borrados, clave):
+        try:
+            os.remove(ruta)
+        except OSError:
+            return
+        borrados[clave] += 1
+
+    def _ficheros(self, *partes):
+        """(nombre, ruta) de los ficheros de un subdirectorio (sin temporales)"""
+        directorio = self._ruta(*partes)
+        try:
+            nombres = os.listdir(directorio)
+        except OSError:
+            return []
+        return [(n, os.path.join(directorio, n)) for n in nombres if not n.endswith('.tmp')]
+
+    def limpiar(self, version_parseo=None, max_edad=None, margen=None):
+        """
+        Borra lo que ya no se usa de la caché.
+
+        - Entradas sin usar (ni descargadas ni revalidadas) en max_edad segundos
+        - Cuerpos que no referencia ninguna entrada
+        - Parseos de cuerpos que ya no están y, si se indica version_parseo,
+          los de tipos de otra versión (los tipos acaban en -v<versión>)
+
+        Returns:
+            Counter: Ficheros borrados de cada clase
+        """
+        max_edad = MAX_EDAD_ENTRADA if max_edad is None else max_edad
+        margen = MARGEN_LIMPIEZA if margen is None else margen
+        ahora = time.time()
+        limite = ahora - margen
+        borrados = Counter()
+
+        referenciados = set()
+        for _, ruta in self._ficheros('entradas'):
+            try:
+                with open(ruta, encoding='utf-8') as f:
+                    entrada = json.load(f)
+                hash_cuerpo, fecha = entrada['hash'], entrada['fecha']
+            except (OSError, ValueError, KeyError, TypeError):
+                if self._antiguo(ruta, limite):
+                    self._borrar(ruta, borrados, 'entradas')
+                continue
+            if ahora - fecha > max_edad:
+                self._borrar(ruta, borrados, 'entradas')
+            else:
+                referenciados.add(hash_cuerpo)
+
+        for nombre, ruta in self._ficheros('cuerpos'):
+            if nombre not in referenciados and self._antiguo(ruta, limite):
+                self._borrar(ruta, borrados, 'cuerpos')
+
+        sufijo = f'-v{version_parseo}' if version_parseo is not None else None
+        for tipo, _ in self._ficheros('parseados'):
+            obsoleto = sufijo is not None and not tipo.endswith(sufijo)
+            for nombre, ruta in self._ficheros('parseados', tipo):
+                if (obsoleto or nombre not in referenciados) and self._antiguo(ruta, limite):
+                    self._borrar(ruta, borrados, 'parseados')
+            try:
+                os.rmdir(self._ruta('parseados', tipo))
+            except OSError:
+                pass
+
+        return borrados
+
+
+def cache_http():
+    """Caché HTTP por defecto, o None si está desactivada"""
+    return CacheHttp() if USAR_CACHE_HTTP else None
+
+
+class Descargador:
+    """
+    Descarga páginas en paralelo.
+
+    Uso:
+        with Descargador() as descargador:
+            for url, html, error in descargador.descargar_varias(urls):
+                ...
+
+    Los parámetros que se dejan en None toman el valor de las constantes del
+    módulo en el momento de crear el descargador. Con `cache` las respuestas
+    se guardan y revalidan en esa CacheHttp; con `solo_cache` nunca se accede
+    a la red (útil para reproducir un scraping sin conexión).
+    """
+
+    def __init__(self, max_hilos=None, max_por_host=None, retardo=None,
+                 reintentos=None, espera_reintento=None, timeout=None,
+                 cache=None, solo_cache=False):
+        self.max_por_host = max_por_host or MAX_CONEXIONES_POR_HOST
+        self.retardo = RETARDO_CORTESIA if retardo is None else retardo
+        self.reintentos = REINTENTOS if reintentos is None else reintentos
+        self.espera_reintento = ESPERA_REINTENTO if espera_reintento is None else espera_reintento
+        self.timeout = timeout or TIMEOUT
+        self._pool = ThreadPoolExecutor(max_workers=max_hilos or MAX_HILOS, thread_name_prefix='descarga')
+        self._limitadores = {}
+        self._lock = threading.Lock()
+        self.cache = cache
+        self.solo_cache = solo_cache
+        self.estadisticas = Counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+        return False
+
+    def cerrar(self):
+        self._pool.shutdown(wait=True)
+
+    def _limitador(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._limitadores:
+                self._limitadores[host] = LimitadorHost(self.max_por_host, self.retardo)
+            return self._limitadores[host]
+
+    def _contar(self, clave):
+        with self._lock:
+            self.estadisticas[clave] += 1
+
+    def _pedir(self, url, entrada=None):
+        """
+        Hace la petición HTTP. Si hay entrada cacheada la pide condicionalmente
+        y devuelve (None, cabeceras) cuando el servidor responde 304.
+        """
+        cabeceras = {'User-Agent': USER_AGENT}
+        if entrada:
+            if entrada.get('etag'):
+                cabeceras['If-None-Match'] = entrada['etag']
+            if entrada.get('last_modified'):
+                cabeceras['If-Modified-Since'] = entrada['last_modified']
+
+        req = urllib.request.Request(url, headers=cabeceras)
+        with self._limitador(url):
+            try:
+                with urllib.request.urlopen(req, timeout=self.timeout) as f:
+                    return f.read(), f.headers
+            except urllib.error.HTTPError as e:
+                if e.code == 304 and entrada:
+                    return None, e.headers
+                raise
+
+    def descargar(self, url, tipo=None):
+        """
+        Descarga una URL reintentando los errores transitorios.
+
+        Args:
+            url: URL a descargar
+            tipo: Tipo de página ('listado', 'detalle'); decide el TTL en caché
+        """
+        entrada = self.cache.entrada(url) if self.cache else None
+        if entrada and (self.solo_cache or self.cache.vigente(entrada, tipo)):
+            self._contar('cache')
+            return self.cache.cuerpo(entrada)
+        if self.solo_cache:
+            raise LookupError(f"{url} no está en la caché")
+
+        for intento in range(self.reintentos + 1):
+            try:
+                contenido, cabeceras = self._pedir(url, entrada)
+            except urllib.error.HTTPError as e:
+                if e.code not in CODIGOS_TRANSITORIOS or intento == self.reintentos:
+                    raise
+            except (urllib.error.URLError, TimeoutError, ConnectionError):
+                if intento == self.reintentos:
+                    raise
+            else:
+                if contenido is None:
+                    self._contar('revalidadas')
+                    self.cache.revalidada(entrada)
+                    return self.cache.cuerpo(entrada)
+                self._contar('descargadas')
+                if self.cache:
+                    self.cache.guardar(url, contenido, cabeceras.get('ETag'), cabeceras.get('Last-Modified'))
+                return contenido
+            time.sleep(self.espera_reintento * (2 ** intento))
+
+    def parsear(self, tipo, contenido, funcion):
+        """Aplica funcion(contenido) reutilizando el resultado cacheado si lo hay"""
+        if self.cache:
+            return self.cache.parseado(tipo, contenido, funcion)
+        return funcion(contenido)
+
+    def _descargar_seguro(self, url, tipo=None):
+        try:
+            return url, self.descargar(url, tipo), None
+        except Exception as e:
+            return url, None, e
+
+    def descargar_varias(self, urls, tipo=None, ventana=None):
+        """
+        Descarga varias URLs en paralelo.
+
+        Genera tuplas (url, contenido, error) en el mismo orden que `urls`;
+        contenido es None si la descarga falló después de los reintentos.
+        `urls` puede ser un generador: como mucho hay `ventana` descargas
+        pendientes de consumir a la vez (VENTANA_DESCARGAS por defecto).
+        """
+        ventana = ventana or VENTANA_DESCARGAS
+        pendientes = deque()
+        for url in urls:
+            pendientes.append(self._pool.submit(self._descargar_seguro, url, tipo))
+            if len(pendientes) >= ventana:
+                yield pendientes.popleft().result()
+        while pendientes:
+            yield pendientes.popleft().result()
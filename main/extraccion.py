@@ -0,0 +1,277 @@
+# extraccion.py
+"""
+Motor de extracción basado en lxml.
+
+Produce exactamente los mismos resultados que los parsers con BeautifulSoup
+de scraping.py (parsear_listado_quelibroleo, parsear_listado_lecturalia y
+parsear_detalle_libro), pero sin construir el árbol de BeautifulSoup: usa el
+árbol de lxml directamente con expresiones XPath precompiladas, que solo
+visitan los bloques que interesan (div.item, div.profile__data,
+div.profile__text) e ignoran publicidad y navegación.
+"""
+import re
+from bs4 import UnicodeDammit
+from lxml import etree
+from .generos import normalizar_genero_quelibroleo
+
+
+def _clase(nombre):
+    """Condición XPath equivalente a class_=nombre de BeautifulSoup"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {nombre} ')"
+
+
+# XPath precompilados
+
+# QueLibroLeo: listado
+XP_ITEMS = etree.XPath(f"//div[{_clase('item')}]")
+XP_ENLACE = etree.XPath(f"(.//a[{_clase('left_side')}])[1]")
+XP_COL_INFO = etree.XPath(f"(.//div[{_clase('col-lg-8')}])[1]")
+XP_TEXTO = etree.XPath(f"(.//div[{_clase('text')}])[1]")
+XP_ESTADISTICAS = etree.XPath(f"(.//div[{_clase('estadisticas')}])[1]")
+XP_VOTOS = etree.XPath(f"(.//i[{_clase('numero_votos')}])[1]")
+
+# Lecturalia: listado
+XP_DATALIST = etree.XPath(f"(//div[{_clase('datalist--img')}])[1]")
+XP_COVER = etree.XPath(f"(.//div[{_clase('cover')}])[1]")
+
+# Lecturalia: detalle
+XP_PROFILE_DATA = etree.XPath(f"(//div[{_clase('profile__data')}])[1]")
+XP_PROFILE_TEXT = etree.XPath(f"(//div[{_clase('profile__text')}])[1]")
+
+RE_NOTA = re.compile(r'(\d+(?:[.,]\d+)?)\s*/\s*10\s*\((\d+)\s*votos?\)')
+
+# Etiquetas cuyo texto BeautifulSoup no incluye en get_text()
+ETIQUETAS_SIN_TEXTO = {'script', 'style', 'template'}
+
+
+def _arbol(html):
+    """Construye el árbol lxml decodificando igual que BeautifulSoup"""
+    if isinstance(html, bytes):
+        html = UnicodeDammit(html, is_html=True).unicode_markup
+    return etree.HTML(html, etree.HTMLParser())
+
+
+def _primero(xpath, elemento):
+    resultado = xpath(elemento)
+    return resultado[0] if resultado else None
+
+
+def _buscar(elemento, etiqueta):
+    """Primer descendiente con esa etiqueta (como Tag.find)"""
+    return next(elemento.iterdescendants(etiqueta), None)
+
+
+def _textos(elemento, excluir=None):
+    """
+    Cadenas de texto del subárbol en el orden de BeautifulSoup, sin
+    comentarios ni scripts. Los subárboles para los que excluir() es True se
+    omiten, pero no el texto que les sigue (como hace decompose()).
+    """
+    if elemento.text:
+        yield elemento.text
+    for hijo in elemento:
+        if isinstance(hijo.tag, str) and hijo.tag not in ETIQUETAS_SIN_TEXTO:
+            if excluir is None or not excluir(hijo):
+                yield from _textos(hijo, excluir)
+        if hijo.tail:
+            yield hijo.tail
+
+
+def _texto(elemento, separador='', strip=False, excluir=None):
+    """Equivalente a Tag.get_text(separator, strip)"""
+    textos = _textos(elemento, excluir)
+    if strip:
+        textos = (t.strip() for t in textos)
+        textos = (t for t in textos if t)
+    return separador.join(textos)
+
+
+def _clases(elemento):
+    return elemento.get('class', '').split()
+
+
+def parsear_listado_quelibroleo(html, genero):
+    """Extrae los libros de una página de listado de QueLibroLeo"""
+    lista = []
+    raiz = _arbol(html)
+    if raiz is None:
+        return lista
+
+    for item in XP_ITEMS(raiz):
+        try:
+            # URL del libro
+            enlace = _primero(XP_ENLACE, item)
+            if enlace is None:
+                continue
+            url_libro = enlace.get('href', '')
+
+            # Portada: img dentro de a.left_side
+            img_tag = _buscar(enlace, 'img')
+            portada = img_tag.get('src', '') if img_tag is not None else ''
+
+            # Título: div.col-lg-8 a span b
+            col_info = _primero(XP_COL_INFO, item)
+            if col_info is None:
+                continue
+
+            titulo_tag = _buscar(col_info, 'b')
+            titulo = _texto(titulo_tag, strip=True) if titulo_tag is not None else ''
+
+            # Autor: div.col-lg-8 small a
+            autor_tag = _buscar(col_info, 'small')
+            if autor_tag is not None:
+                autor_link = _buscar(autor_tag, 'a')
+                autor = _texto(autor_link if autor_link is not None else autor_tag, strip=True)
+            else:
+                autor = ''
+
+            # Sinopsis: div.tab-pane div.text p
+            sinopsis = ''
+            text_div = _primero(XP_TEXTO, item)
+            if text_div is not None:
+                p_tag = _buscar(text_div, 'p')
+                if p_tag is not None:
+                    sinopsis = _texto(p_tag, strip=True)
+                    # Limpiar el enlace de "seguir leyendo"
+                    if sinopsis:
+                        sinopsis = sinopsis.split('...')[0] + '...' if '...' in sinopsis else sinopsis
+            if not sinopsis:
+                sinopsis = 'No disponible'
+
+            # Estadísticas: div.estadisticas
+            estadisticas = _primero(XP_ESTADISTICAS, item)
+            valoracion = 0.0
+            num_votos = 0
+
+            if estadisticas is not None:
+                # Nota media: span
+                nota_span = _buscar(estadisticas, 'span')
+                if nota_span is not None:
+                    try:
+                        valoracion = float(_texto(nota_span, strip=True).replace(',', '.'))
+                    except ValueError:
+                        pass
+
+                # Número de votos: i.numero_votos a
+                votos_tag = _primero(XP_VOTOS, estadisticas)
+                if votos_tag is not None:
+                    votos_text = _texto(votos_tag, strip=True)
+                    num_votos = int(''.join(filter(str.isdigit, votos_text)))
+
+            lista.append({
+                'titulo': titulo,
+                'autor': autor,
+                'genero': normalizar_genero_quelibroleo(genero),
+                'sinopsis': sinopsis,
+                'valoracion': valoracion,
+                'num_votos': num_votos,
+                'url': url_libro,
+                'portada': portada,
+                'fuente': 'quelibroleo'
+            })
+
+        except Exception as e:
+            print(f"    Error extrayendo libro: {e}")
+            continue
+
+    return lista
+
+
+def parsear_listado_lecturalia(html):
+    """
+    Extrae los libros de una página de listado de Lecturalia.
+
+    Retorna None si la página no contiene la lista de libros.
+    """
+    from .scraping import URL_LECTURALIA
+
+    raiz = _arbol(html)
+    datalist = _primero(XP_DATALIST, raiz) if raiz is not None else None
+    if datalist is None:
+        return None
+
+    lista = []
+    for li in datalist.iterdescendants('li'):
+        try:
+            enlaces = list(li.iterdescendants('a'))
+            if len(enlaces) < 2:
+                continue
+
+            # Portada: div.cover img
+            portada = ''
+            cover_div = _primero(XP_COVER, li)
+            if cover_div is not None:
+                img_tag = _buscar(cover_div, 'img')
+                if img_tag is not None:
+                    portada = img_tag.get('src', '')
+
+            # Primer enlace: título y URL del libro
+            titulo = _texto(enlaces[0], strip=True)
+            url_libro = enlaces[0].get('href', '')
+            if not url_libro.startswith('http'):
+                url_libro = URL_LECTURALIA + url_libro
+
+            # Segundo enlace: autor
+            autor = _texto(enlaces[1], strip=True)
+
+            lista.append({
+                'titulo': titulo,
+                'autor': autor,
+                'url': url_libro,
+                'portada': portada,
+            })
+
+        except Exception as e:
+            print(f"  Error extrayendo libro: {e}")
+            continue
+
+    return lista
+
+
+def _fuera_de_sinopsis(elemento):
+    """Elementos que parsear_detalle_libro elimina del texto de la sinopsis"""
+    return elemento.tag in ('h2', 'div') or (elemento.tag == 'p' and 'participate' in _clases(elemento))
+
+
+def parsear_detalle_libro(html):
+    """Extrae género, sinopsis, valoración y votos de la página de un libro de Lecturalia"""
+    detalle = {
+        'genero': 'Sin género',
+        'sinopsis': '',
+        'valoracion': 0.0,
+        'num_votos': 0
+    }
+
+    raiz = _arbol(html)
+    if raiz is None:
+        detalle['sinopsis'] = 'No disponible'
+        return detalle
+
+    # Ficha del libro (ul dentro de profile__data)
+    profile_data = _primero(XP_PROFILE_DATA, raiz)
+    if profile_data is not None:
+        for item in profile_data.iterdescendants('li'):
+            texto = _texto(item)
+
+            if 'Temas:' in texto:
+                enlace_genero = _buscar(item, 'a')
+                if enlace_genero is not None:
+                    detalle['genero'] = _texto(enlace_genero, strip=True)
+
+            if 'Nota media:' in texto:
+                match = RE_NOTA.search(texto)
+                if match:
+                    detalle['valoracion'] = float(match.group(1).replace(',', '.'))
+                    detalle['num_votos'] = int(match.group(2))
+
+    # Sinopsis: div.profile__text div.text sin títulos, publicidad ni participantes
+    profile_text = _primero(XP_PROFILE_TEXT, raiz)
+    if profile_text is not None:
+        text_div = _primero(XP_TEXTO, profile_text)
+        if text_div is not None:
+            sinopsis = _texto(text_div, separador=' ', strip=True, excluir=_fuera_de_sinopsis)
+            detalle['sinopsis'] = sinopsis.strip() if sinopsis.strip() else 'No disponible'
+    else:
+        detalle['sinopsis'] = 'No disponible'
+
+    return detalle
@@ -0,0 +1,181 @@
+# importacion.py
+"""
+Importación del historial de lectura desde un CSV (export de Goodreads o
+un CSV propio con columnas titulo, autor, estado, valoracion).
+
+El fichero se lee fila a fila con csv.DictReader, así que no se carga
+entero en memoria. Cada fila se busca en un índice del catálogo por título
+normalizado (el mismo normalizar_titulo() que usa el scraping para quitar
+duplicados), de modo que emparejar una fila es una consulta a un dict y no
+un recorrido del catálogo. Las filas encontradas se añaden por lotes con
+libreria.agregar_libros().
+"""
+import csv
+import re
+import threading
+
+from main import libreria
+from main.scraping import normalizar_titulo
+from main.whoosh_utils import obtener_catalogo
+
+TAM_LOTE = 500
+
+# Ejemplos de filas no encontradas que se guardan en el resumen
+MAX_NO_ENCONTRADOS = 20
+
+# Nombres de columna aceptados para cada campo (en minúsculas)
+COLUMNAS = {
+    'titulo': ('titulo', 'título', 'title'),
+    'autor': ('autor', 'author', 'author l-f'),
+    'estado': ('estado', 'exclusive shelf'),
+    'valoracion': ('valoracion', 'valoración', 'my rating'),
+}
+
+# Estantes de Goodreads y estados propios que cuentan como leído
+ESTADOS_LEIDO = ('leido', 'leído', 'read')
+
+
+def _palabras_autor(autor):
+    """Palabras significativas del autor ('Rothfuss, Patrick' y 'Patrick Rothfuss' coinciden)"""
+    return frozenset(p for p in normalizar_titulo(autor).split() if len(p) > 2)
+
+
+def _sin_serie(titulo):
+    """Quita el sufijo de serie de Goodreads: 'Dune (Dune, #1)' -> 'Dune'"""
+    return re.sub(r'\s*\([^)]*#\s*\d+[^)]*\)\s*$', '', titulo)
+
+
+_indice = None
+_indice_lock = threading.Lock()
+
+
+def indice_catalogo():
+    """
+    Índice título normalizado -> ((palabras del autor, libro), ...) del catálogo.
+
+    Se construye una vez por generación del índice Whoosh, como el catálogo.
+    """
+    global _indice
+
+    catalogo = obtener_catalogo()
+    indice = _indice
+    if indice is not None and indice[0] == catalogo.generacion:
+        return indice[1]
+
+    with _indice_lock:
+        if _indice is None or _indice[0] != catalogo.generacion:
+            por_titulo = {}
+            for libro in catalogo.libros:
+                titulo = normalizar_titulo(libro.get('titulo', ''))
+                if titulo:
+                    por_titulo.setdefault(titulo, []).append((_palabras_autor(libro.get('autor', '')), libro))
+            _indice = (catalogo.generacion, {t: tuple(c) for t, c in por_titulo.items()})
+        return _indice[1]
+
+
+def emparejar(titulo, autor, indice=None):
+    """
+    Busca un libro del catálogo por título y autor.
+
+    El título tiene que coincidir (normalizado, con o sin el sufijo de serie
+    de Goodreads). Si el CSV trae autor, además tiene que compartir alguna
+    palabra con el del catálogo; así dos libros con el mismo título se
+    distinguen por autor.
+
+    Returns:
+        dict: El libro del catálogo, o None si no se encuentra
+    """
+    if indice is None:
+        indice = indice_catalogo()
+
+    candidatos = indice.get(normalizar_titulo(titulo))
+    if candidatos is None:
+        candidatos = indice.get(normalizar_titulo(_sin_serie(titulo)), ())
+
+    palabras = _palabras_autor(autor or '')
+    for palabras_libro, libro in candidatos:
+        if not palabras or palabras & palabras_libro:
+            return libro
+    return None
+
+
+def _columnas(cabecera):
+    """Columna del CSV que corresponde a cada campo"""
+    disponibles = {c.strip().lower(): c for c in cabecera or ()}
+    columnas = {}
+    for campo, nombres in COLUMNAS.items():
+        for nombre in nombres:
+            if nombre in disponibles:
+                columnas[campo] = disponibles[nombre]
+                break
+    if 'titulo' not in columnas:
+        raise ValueError("El CSV no tiene columna de título ('titulo' o 'Title')")
+    return columnas
+
+
+def _valoracion(valor):
+    """Valoración entre 1 y 5, o None (Goodreads usa 0 para 'sin valorar')"""
+    try:
+        valoracion = float(str(valor).replace(',', '.'))
+    except ValueError:
+        return None
+    if not valoracion > 0:
+        return None
+    return max(round(min(valoracion, 5.0) * 2) / 2, 1.0)
+
+
+def _campo(fila, columnas, campo):
+    valor = fila.get(columnas[campo]) if campo in columnas else None
+    return valor.strip() if isinstance(valor, str) else ''
+
+
+def importar_csv(usuario_id, fichero, tam_lote=TAM_LOTE):
+    """
+    Importa a la librería de un usuario los libros de un CSV.
+
+    Sin columna de estado, las filas con valoración se consideran leídas.
+
+    Args:
+        fichero: fichero de texto abierto (o cualquier iterable de líneas)
+        tam_lote: filas encontradas que se añaden en cada lote
+
+    Returns:
+        dict: filas, encontrados, añadidos y ejemplos de no_encontrados
+
+    Raises:
+        ValueError: Si el CSV no tiene columna de título
+        csv.Error: Si el CSV está mal formado (p. ej. un campo demasiado largo)
+    """
+    lector = csv.DictReader(fichero)
+    columnas = _columnas(lector.fieldnames)
+    indice = indice_catalogo()
+    resumen = {'filas': 0, 'encontrados': 0, 'añadidos': 0, 'no_encontrados': []}
+
+    lote = []
+    for fila in lector:
+        resumen['filas'] += 1
+        titulo = _campo(fila, columnas, 'titulo')
+        libro = emparejar(titulo, _campo(fila, columnas, 'autor'), indice) if titulo else None
+        if libro is None:
+            if titulo and len(resumen['no_encontrados']) < MAX_NO_ENCONTRADOS:
+                resumen['no_encontrados'].append(titulo)
+            continue
+
+        resumen['encontrados'] += 1
+        valoracion = _valoracion(_campo(fila, columnas, 'valoracion'))
+        if 'estado' in columnas:
+            leido = _campo(fila, columnas, 'estado').lower() in ESTADOS_LEIDO
+        else:
+            leido = valoracion is not None
+        lote.append(dict(
+            libro,
+            estado='leido' if leido else 'por_leer',
+            valoracion=valoracion if leido else None,
+        ))
+        if len(lote) >= tam_lote:
+            resumen['añadidos'] += libreria.agregar_libros(usuario_id, lote)
+            lote = []
+
+    if lote:
+        resumen['añadidos'] += libreria.agregar_libros(usuario_id, lote)
+    return resumen
@@ -0,0 +1,140 @@
+# libreria.py
+"""
+Operaciones en bloque sobre la librería de un usuario.
+
+Cada operación se hace con unas pocas consultas (bulk_create, bulk_update,
+un delete() por queryset) dentro de una transacción. bulk_create y
+bulk_update no disparan las señales de LibroUsuario (y las de delete() se
+desactivan para no actualizar el perfil fila a fila), así que al final se
+reconstruye el perfil del usuario una sola vez y se invalidan sus
+recomendaciones cacheadas.
+"""
+import math
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.utils import timezone
+
+from main.models import Libro, LibroUsuario
+from main.recommender import invalidar_recomendaciones, reconstruir_perfil
+from main.signals import sin_actualizar_perfil
+from main.whoosh_utils import obtener_catalogo
+
+TAM_LOTE = 500
+
+# Rango de LibroUsuario.valoracion (bulk_create y bulk_update no pasan los validadores)
+VALORACION_MIN = 1.0
+VALORACION_MAX = 5.0
+
+
+def _comprobar_valoracion(valoracion):
+    if valoracion is not None and not (
+            math.isfinite(valoracion) and VALORACION_MIN <= valoracion <= VALORACION_MAX):
+        raise ValueError(f"Valoración fuera de rango ({VALORACION_MIN:g} - {VALORACION_MAX:g}): {valoracion}")
+
+
+@contextmanager
+def _en_bloque(usuario_id):
+    """Transacción de una operación en bloque, con el perfil reconstruido al final"""
+    with sin_actualizar_perfil(), transaction.atomic():
+        yield
+        reconstruir_perfil(usuario_id)
+    invalidar_recomendaciones(usuario_id)
+
+
+def agregar_libros(usuario_id, libros):
+    """
+    Añade varios libros a la librería de un usuario.
+
+    Args:
+        libros: dicts con los campos del libro (Libro.objects.CAMPOS_CATALOGO)
+            y, opcionalmente, 'estado' y 'valoracion' del usuario para la fila
+            de la librería (por defecto 'por_leer' sin valoración). Los dicts
+            del catálogo traen en 'valoracion' la media del libro, así que no
+            se pasan tal cual
+
+    Returns:
+        int: Libros añadidos (los que ya estaban en la librería no cuentan)
+
+    Raises:
+        ValueError: Si alguna valoración no está entre 1 y 5
+    """
+    por_clave = {}
+    filas = {}
+    for datos in libros:
+        libro = Libro.objects.desde_datos(datos)
+        if not libro.titulo or libro.clave in filas:
+            continue
+        por_clave[libro.clave] = libro
+        estado = datos.get('estado') or 'por_leer'
+        _comprobar_valoracion(datos.get('valoracion'))
+        filas[libro.clave] = LibroUsuario(
+            usuario_id=usuario_id,
+            estado=estado,
+            valoracion=datos.get('valoracion'),
+            fecha_leido=timezone.now() if estado == 'leido' else None,
+        )
+    if not filas:
+        return 0
+
+    with _en_bloque(usuario_id):
+        Libro.objects.bulk_create(por_clave.values(), ignore_conflicts=True, batch_size=TAM_LOTE)
+        ids = dict(Libro.objects.filter(clave__in=list(por_clave)).order_by().values_list('clave', 'id'))
+        ya_estaban = set(LibroUsuario.objects.filter(usuario_id=usuario_id, libro_id__in=ids.values())
+                         .order_by().values_list('libro_id', flat=True))
+
+        nuevas = []
+        for clave, fila in filas.items():
+            fila.libro_id = ids[clave]
+            if fila.libro_id not in ya_estaban:
+                nuevas.append(fila)
+        LibroUsuario.objects.bulk_create(nuevas, ignore_conflicts=True, batch_size=TAM_LOTE)
+
+    return len(nuevas)
+
+
+def agregar_por_url(usuario_id, urls):
+    """Añade los libros del catálogo con esas urls (las que no están en el índice se ignoran)"""
+    por_url = obtener_catalogo().por_url
+    campos = Libro.objects.CAMPOS_CATALOGO
+    return agregar_libros(usuario_id, [
+        {campo: por_url[url].get(campo) for campo in campos}
+        for url in urls if url in por_url
+    ])
+
+
+def marcar_leidos(usuario_id, valoraciones):
+    """
+    Marca varios libros de la librería como leídos.
+
+    Args:
+        valoraciones: dict id de LibroUsuario -> valoración (None la deja como está)
+
+    Returns:
+        int: Libros marcados
+
+    Raises:
+        ValueError: Si alguna valoración no está entre 1 y 5
+    """
+    for valoracion in valoraciones.values():
+        _comprobar_valoracion(valoracion)
+    ahora = timezone.now()
+    with _en_bloque(usuario_id):
+        filas = list(LibroUsuario.objects.select_for_update()
+                     .filter(usuario_id=usuario_id, id__in=list(valoraciones)))
+        for fila in filas:
+            fila.estado = 'leido'
+            fila.fecha_leido = ahora
+            if valoraciones[fila.id] is not None:
+                fila.valoracion = valoraciones[fila.id]
+        LibroUsuario.objects.bulk_update(filas, ['estado', 'fecha_leido', 'valoracion'], batch_size=TAM_LOTE)
+
+    return len(filas)
+
+
+def eliminar_libros(usuario_id, ids):
+    """Quita de la librería los LibroUsuario indicados. Retorna cuántos"""
+    with _en_bloque(usuario_id):
+        eliminados, _ = LibroUsuario.objects.filter(usuario_id=usuario_id, id__in=list(ids)).delete()
+
+    return eliminados
@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import time
+from django.core.management.base import BaseCommand, CommandError
+from main import whoosh_utils
+
+
+class Command(BaseCommand):
+    help = ('Mide el tiempo de reconstruir el índice con distintas configuraciones del writer '
+            '(un proceso frente a varios, con y sin multisegmento). No toca el índice en uso')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--libros',
+            type=int,
+            default=20000,
+            help='Libros a indexar: se repite el catálogo actual hasta llegar a N (por defecto: 20000)'
+        )
+        parser.add_argument(
+            '--procs',
+            type=int,
+            nargs='+',
+            default=[1, 2, 4],
+            help='Número de procesos a probar (por defecto: 1 2 4)'
+        )
+        parser.add_argument(
+            '--limitmb',
+            type=int,
+            default=whoosh_utils.LIMITMB_RECONSTRUCCION,
+            help=f'Memoria por proceso del writer en MB (por defecto: {whoosh_utils.LIMITMB_RECONSTRUCCION})'
+        )
+        parser.add_argument(
+            '--repeticiones',
+            type=int,
+            default=1,
+            help='Veces que se repite cada configuración; se muestra la mejor (por defecto: 1)'
+        )
+
+    def handle(self, *args, **options):
+        catalogo = whoosh_utils.obtener_todos_libros()
+        if not catalogo:
+            raise CommandError('El índice está vacío: ejecuta el scraping antes del benchmark')
+
+        # El catálogo se repite con urls distintas hasta tener el número de libros pedido
+        libros = [
+            dict(catalogo[i % len(catalogo)], url=f"{catalogo[i % len(catalogo)]['url']}#{i}")
+            for i in range(options['libros'])
+        ]
+
+        configuraciones = []
+        for procs in options['procs']:
+            configuraciones.append((procs, False))
+            if procs > 1:
+                configuraciones.append((procs, True))
+
+        self.stdout.write(f'Indexando {len(libros)} libros (CPU disponibles: {os.cpu_count()})')
+        index_dir = whoosh_utils.INDEX_DIR
+        directorio = tempfile.mkdtemp(prefix='bookwise-benchmark-')
+        resultados = []
+        try:
+            whoosh_utils.cerrar_searchers()
+            whoosh_utils.INDEX_DIR = directorio
+            for procs, multisegment in configuraciones:
+                tiempos = []
+                for _ in range(options['repeticiones']):
+                    inicio = time.perf_counter()
+                    ix = whoosh_utils.indexar_libros(libros, procs=procs, limitmb=options['limitmb'],
+                                                     multisegment=multisegment)
+                    tiempos.append(time.perf_counter() - inicio)
+                    if ix.doc_count() != len(libros):
+                        raise CommandError(f'El índice tiene {ix.doc_count()} libros, se esperaban {len(libros)}')
+                resultados.append((procs, multisegment, min(tiempos)))
+        finally:
+            whoosh_utils.cerrar_searchers()
+            whoosh_utils.INDEX_DIR = index_dir
+            whoosh_utils.invalidar_catalogo()
+            shutil.rmtree(directorio, ignore_errors=True)
+
+        base = resultados[0][2]
+        for procs, multisegment, segundos in resultados:
+            modo = 'multisegmento' if multisegment else 'un segmento'
+            self.stdout.write(f'  procs={procs:<3} {modo:<14} {segundos:7.2f} s  ({base / segundos:.2f}x)')
+
+        procs, multisegment, _ = min(resultados, key=lambda r: r[2])
+        self.stdout.write(self.style.SUCCESS(
+            f'Más rápido: BOOKWISE_WHOOSH_PROCS = {procs}, BOOKWISE_WHOOSH_MULTISEGMENT = {multisegment}'
+        ))
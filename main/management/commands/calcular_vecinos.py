@@ -0,0 +1,32 @@
+import time
+from django.core.management.base import BaseCommand
+from main import colaborativo
+
+
+class Command(BaseCommand):
+    help = ('Precalcula los libros más parecidos a cada uno según las valoraciones de los usuarios '
+            '(filtrado colaborativo ítem-ítem del modo de recomendación "mixto")')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--k',
+            type=int,
+            default=colaborativo.NUM_VECINOS,
+            help=f'Vecinos a guardar por libro (por defecto: {colaborativo.NUM_VECINOS})'
+        )
+        parser.add_argument(
+            '--min-comunes',
+            type=int,
+            default=colaborativo.MIN_LECTORES_COMUNES,
+            help=f'Lectores en común mínimos entre dos libros (por defecto: {colaborativo.MIN_LECTORES_COMUNES})'
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        total = colaborativo.calcular_vecinos(k=options['k'], min_comunes=options['min_comunes'])
+        # No hace falta invalidar nada: las recomendaciones cacheadas y las
+        # precalculadas guardan la versión de los vecinos con que se hicieron
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} pares de libros parecidos guardados en {time.perf_counter() - inicio:.1f} s'
+        ))
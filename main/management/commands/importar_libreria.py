@@ -0,0 +1,37 @@
+import csv
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from main.importacion import importar_csv
+
+
+class Command(BaseCommand):
+    help = ('Importa a la librería de un usuario los libros de un CSV '
+            '(export de Goodreads o columnas titulo, autor, estado, valoracion)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('usuario', help='Nombre del usuario')
+        parser.add_argument('fichero', help='Ruta del CSV')
+        parser.add_argument(
+            '--encoding',
+            default='utf-8-sig',
+            help='Codificación del CSV (por defecto: utf-8-sig)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            usuario = User.objects.get(username=options['usuario'])
+        except User.DoesNotExist:
+            raise CommandError(f"No existe el usuario '{options['usuario']}'")
+
+        try:
+            with open(options['fichero'], encoding=options['encoding'], newline='') as fichero:
+                resumen = importar_csv(usuario.id, fichero)
+        except (OSError, csv.Error, UnicodeDecodeError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for titulo in resumen['no_encontrados']:
+            self.stdout.write(f'  No encontrado: {titulo}')
+        self.stdout.write(self.style.SUCCESS(
+            f"{resumen['filas']} filas, {resumen['encontrados']} en el catálogo, "
+            f"{resumen['añadidos']} libros añadidos a la librería de {usuario.username}"
+        ))
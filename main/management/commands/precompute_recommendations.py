@@ -0,0 +1,52 @@
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from main.precalculo import N_PRECALCULADAS, TAM_LOTE_USUARIOS, precalcular_recomendaciones
+
+
+class Command(BaseCommand):
+    help = 'Precalcula las recomendaciones de todos los usuarios (o de los activos recientemente) en paralelo'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--activos-dias',
+            type=int,
+            default=None,
+            help='Solo usuarios que han iniciado sesión en los últimos N días'
+        )
+        parser.add_argument(
+            '--n',
+            type=int,
+            default=N_PRECALCULADAS,
+            help=f'Recomendaciones a guardar por usuario (por defecto: {N_PRECALCULADAS})'
+        )
+        parser.add_argument(
+            '--procesos',
+            type=int,
+            default=None,
+            help='Procesos en paralelo (por defecto: uno por CPU)'
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=TAM_LOTE_USUARIOS,
+            help=f'Usuarios por lote de trabajo (por defecto: {TAM_LOTE_USUARIOS})'
+        )
+
+    def handle(self, *args, **options):
+        usuarios = User.objects.filter(is_active=True)
+        if options['activos_dias'] is not None:
+            desde = timezone.now() - timedelta(days=options['activos_dias'])
+            usuarios = usuarios.filter(last_login__gte=desde)
+        usuario_ids = list(usuarios.order_by('pk').values_list('pk', flat=True))
+
+        self.stdout.write(f'Precalculando recomendaciones de {len(usuario_ids)} usuario(s)...')
+        total = precalcular_recomendaciones(
+            usuario_ids,
+            n=options['n'],
+            procesos=options['procesos'],
+            tam_lote=options['lote'],
+            al_terminar_lote=lambda hechos: self.stdout.write(f'  {hechos}/{len(usuario_ids)}')
+        )
+        self.stdout.write(self.style.SUCCESS(f'{total} usuario(s) con recomendaciones precalculadas'))
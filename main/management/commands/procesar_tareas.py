@@ -0,0 +1,30 @@
+import time
+from django.core.management.base import BaseCommand
+from main.tareas import procesar_pendientes
+
+
+class Command(BaseCommand):
+    help = 'Worker que ejecuta las tareas de scraping encoladas desde la administración'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Procesa las tareas pendientes y termina en lugar de quedarse esperando'
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=5.0,
+            help='Segundos entre consultas a la cola (por defecto: 5)'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Worker de tareas iniciado')
+        while True:
+            procesadas = procesar_pendientes()
+            if procesadas:
+                self.stdout.write(self.style.SUCCESS(f'{procesadas} tarea(s) procesada(s)'))
+            if options['una_vez']:
+                return
+            time.sleep(options['intervalo'])
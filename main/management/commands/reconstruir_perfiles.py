@@ -0,0 +1,27 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from main.recommender import invalidar_recomendaciones, reconstruir_perfil
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde cero los perfiles de recomendación a partir de las librerías de los usuarios'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usuarios',
+            nargs='*',
+            help='Nombres de usuario a reconstruir (por defecto, todos)'
+        )
+
+    def handle(self, *args, **options):
+        usuarios = User.objects.order_by('pk')
+        if options['usuarios']:
+            usuarios = usuarios.filter(username__in=options['usuarios'])
+
+        total = 0
+        for usuario_id in usuarios.values_list('pk', flat=True).iterator():
+            reconstruir_perfil(usuario_id)
+            invalidar_recomendaciones(usuario_id)
+            total += 1
+
+        self.stdout.write(self.style.SUCCESS(f'{total} perfil(es) reconstruido(s)'))
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0002_librousuario'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TareaScraping',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_curso', 'En curso'), ('completada', 'Completada'), ('error', 'Error')], default='pendiente', max_length=20, verbose_name='Estado')),
+                ('progreso', models.PositiveSmallIntegerField(default=0, verbose_name='Progreso (%)')),
+                ('mensaje', models.CharField(blank=True, max_length=300, verbose_name='Mensaje')),
+                ('resultado', models.JSONField(blank=True, default=dict, verbose_name='Resultado')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+                ('solicitada_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tareas_scraping', to=settings.AUTH_USER_MODEL, verbose_name='Solicitada por')),
+            ],
+            options={
+                'verbose_name': 'Tarea de scraping',
+                'verbose_name_plural': 'Tareas de scraping',
+                'ordering': ['-fecha_creacion'],
+                'indexes': [models.Index(fields=['estado', 'fecha_creacion'], name='main_tareas_estado_4dbb84_idx')],
+            },
+        ),
+    ]
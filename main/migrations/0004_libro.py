@@ -0,0 +1,224 @@
+import hashlib
+import os
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+CAMPOS_LIBRO = ('titulo', 'autor', 'portada', 'genero', 'sinopsis')
+
+
+def _clave_libro(url='', titulo=''):
+    # Copia de main.models.clave_libro en el momento de esta migración
+    if url:
+        base = f'url:{url}'
+    else:
+        base = 'titulo:' + ' '.join(titulo.lower().split())
+    return hashlib.sha1(base.encode('utf-8')).hexdigest()
+
+
+def _directorio_indice():
+    """
+    Directorio del índice Whoosh en uso, resuelto aquí para no depender de
+    main.whoosh_utils: con versiones, Index/ACTUAL tiene el nombre de la
+    carpeta vigente; sin él, el índice está en Index/ directamente.
+    """
+    raiz = os.path.join(settings.BASE_DIR, 'Index')
+    try:
+        with open(os.path.join(raiz, 'ACTUAL'), encoding='utf-8') as f:
+            version = f.read().strip()
+    except OSError:
+        version = ''
+    return os.path.join(raiz, version) if version else raiz
+
+
+def _catalogo_por_titulo():
+    """Libros del índice Whoosh por título en minúsculas (vacío si no hay índice)"""
+    from whoosh import index
+
+    directorio = _directorio_indice()
+    por_titulo = {}
+    try:
+        if not index.exists_in(directorio):
+            return {}
+        with index.open_dir(directorio).searcher() as searcher:
+            for campos in searcher.all_stored_fields():
+                titulo = (campos.get('titulo') or '').lower().strip()
+                if titulo:
+                    por_titulo.setdefault(titulo, dict(campos))
+    except Exception:
+        return {}
+    return por_titulo
+
+
+def enlazar_libros(apps, schema_editor):
+    """
+    Crea un Libro por cada título guardado en librerías y valoraciones y enlaza
+    las filas con él. Si el título está en el índice se usa su url y sus datos;
+    si no, los datos copiados en la fila y una clave basada en el título.
+    Si dos filas de un mismo usuario acaban en el mismo libro se conserva una.
+    """
+    Libro = apps.get_model('main', 'Libro')
+    LibroUsuario = apps.get_model('main', 'LibroUsuario')
+    Valoracion = apps.get_model('main', 'Valoracion')
+
+    if not LibroUsuario.objects.exists() and not Valoracion.objects.exists():
+        return
+
+    catalogo = _catalogo_por_titulo()
+    libros = {}
+
+    def libro_para(datos):
+        indexado = catalogo.get(datos['titulo'].lower().strip())
+        if indexado:
+            datos = {campo: indexado.get(campo) or '' for campo in CAMPOS_LIBRO + ('url',)}
+        clave = _clave_libro(datos.get('url', ''), datos['titulo'])
+        if clave not in libros:
+            campos = {campo: (datos.get(campo) or '')[:Libro._meta.get_field(campo).max_length or None]
+                      for campo in CAMPOS_LIBRO + ('url',)}
+            libros[clave], _ = Libro.objects.get_or_create(clave=clave, defaults=campos)
+        return libros[clave]
+
+    # Librerías: si hay duplicados se prefiere el libro leído y luego el más antiguo
+    enlazados = set()
+    filas = sorted(LibroUsuario.objects.all(), key=lambda f: (f.estado != 'leido', f.fecha_agregado, f.pk))
+    for fila in filas:
+        libro = libro_para({campo: getattr(fila, campo) for campo in CAMPOS_LIBRO})
+        if (fila.usuario_id, libro.pk) in enlazados:
+            fila.delete()
+            continue
+        enlazados.add((fila.usuario_id, libro.pk))
+        fila.libro = libro
+        fila.save(update_fields=['libro'])
+
+    # Valoraciones: si hay duplicados se conserva la más reciente
+    enlazados = set()
+    for fila in Valoracion.objects.order_by('-actualizado', '-pk'):
+        libro = libro_para({'titulo': fila.titulo_libro})
+        if (fila.usuario_id, libro.pk) in enlazados:
+            fila.delete()
+            continue
+        enlazados.add((fila.usuario_id, libro.pk))
+        fila.libro = libro
+        fila.save(update_fields=['libro'])
+
+
+def copiar_datos_libros(apps, schema_editor):
+    """Vuelve a copiar los datos del libro en cada fila (migración inversa)"""
+    LibroUsuario = apps.get_model('main', 'LibroUsuario')
+    Valoracion = apps.get_model('main', 'Valoracion')
+
+    for fila in LibroUsuario.objects.select_related('libro'):
+        for campo in CAMPOS_LIBRO:
+            setattr(fila, campo, getattr(fila.libro, campo))
+        fila.save(update_fields=list(CAMPOS_LIBRO))
+
+    for fila in Valoracion.objects.select_related('libro'):
+        fila.titulo_libro = fila.libro.titulo
+        fila.save(update_fields=['titulo_libro'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_tareascraping'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Libro',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=40, unique=True, verbose_name='Clave')),
+                ('url', models.URLField(blank=True, max_length=1000, verbose_name='URL')),
+                ('titulo', models.CharField(max_length=500, verbose_name='Título')),
+                ('autor', models.CharField(blank=True, max_length=300, verbose_name='Autor')),
+                ('portada', models.URLField(blank=True, max_length=1000, verbose_name='Portada')),
+                ('genero', models.CharField(blank=True, max_length=100, verbose_name='Género')),
+                ('sinopsis', models.TextField(blank=True, verbose_name='Sinopsis')),
+            ],
+            options={
+                'verbose_name': 'Libro',
+                'verbose_name_plural': 'Libros',
+                'ordering': ['titulo'],
+            },
+        ),
+        migrations.AddField(
+            model_name='librousuario',
+            name='libro',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='en_librerias', to='main.libro', verbose_name='Libro'),
+        ),
+        migrations.AddField(
+            model_name='valoracion',
+            name='libro',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='valoraciones', to='main.libro', verbose_name='Libro'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='librousuario',
+            unique_together=set(),
+        ),
+        migrations.AlterUniqueTogether(
+            name='valoracion',
+            unique_together=set(),
+        ),
+        migrations.RemoveIndex(
+            model_name='valoracion',
+            name='main_valora_titulo__12c6b0_idx',
+        ),
+        migrations.RunPython(enlazar_libros, copiar_datos_libros),
+        # Con valor por defecto para que la migración inversa pueda volver a crearlos
+        migrations.AlterField(
+            model_name='librousuario',
+            name='titulo',
+            field=models.CharField(default='', max_length=500, verbose_name='Título'),
+        ),
+        migrations.AlterField(
+            model_name='valoracion',
+            name='titulo_libro',
+            field=models.CharField(default='', max_length=500, verbose_name='Título del libro'),
+        ),
+        migrations.RemoveField(
+            model_name='librousuario',
+            name='titulo',
+        ),
+        migrations.RemoveField(
+            model_name='librousuario',
+            name='autor',
+        ),
+        migrations.RemoveField(
+            model_name='librousuario',
+            name='portada',
+        ),
+        migrations.RemoveField(
+            model_name='librousuario',
+            name='genero',
+        ),
+        migrations.RemoveField(
+            model_name='librousuario',
+            name='sinopsis',
+        ),
+        migrations.RemoveField(
+            model_name='valoracion',
+            name='titulo_libro',
+        ),
+        migrations.AlterField(
+            model_name='librousuario',
+            name='libro',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='en_librerias', to='main.libro', verbose_name='Libro'),
+        ),
+        migrations.AlterField(
+            model_name='valoracion',
+            name='libro',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='valoraciones', to='main.libro', verbose_name='Libro'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='librousuario',
+            unique_together={('usuario', 'libro')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='valoracion',
+            unique_together={('usuario', 'libro')},
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_libro'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PerfilUsuario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('generos', models.JSONField(blank=True, default=dict, verbose_name='Peso de cada género')),
+                ('autores', models.JSONField(blank=True, default=dict, verbose_name='Peso de cada autor')),
+                ('excluidos', models.JSONField(blank=True, default=list, verbose_name='Libros excluidos (ids)')),
+                ('num_libros', models.PositiveIntegerField(default=0, verbose_name='Libros que forman el perfil')),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('usuario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='perfil_recomendacion', to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+            options={
+                'verbose_name': 'Perfil de usuario',
+                'verbose_name_plural': 'Perfiles de usuarios',
+            },
+        ),
+    ]
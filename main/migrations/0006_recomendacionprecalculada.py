@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_perfilusuario'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecomendacionPrecalculada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('generacion', models.CharField(max_length=100, verbose_name='Generación del índice')),
+                ('perfil_actualizado', models.DateTimeField(verbose_name='Versión del perfil')),
+                ('n', models.PositiveSmallIntegerField(verbose_name='Número de recomendaciones')),
+                ('recomendaciones', models.JSONField(default=list, verbose_name='Recomendaciones')),
+                ('perfil_info', models.JSONField(default=dict, verbose_name='Información del perfil')),
+                ('fecha_calculo', models.DateTimeField(auto_now=True)),
+                ('usuario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='recomendaciones_precalculadas', to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+            options={
+                'verbose_name': 'Recomendaciones precalculadas',
+                'verbose_name_plural': 'Recomendaciones precalculadas',
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_recomendacionprecalculada'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VecinoLibro',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('similitud', models.FloatField(verbose_name='Similitud')),
+                ('libro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vecinos', to='main.libro', verbose_name='Libro')),
+                ('vecino', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main.libro', verbose_name='Libro parecido')),
+            ],
+            options={
+                'verbose_name': 'Vecino de libro',
+                'verbose_name_plural': 'Vecinos de libros',
+                'unique_together': {('libro', 'vecino')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_vecinolibro'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tareascraping',
+            name='latido',
+            field=models.DateTimeField(blank=True, help_text='Lo actualiza el worker con cada avance; si deja de hacerlo la tarea se da por abandonada', null=True, verbose_name='Último latido'),
+        ),
+    ]
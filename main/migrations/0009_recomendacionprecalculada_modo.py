@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_tareascraping_latido'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recomendacionprecalculada',
+            name='modo',
+            field=models.CharField(default='contenido', max_length=20, verbose_name='Modo de recomendación'),
+        ),
+    ]
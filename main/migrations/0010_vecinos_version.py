@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_recomendacionprecalculada_modo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recomendacionprecalculada',
+            name='version_vecinos',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Versión de los vecinos'),
+        ),
+        migrations.AddField(
+            model_name='vecinolibro',
+            name='calculado',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Calculado'),
+        ),
+    ]
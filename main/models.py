@@ -1,11 +1,138 @@
+import hashlib
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 
+def clave_libro(url='', titulo=''):
+    """
+    Clave canónica de un libro: hash de la url de su ficha (la clave única del
+    índice Whoosh) o, si no la tiene, de su título normalizado.
+    """
+    if url:
+        base = f'url:{url}'
+    else:
+        base = 'titulo:' + ' '.join(titulo.lower().split())
+    return hashlib.sha1(base.encode('utf-8')).hexdigest()
+
+
+class LibroManager(models.Manager):
+    """Altas y actualizaciones de libros a partir de los dicts del catálogo Whoosh"""
+
+    CAMPOS_CATALOGO = ('url', 'titulo', 'autor', 'genero', 'sinopsis', 'portada')
+
+    def desde_datos(self, datos):
+        """Libro sin guardar con los campos del dict (recortados a su longitud máxima)"""
+        campos = {}
+        for nombre in self.CAMPOS_CATALOGO:
+            valor = datos.get(nombre) or ''
+            longitud = self.model._meta.get_field(nombre).max_length
+            campos[nombre] = valor[:longitud] if longitud else valor
+        return self.model(clave=clave_libro(campos['url'], campos['titulo']), **campos)
+
+    def desde_catalogo(self, datos):
+        """Obtiene o crea el Libro de un libro del catálogo, actualizando sus datos si han cambiado"""
+        nuevo = self.desde_datos(datos)
+        campos = {nombre: getattr(nuevo, nombre) for nombre in self.CAMPOS_CATALOGO}
+        libro, creado = self.get_or_create(clave=nuevo.clave, defaults=campos)
+        if not creado and any(getattr(libro, nombre) != valor for nombre, valor in campos.items()):
+            cambia_perfil = (libro.genero, libro.autor) != (nuevo.genero, nuevo.autor)
+            for nombre, valor in campos.items():
+                setattr(libro, nombre, valor)
+            libro.save(update_fields=list(campos))
+            if cambia_perfil:
+                self._reconstruir_perfiles([libro.pk])
+        return libro
+
+    def sincronizar(self, libros, tam_lote=500):
+        """
+        Inserta o actualiza en bloque los libros del catálogo (por lotes de
+        tam_lote, con ON CONFLICT sobre la clave). Retorna cuántos ha procesado.
+        """
+        total = 0
+        lote = {}
+        for datos in libros:
+            libro = self.desde_datos(datos)
+            lote[libro.clave] = libro
+            if len(lote) >= tam_lote:
+                total += self._volcar(lote)
+                lote = {}
+        if lote:
+            total += self._volcar(lote)
+        return total
+
+    def _volcar(self, lote):
+        anteriores = self.filter(clave__in=list(lote)).values_list('clave', 'genero', 'autor')
+        cambiados = [clave for clave, genero, autor in anteriores
+                     if (lote[clave].genero, lote[clave].autor) != (genero, autor)]
+        self.bulk_create(lote.values(), update_conflicts=True, unique_fields=['clave'],
+                         update_fields=list(self.CAMPOS_CATALOGO))
+        if cambiados:
+            self._reconstruir_perfiles(self.filter(clave__in=cambiados).values_list('id', flat=True))
+        return len(lote)
+
+    def _reconstruir_perfiles(self, libro_ids):
+        """
+        Reconstruye los perfiles de los usuarios que tienen alguno de esos
+        libros, cuyo género o autor acaba de cambiar.
+
+        El perfil guarda pesos por género y autor, y actualizar_perfil() resta
+        los del Libro actual: sin reconstruirlos, el peso se quitaría del
+        género nuevo y el antiguo lo conservaría para siempre.
+        """
+        from main.recommender import invalidar_recomendaciones, reconstruir_perfil
+
+        usuarios = (LibroUsuario.objects.filter(libro_id__in=list(libro_ids))
+                    .order_by().values_list('usuario_id', flat=True).distinct())
+        for usuario_id in usuarios:
+            reconstruir_perfil(usuario_id)
+            invalidar_recomendaciones(usuario_id)
+
+    def ids_por_clave(self, libros):
+        """Dict clave -> id de los libros del catálogo, creando los que aún no existen"""
+        ids = dict(self.values_list('clave', 'id'))
+        faltan = {}
+        for datos in libros:
+            libro = self.desde_datos(datos)
+            if libro.clave not in ids:
+                faltan[libro.clave] = libro
+        if faltan:
+            self.bulk_create(faltan.values(), ignore_conflicts=True, batch_size=500)
+            ids.update(self.filter(clave__in=list(faltan)).values_list('clave', 'id'))
+        return ids
+
+
+class Libro(models.Model):
+    """
+    Libro del catálogo. Se identifica por clave_libro() de la url de su ficha,
+    así que cada libro del índice Whoosh tiene una sola fila compartida por
+    las librerías y valoraciones de todos los usuarios.
+    """
+    clave = models.CharField(max_length=40, unique=True, verbose_name='Clave')
+    url = models.URLField(max_length=1000, blank=True, verbose_name='URL')
+    titulo = models.CharField(max_length=500, verbose_name='Título')
+    autor = models.CharField(max_length=300, verbose_name='Autor', blank=True)
+    portada = models.URLField(max_length=1000, verbose_name='Portada', blank=True)
+    genero = models.CharField(max_length=100, verbose_name='Género', blank=True)
+    sinopsis = models.TextField(verbose_name='Sinopsis', blank=True)
+
+    objects = LibroManager()
+
+    class Meta:
+        verbose_name = 'Libro'
+        verbose_name_plural = 'Libros'
+        ordering = ['titulo']
+
+    def __str__(self):
+        return f"{self.titulo} - {self.autor}" if self.autor else self.titulo
+
+
 class LibroUsuario(models.Model):
     """
     Libro guardado en la librería de un usuario.
+    Los datos del libro están en Libro; las propiedades titulo, autor, etc.
+    los exponen para las plantillas.
     """
     ESTADO_CHOICES = [
         ('por_leer', 'Por leer'),
@@ -18,11 +145,12 @@ class LibroUsuario(models.Model):
         related_name='libros_guardados',
         verbose_name='Usuario'
     )
-    titulo = models.CharField(max_length=500, verbose_name='Título')
-    autor = models.CharField(max_length=300, verbose_name='Autor', blank=True)
-    portada = models.URLField(max_length=1000, verbose_name='Portada', blank=True)
-    genero = models.CharField(max_length=100, verbose_name='Género', blank=True)
-    sinopsis = models.TextField(verbose_name='Sinopsis', blank=True)
+    libro = models.ForeignKey(
+        Libro,
+        on_delete=models.CASCADE,
+        related_name='en_librerias',
+        verbose_name='Libro'
+    )
     estado = models.CharField(
         max_length=20,
         choices=ESTADO_CHOICES,
@@ -41,17 +169,36 @@ class LibroUsuario(models.Model):
     class Meta:
         verbose_name = 'Libro de usuario'
         verbose_name_plural = 'Libros de usuarios'
-        unique_together = ('usuario', 'titulo')
+        unique_together = ('usuario', 'libro')
         ordering = ['-fecha_agregado']
     
     def __str__(self):
         return f"{self.usuario.username} - {self.titulo} ({self.get_estado_display()})"
+    
+    @property
+    def titulo(self):
+        return self.libro.titulo
+    
+    @property
+    def autor(self):
+        return self.libro.autor
+    
+    @property
+    def portada(self):
+        return self.libro.portada
+    
+    @property
+    def genero(self):
+        return self.libro.genero
+    
+    @property
+    def sinopsis(self):
+        return self.libro.sinopsis
 
 
 class Valoracion(models.Model):
     """
-    Valoración de un usuario sobre un libro.
-    El libro se identifica por su título (almacenado en Whoosh).
+    Valoración de un usuario sobre un libro del catálogo.
     """
     usuario = models.ForeignKey(
         User, 
@@ -59,9 +206,11 @@ class Valoracion(models.Model):
         related_name='valoraciones',
         verbose_name='Usuario'
     )
-    titulo_libro = models.CharField(
-        max_length=500,
-        verbose_name='Título del libro'
+    libro = models.ForeignKey(
+        Libro,
+        on_delete=models.CASCADE,
+        related_name='valoraciones',
+        verbose_name='Libro'
     )
     puntuacion = models.FloatField(
         validators=[MinValueValidator(1.0), MaxValueValidator(10.0)],
@@ -80,12 +229,154 @@ class Valoracion(models.Model):
     class Meta:
         verbose_name = 'Valoración'
         verbose_name_plural = 'Valoraciones'
-        unique_together = ('usuario', 'titulo_libro')
+        unique_together = ('usuario', 'libro')
         ordering = ['-fecha']
         indexes = [
             models.Index(fields=['usuario', '-fecha']),
-            models.Index(fields=['titulo_libro']),
         ]
     
     def __str__(self):
-        return f"{self.usuario.username} - {self.titulo_libro}: {self.puntuacion}"
+        return f"{self.usuario.username} - {self.libro.titulo}: {self.puntuacion}"
+
+
+class PerfilUsuario(models.Model):
+    """
+    Perfil de recomendación de un usuario, desnormalizado a partir de su
+    librería. Las señales de LibroUsuario lo actualizan de forma incremental
+    (ver recommender.actualizar_perfil); `python manage.py reconstruir_perfiles`
+    lo recalcula desde cero.
+    """
+    usuario = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='perfil_recomendacion',
+        verbose_name='Usuario'
+    )
+    generos = models.JSONField(default=dict, blank=True, verbose_name='Peso de cada género')
+    autores = models.JSONField(default=dict, blank=True, verbose_name='Peso de cada autor')
+    excluidos = models.JSONField(default=list, blank=True, verbose_name='Libros excluidos (ids)')
+    num_libros = models.PositiveIntegerField(default=0, verbose_name='Libros que forman el perfil')
+    actualizado = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Perfil de usuario'
+        verbose_name_plural = 'Perfiles de usuarios'
+    
+    def __str__(self):
+        return f"Perfil de {self.usuario.username} ({self.num_libros} libros)"
+
+
+class RecomendacionPrecalculada(models.Model):
+    """
+    Recomendaciones de un usuario calculadas fuera de las peticiones por
+    `python manage.py precompute_recommendations`. Solo son válidas para la
+    generación del índice, el modo de recomendación, la versión de los
+    vecinos colaborativos y la versión del perfil con que se calcularon.
+    """
+    usuario = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='recomendaciones_precalculadas',
+        verbose_name='Usuario'
+    )
+    generacion = models.CharField(max_length=100, verbose_name='Generación del índice')
+    modo = models.CharField(max_length=20, default='contenido', verbose_name='Modo de recomendación')
+    version_vecinos = models.DateTimeField(null=True, blank=True, verbose_name='Versión de los vecinos')
+    perfil_actualizado = models.DateTimeField(verbose_name='Versión del perfil')
+    n = models.PositiveSmallIntegerField(verbose_name='Número de recomendaciones')
+    recomendaciones = models.JSONField(default=list, verbose_name='Recomendaciones')
+    perfil_info = models.JSONField(default=dict, verbose_name='Información del perfil')
+    fecha_calculo = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Recomendaciones precalculadas'
+        verbose_name_plural = 'Recomendaciones precalculadas'
+    
+    def __str__(self):
+        return f"Recomendaciones de {self.usuario.username} ({self.generacion})"
+
+
+class VecinoLibro(models.Model):
+    """
+    Uno de los K libros más parecidos a otro según las valoraciones de los
+    usuarios (filtrado colaborativo ítem-ítem). Los calcula fuera de las
+    peticiones `python manage.py calcular_vecinos`.
+    """
+    libro = models.ForeignKey(
+        Libro,
+        on_delete=models.CASCADE,
+        related_name='vecinos',
+        verbose_name='Libro'
+    )
+    vecino = models.ForeignKey(
+        Libro,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Libro parecido'
+    )
+    similitud = models.FloatField(verbose_name='Similitud')
+    calculado = models.DateTimeField(default=timezone.now, db_index=True, verbose_name='Calculado')
+    
+    class Meta:
+        verbose_name = 'Vecino de libro'
+        verbose_name_plural = 'Vecinos de libros'
+        unique_together = ('libro', 'vecino')
+    
+    def __str__(self):
+        return f"{self.libro_id} ~ {self.vecino_id} ({self.similitud:.2f})"
+
+
+class TareaScraping(models.Model):
+    """
+    Ejecución en segundo plano del scraping lanzada desde la administración.
+    La procesa el comando `python manage.py procesar_tareas`.
+    """
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('en_curso', 'En curso'),
+        ('completada', 'Completada'),
+        ('error', 'Error'),
+    ]
+    
+    estado = models.CharField(
+        max_length=20,
+        choices=ESTADO_CHOICES,
+        default='pendiente',
+        verbose_name='Estado'
+    )
+    solicitada_por = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='tareas_scraping',
+        verbose_name='Solicitada por'
+    )
+    progreso = models.PositiveSmallIntegerField(default=0, verbose_name='Progreso (%)')
+    mensaje = models.CharField(max_length=300, blank=True, verbose_name='Mensaje')
+    resultado = models.JSONField(default=dict, blank=True, verbose_name='Resultado')
+    error = models.TextField(blank=True, verbose_name='Error')
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+    latido = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Último latido',
+        help_text='Lo actualiza el worker con cada avance; si deja de hacerlo la tarea se da por abandonada'
+    )
+    
+    class Meta:
+        verbose_name = 'Tarea de scraping'
+        verbose_name_plural = 'Tareas de scraping'
+        ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['estado', 'fecha_creacion']),
+        ]
+    
+    def __str__(self):
+        return f"Scraping #{self.pk} ({self.get_estado_display()})"
+    
+    @property
+    def terminada(self):
+        return self.estado in ('completada', 'error')
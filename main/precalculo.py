@@ -0,0 +1,115 @@
+# precalculo.py
+"""
+Precálculo de recomendaciones para todos los usuarios.
+
+Lo usa el comando `python manage.py precompute_recommendations` (pensado para
+ejecutarse después de cada scraping). Los usuarios se reparten en lotes entre
+varios procesos; cada uno puntúa a sus usuarios con el motor vectorizado y
+guarda el resultado en RecomendacionPrecalculada junto a la generación del
+índice y la versión del perfil, para que la vista lo sirva directamente.
+
+Este módulo no importa modelos al cargarse: los procesos hijo lo importan
+antes de inicializar Django cuando no se crean con fork.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Recomendaciones guardadas por usuario (la vista usa las primeras que necesite)
+N_PRECALCULADAS = 12
+TAM_LOTE_USUARIOS = 200
+
+
+def _inicializar_proceso():
+    """Prepara Django en cada proceso hijo (si no viene ya del padre por fork)"""
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bookwise.settings')
+        django.setup()
+
+
+def precalcular_lote(usuario_ids, n=N_PRECALCULADAS):
+    """Calcula y guarda las recomendaciones de un lote de usuarios. Retorna cuántos"""
+    from main.models import PerfilUsuario, RecomendacionPrecalculada
+    from main.recommender import (construir_perfil_usuario, diagnosticar_perfil, modo_recomendacion,
+                                  obtener_matriz_catalogo, reconstruir_perfil, recomendar_libros,
+                                  version_vecinos)
+
+    # La versión de cada perfil se lee antes de puntuar: si cambia durante el
+    # cálculo la fila guardada ya no coincidirá y la vista la ignorará
+    versiones = dict(PerfilUsuario.objects.filter(usuario_id__in=usuario_ids)
+                     .values_list('usuario_id', 'actualizado'))
+    for usuario_id in usuario_ids:
+        if usuario_id not in versiones:
+            versiones[usuario_id] = reconstruir_perfil(usuario_id).actualizado
+
+    generacion = obtener_matriz_catalogo().generacion
+    modo = modo_recomendacion()
+    vecinos = version_vecinos(modo)
+    filas = []
+    for usuario_id in usuario_ids:
+        perfil = construir_perfil_usuario(usuario_id)
+        filas.append(RecomendacionPrecalculada(
+            usuario_id=usuario_id,
+            generacion=generacion,
+            modo=modo,
+            version_vecinos=vecinos,
+            perfil_actualizado=versiones[usuario_id],
+            n=n,
+            recomendaciones=recomendar_libros(usuario_id, n=n, perfil=perfil, modo=modo),
+            perfil_info=diagnosticar_perfil(usuario_id, perfil=perfil),
+        ))
+
+    RecomendacionPrecalculada.objects.bulk_create(
+        filas,
+        update_conflicts=True,
+        unique_fields=['usuario'],
+        update_fields=['generacion', 'modo', 'version_vecinos', 'perfil_actualizado', 'n', 'recomendaciones', 'perfil_info', 'fecha_calculo'],
+    )
+    return len(filas)
+
+
+def precalcular_recomendaciones(usuario_ids, n=N_PRECALCULADAS, procesos=None,
+                                tam_lote=TAM_LOTE_USUARIOS, al_terminar_lote=None):
+    """
+    Precalcula las recomendaciones de los usuarios indicados.
+
+    Con procesos=1 todo se hace en el proceso actual. Si no, el catálogo y su
+    matriz se cargan antes de crear el pool (con fork los hijos los heredan
+    sin volver a leer el índice) y se cierran las conexiones a la base de
+    datos y los searchers, que no se pueden compartir entre procesos.
+
+    Args:
+        al_terminar_lote: Función opcional llamada con el total acumulado
+
+    Returns:
+        int: Número de usuarios con recomendaciones guardadas
+    """
+    from django.db import connections
+    from main.recommender import obtener_matriz_catalogo
+    from main.whoosh_utils import cerrar_searchers
+
+    usuario_ids = list(usuario_ids)
+    lotes = [usuario_ids[i:i + tam_lote] for i in range(0, len(usuario_ids), tam_lote)]
+    procesos = procesos or os.cpu_count() or 1
+    total = 0
+
+    if procesos == 1 or len(lotes) <= 1:
+        for lote in lotes:
+            total += precalcular_lote(lote, n)
+            if al_terminar_lote:
+                al_terminar_lote(total)
+        return total
+
+    obtener_matriz_catalogo()
+    cerrar_searchers()
+    connections.close_all()
+
+    with ProcessPoolExecutor(max_workers=min(procesos, len(lotes)),
+                             initializer=_inicializar_proceso) as pool:
+        futuros = [pool.submit(precalcular_lote, lote, n) for lote in lotes]
+        for futuro in as_completed(futuros):
+            total += futuro.result()
+            if al_terminar_lote:
+                al_terminar_lote(total)
+    return total
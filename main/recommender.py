@@ -12,6 +12,10 @@ Algoritmo:
 2. Calcular similitud con Coeficiente de Dice
 3. Combinar: 60% similitud género + 20% autor favorito + 20% popularidad
 4. Si no hay perfil -> mostrar los más populares
+
+Modo 'mixto' (BOOKWISE_MODO_RECOMENDACION): el score anterior se mezcla con
+el del filtrado colaborativo ítem-ítem (ver colaborativo.py), con peso
+BOOKWISE_PESO_COLABORATIVO.
 """
 
 if __name__ == '__main__':
@@ -21,9 +25,17 @@ if __name__ == '__main__':
     django.setup()
 
 from collections import Counter
-from main.models import LibroUsuario
-from main.whoosh_utils import obtener_todos_libros
+from dataclasses import dataclass
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from main import colaborativo
+from main.models import Libro, LibroUsuario, PerfilUsuario, RecomendacionPrecalculada, clave_libro
+from main.whoosh_utils import obtener_catalogo
 import math
+import threading
+import time
+import numpy as np
 
 
 # ============================================================================
@@ -49,9 +61,10 @@ def coeficiente_dice(conjunto_a, conjunto_b):
 # CONSTRUCCIÓN DEL PERFIL DE USUARIO
 # ============================================================================
 
-def construir_perfil_usuario(usuario_id):
+def aporte_libro(estado, valoracion):
     """
-    Construye el perfil del usuario basado en sus libros leídos.
+    Peso con el que un libro de la librería cuenta en el perfil y si se
+    excluye de las recomendaciones.
     
     Solo considera libros con valoración >= 4 estrellas (le gustaron).
     
@@ -60,61 +73,125 @@ def construir_perfil_usuario(usuario_id):
         - 4 estrellas -> peso 1 (le gustó)
         - < 4 estrellas -> no se considera
     
+    Los libros en "Por Leer" no suman peso pero también se excluyen.
+    
     Returns:
-        dict: {
-            'generos': set de géneros preferidos (top 5),
-            'autores': set de autores favoritos (top 3),
-            'titulos_leidos': set de títulos ya leídos (para excluir)
-        }
+        tuple: (peso, excluido)
     """
-    # Obtener libros leídos con valoración positiva (>= 4)
-    libros_leidos = LibroUsuario.objects.filter(
+    if estado == 'leido' and valoracion is not None and valoracion >= 4:
+        return (2 if valoracion >= 5 else 1), True
+    return 0, estado == 'por_leer'
+
+
+def reconstruir_perfil(usuario_id):
+    """Recalcula desde cero el PerfilUsuario a partir de la librería del usuario"""
+    generos_ponderados = Counter()
+    autores_ponderados = Counter()
+    excluidos = set()
+    num_libros = 0
+    
+    libros = LibroUsuario.objects.filter(usuario_id=usuario_id).values_list(
+        'libro_id', 'libro__genero', 'libro__autor', 'estado', 'valoracion')
+    
+    for libro_id, genero, autor, estado, valoracion in libros:
+        peso, excluido = aporte_libro(estado, valoracion)
+        if peso:
+            # Agregar género y autor al perfil
+            if genero and genero.strip():
+                generos_ponderados[genero.strip()] += peso
+            if autor and autor.strip():
+                autores_ponderados[autor.strip()] += peso
+            num_libros += 1
+        if excluido:
+            excluidos.add(libro_id)
+    
+    perfil, _ = PerfilUsuario.objects.update_or_create(
         usuario_id=usuario_id,
-        estado='leido',
-        valoracion__gte=4
+        defaults={
+            'generos': dict(generos_ponderados),
+            'autores': dict(autores_ponderados),
+            'excluidos': sorted(excluidos),
+            'num_libros': num_libros,
+        }
     )
+    return perfil
+
+
+def _sumar_peso(pesos, clave, cantidad):
+    clave = (clave or '').strip()
+    if not clave:
+        return
+    total = pesos.get(clave, 0) + cantidad
+    if total > 0:
+        pesos[clave] = total
+    else:
+        pesos.pop(clave, None)
+
+
+def actualizar_perfil(usuario_id, anterior, nuevo):
+    """
+    Aplica al PerfilUsuario el cambio de un libro de la librería.
     
-    generos_ponderados = Counter()
-    autores_ponderados = Counter()
-    titulos_leidos = set()
-    
-    for libro in libros_leidos:
-        # Calcular peso según valoración
-        if libro.valoracion >= 5:
-            peso = 2  
-        else:
-            peso = 1  
-        
-        # Agregar género al perfil
-        if libro.genero:
-            generos_ponderados[libro.genero.strip()] += peso
+    anterior y nuevo son dicts con libro_id, estado y valoracion (None si el
+    libro se acaba de añadir o se ha eliminado). Si el usuario aún no tiene
+    perfil se reconstruye entero, salvo al eliminar.
+    """
+    with transaction.atomic():
+        perfil = PerfilUsuario.objects.select_for_update().filter(usuario_id=usuario_id).first()
+        if perfil is None:
+            if nuevo is not None:
+                reconstruir_perfil(usuario_id)
+            return
         
-        # Agregar autor al perfil
-        if libro.autor:
-            autores_ponderados[libro.autor.strip()] += peso
+        excluidos = set(perfil.excluidos)
+        for datos, signo in ((anterior, -1), (nuevo, 1)):
+            if datos is None:
+                continue
+            peso, excluido = aporte_libro(datos['estado'], datos['valoracion'])
+            if peso:
+                genero, autor = Libro.objects.filter(pk=datos['libro_id']).values_list(
+                    'genero', 'autor').first() or ('', '')
+                _sumar_peso(perfil.generos, genero, signo * peso)
+                _sumar_peso(perfil.autores, autor, signo * peso)
+                perfil.num_libros = max(perfil.num_libros + signo, 0)
+            if excluido:
+                if signo > 0:
+                    excluidos.add(datos['libro_id'])
+                else:
+                    excluidos.discard(datos['libro_id'])
         
-        # Guardar título para excluir después
-        titulos_leidos.add(libro.titulo.lower().strip())
-    
-    # También excluir libros en "Por Leer"
-    libros_por_leer = LibroUsuario.objects.filter(
-        usuario_id=usuario_id,
-        estado='por_leer'
-    )
-    for libro in libros_por_leer:
-        titulos_leidos.add(libro.titulo.lower().strip())
+        perfil.excluidos = sorted(excluidos)
+        perfil.save()
+
+
+def _mas_pesados(pesos, n):
+    """Las n claves con más peso (a igual peso, por orden alfabético)"""
+    return {clave for clave, _ in sorted(pesos.items(), key=lambda p: (-p[1], p[0]))[:n]}
+
+
+def construir_perfil_usuario(usuario_id):
+    """
+    Construye el perfil del usuario basado en sus libros leídos.
     
-    # Top 5 géneros preferidos
-    top_generos = set(g for g, _ in generos_ponderados.most_common(5))
+    Lee el PerfilUsuario guardado (se crea la primera vez), así que el coste
+    no depende del tamaño de la librería. La ponderación está en aporte_libro().
     
-    # Top 3 autores favoritos
-    top_autores = set(a for a, _ in autores_ponderados.most_common(3))
+    Returns:
+        dict: {
+            'generos': set de géneros preferidos (top 5),
+            'autores': set de autores favoritos (top 3),
+            'excluidos': set de ids de Libro ya en la librería (para excluir)
+        }
+    """
+    perfil = PerfilUsuario.objects.filter(usuario_id=usuario_id).first()
+    if perfil is None:
+        perfil = reconstruir_perfil(usuario_id)
     
     return {
-        'generos': top_generos,
-        'autores': top_autores,
-        'titulos_leidos': titulos_leidos,
-        'num_libros_perfil': len(libros_leidos)
+        'generos': _mas_pesados(perfil.generos, 5),
+        'autores': _mas_pesados(perfil.autores, 3),
+        'excluidos': set(perfil.excluidos),
+        'num_libros_perfil': perfil.num_libros
     }
 
 
@@ -194,92 +271,360 @@ def obtener_motivo(libro, perfil):
     return "Popular"
 
 
+# ============================================================================
+# MOTOR VECTORIZADO
+# ============================================================================
+
+@dataclass(frozen=True)
+class MatrizCatalogo:
+    """
+    Características del catálogo precalculadas para puntuar con NumPy.
+
+    Se construye una vez por generación del índice. La fila i de cada array
+    corresponde a libros[i] del catálogo en memoria.
+    """
+    generacion: str
+    libros: tuple
+    generos_onehot: np.ndarray   # (libros x géneros), 1 si el libro es del género
+    num_generos: np.ndarray      # número de géneros de cada libro (0 o 1)
+    autor_ids: np.ndarray        # id del autor de cada libro, -1 si no tiene
+    popularidad: np.ndarray      # componente de popularidad ya ponderado (0-0.20)
+    indice_generos: dict         # género -> columna de generos_onehot
+    indice_autores: dict         # autor -> id
+    libro_ids: np.ndarray        # id del Libro (tabla de la base de datos) de cada fila
+    fila_libro: dict             # id del Libro -> fila
+    filas_genero: tuple          # columna de género -> filas de ese género (listas invertidas)
+    filas_autor: tuple           # id de autor -> filas de ese autor
+    orden_popularidad: np.ndarray  # filas de mayor a menor popularidad (a igualdad, por fila)
+    score_populares: np.ndarray  # score_popularidad() de cada fila, para usuarios sin perfil
+    orden_populares: np.ndarray  # filas de mayor a menor score_populares (a igualdad, por fila)
+
+
+_matriz = None
+_matriz_lock = threading.Lock()
+
+
+def score_popularidad(libro):
+    """
+    Popularidad para usuarios sin perfil: combina valoración y votos,
+    priorizando libros bien valorados con muchos votos.
+    """
+    valoracion = libro.get('valoracion', 0) or 0
+    num_votos = libro.get('num_votos', 0) or 0
+    # Multiplicamos valoración por log de votos para balancear
+    return valoracion * math.log10(num_votos + 1)
+
+
+def _popularidad_ponderada(libro):
+    """Componente de popularidad de calcular_score() (20% del score)"""
+    valoracion = libro.get('valoracion', 0) or 0
+    num_votos = libro.get('num_votos', 0) or 0
+    valoracion_norm = min(valoracion / 5.0, 1.0)
+    votos_norm = min(math.log10(num_votos + 1) / 3.0, 1.0) if num_votos > 0 else 0
+    return ((valoracion_norm * 0.7) + (votos_norm * 0.3)) * 0.20
+
+
+def _ids_libros(libros):
+    """Id de Libro de cada libro del catálogo (crea las filas que falten)"""
+    claves = [clave_libro(libro.get('url', ''), libro.get('titulo', '')) for libro in libros]
+    ids = Libro.objects.ids_por_clave(libros)
+    return np.array([ids[clave] for clave in claves], dtype=np.int64)
+
+
+def construir_matriz_catalogo(catalogo):
+    """Precalcula las características de todos los libros del catálogo"""
+    libros = catalogo.libros
+    indice_generos = {}
+    indice_autores = {}
+
+    filas_genero = []
+    autor_ids = np.full(len(libros), -1, dtype=np.int32)
+    popularidad = np.empty(len(libros), dtype=np.float64)
+    score_populares = np.empty(len(libros), dtype=np.float64)
+
+    for i, libro in enumerate(libros):
+        genero = (libro.get('genero') or '').strip()
+        if genero:
+            filas_genero.append((i, indice_generos.setdefault(genero, len(indice_generos))))
+
+        autor = (libro.get('autor') or '').strip()
+        if autor:
+            autor_ids[i] = indice_autores.setdefault(autor, len(indice_autores))
+
+        popularidad[i] = _popularidad_ponderada(libro)
+        score_populares[i] = score_popularidad(libro)
+
+    libro_ids = _ids_libros(libros)
+    generos_onehot = np.zeros((len(libros), len(indice_generos)), dtype=np.float32)
+    columnas_genero = np.full(len(libros), -1, dtype=np.int32)
+    if filas_genero:
+        filas, columnas = zip(*filas_genero)
+        generos_onehot[list(filas), list(columnas)] = 1.0
+        columnas_genero[list(filas)] = columnas
+
+    return MatrizCatalogo(
+        generacion=catalogo.generacion,
+        libros=libros,
+        generos_onehot=generos_onehot,
+        num_generos=generos_onehot.sum(axis=1),
+        autor_ids=autor_ids,
+        popularidad=popularidad,
+        indice_generos=indice_generos,
+        indice_autores=indice_autores,
+        libro_ids=libro_ids,
+        fila_libro={int(libro_id): i for i, libro_id in enumerate(libro_ids)},
+        filas_genero=_listas_invertidas(columnas_genero, len(indice_generos)),
+        filas_autor=_listas_invertidas(autor_ids, len(indice_autores)),
+        orden_popularidad=np.lexsort((np.arange(len(libros)), -popularidad)),
+        score_populares=score_populares,
+        orden_populares=np.lexsort((np.arange(len(libros)), -score_populares)),
+    )
+
+
+def _listas_invertidas(ids, num_ids):
+    """Para cada id de 0 a num_ids-1, array ordenado de las filas con ese id (-1 = ninguno)"""
+    orden = np.argsort(ids, kind='stable')
+    limites = np.searchsorted(ids[orden], np.arange(num_ids + 1))
+    return tuple(orden[limites[i]:limites[i + 1]] for i in range(num_ids))
+
+
+def obtener_matriz_catalogo():
+    """Retorna la matriz del catálogo, reconstruyéndola si cambió el índice"""
+    global _matriz
+
+    catalogo = obtener_catalogo()
+    matriz = _matriz
+    if matriz is not None and matriz.libros is catalogo.libros:
+        return matriz
+
+    with _matriz_lock:
+        if _matriz is None or _matriz.libros is not catalogo.libros:
+            _matriz = construir_matriz_catalogo(catalogo)
+        return _matriz
+
+
+def _mascara_excluidos(matriz, libro_ids, filas):
+    """Marca cuáles de las filas dadas tienen un id de Libro del conjunto"""
+    ids = np.fromiter(libro_ids, dtype=np.int64, count=len(libro_ids))
+    return np.isin(matriz.libro_ids[filas], ids)
+
+
+def filas_candidatas(matriz, perfil, n):
+    """
+    Filas que pueden estar entre las n mejores para el perfil, ordenadas.
+
+    Un libro sin género ni autor del perfil solo puntúa por popularidad, que
+    nunca supera lo que aporta compartir género o autor. Por eso basta con
+    unir las listas invertidas de los géneros y autores del perfil con los
+    n + len(excluidos) libros más populares, que cubren el relleno aunque
+    parte de ellos esté en la librería del usuario.
+    """
+    partes = [matriz.orden_popularidad[:n + len(perfil['excluidos'])]]
+    for genero in perfil['generos']:
+        columna = matriz.indice_generos.get(genero)
+        if columna is not None:
+            partes.append(matriz.filas_genero[columna])
+    for autor in perfil['autores']:
+        autor_id = matriz.indice_autores.get(autor)
+        if autor_id is not None:
+            partes.append(matriz.filas_autor[autor_id])
+    return np.unique(np.concatenate(partes))
+
+
+def puntuar_catalogo(matriz, perfil, filas=None):
+    """
+    Calcula calcular_score() para varios libros a la vez.
+
+    Args:
+        filas: Filas de la matriz a puntuar (None = todo el catálogo)
+
+    Returns:
+        np.ndarray: Score de 0 a 100 para cada fila pedida
+    """
+    if filas is None:
+        filas = slice(None)
+
+    # 1. SIMILITUD DE GÉNEROS (60%): Dice entre el perfil y los géneros del libro
+    perfil_generos = np.zeros(matriz.generos_onehot.shape[1], dtype=np.float32)
+    for genero in perfil['generos']:
+        columna = matriz.indice_generos.get(genero)
+        if columna is not None:
+            perfil_generos[columna] = 1.0
+
+    interseccion = (matriz.generos_onehot[filas] @ perfil_generos).astype(np.float64)
+    denominador = len(perfil['generos']) + matriz.num_generos[filas].astype(np.float64)
+    similitud = np.divide(2.0 * interseccion, denominador,
+                          out=np.zeros_like(interseccion), where=interseccion > 0)
+    score_genero = similitud * 0.60
+
+    # 2. BONUS POR AUTOR FAVORITO (20%)
+    perfil_autores = [matriz.indice_autores[a] for a in perfil['autores'] if a in matriz.indice_autores]
+    score_autor = np.isin(matriz.autor_ids[filas], perfil_autores) * 0.20
+
+    # 3. POPULARIDAD DEL LIBRO (20%), precalculada
+    return (score_genero + score_autor + matriz.popularidad[filas]) * 100
+
+
+def seleccionar_top(puntuaciones, filas, n):
+    """
+    Devuelve las n filas con mayor puntuación, ordenadas de mayor a menor.
+
+    puntuaciones[i] es el score de filas[i]. Usa argpartition para no ordenar
+    todos los candidatos; a igual score gana la fila que aparece antes en el índice.
+    """
+    if n <= 0 or len(filas) == 0:
+        return filas[:0], puntuaciones[:0]
+
+    if len(filas) > n:
+        umbral = puntuaciones[np.argpartition(-puntuaciones, n - 1)[n - 1]]
+        seleccion = puntuaciones >= umbral
+        filas = filas[seleccion]
+        puntuaciones = puntuaciones[seleccion]
+
+    orden = np.lexsort((filas, -puntuaciones))[:n]
+    return filas[orden], puntuaciones[orden]
+
+
+# ============================================================================
+# FILTRADO COLABORATIVO
+# ============================================================================
+
+MODOS_RECOMENDACION = ('contenido', 'mixto')
+
+
+def modo_recomendacion():
+    """Modo de BOOKWISE_MODO_RECOMENDACION ('contenido' si no está)"""
+    return getattr(settings, 'BOOKWISE_MODO_RECOMENDACION', 'contenido')
+
+
+def peso_colaborativo():
+    """Peso del filtrado colaborativo en el modo 'mixto' (0 a 1)"""
+    return getattr(settings, 'BOOKWISE_PESO_COLABORATIVO', 0.5)
+
+
+def filas_colaborativas(matriz, afinidades):
+    """
+    Filas del catálogo con afinidad colaborativa y su score de 0 a 100
+    (relativo a la mayor afinidad del usuario).
+
+    Returns:
+        tuple: (filas, scores, fila del libro valorado que más aporta a cada una)
+    """
+    filas, scores, origenes = [], [], []
+    for libro_id, (afinidad, origen_id) in afinidades.items():
+        fila = matriz.fila_libro.get(libro_id)
+        if fila is not None:
+            filas.append(fila)
+            scores.append(afinidad)
+            origenes.append(matriz.fila_libro.get(origen_id, -1))
+    scores = np.array(scores, dtype=np.float64)
+    if len(scores):
+        scores *= 100 / scores.max()
+    return np.array(filas, dtype=np.int64), scores, np.array(origenes, dtype=np.int64)
+
+
+def mezclar_scores(filas, scores, filas_cf, scores_cf, peso):
+    """
+    (1 - peso) * score de contenido + peso * score colaborativo.
+
+    filas debe contener todas las filas_cf (ordenadas, como las de np.unique).
+
+    Returns:
+        tuple: (scores mezclados, score colaborativo ponderado de cada fila)
+    """
+    aporte_cf = np.zeros(len(filas), dtype=np.float64)
+    aporte_cf[np.searchsorted(filas, filas_cf)] = scores_cf * peso
+    return scores * (1 - peso) + aporte_cf, aporte_cf
+
+
 # ============================================================================
 # FUNCIÓN PRINCIPAL DE RECOMENDACIÓN
 # ============================================================================
 
-def recomendar_libros(usuario_id, n=4):
+def recomendar_libros(usuario_id, n=4, perfil=None, modo=None):
     """
     Genera recomendaciones personalizadas para un usuario.
     
     Algoritmo:
         1. Construir perfil del usuario
         2. Si no hay perfil -> devolver los más populares
-        3. Calcular score para cada libro candidato
+        3. Calcular score de los candidatos (listas invertidas por género y
+           autor + los más populares), vectorizado con NumPy
         4. Excluir libros ya en la librería del usuario
-        5. Ordenar y devolver top N
+        5. Seleccionar y devolver top N
     
     Args:
         usuario_id: ID del usuario
         n: Número de recomendaciones (default: 4)
+        perfil: Perfil ya construido (si es None se construye)
+        modo: 'contenido' o 'mixto' (None = modo_recomendacion())
     
     Returns:
         list: Lista de dicts con libro + score + motivo
     """
+    if modo is None:
+        modo = modo_recomendacion()
+    if modo not in MODOS_RECOMENDACION:
+        raise ValueError(f"Modo de recomendación desconocido: {modo}")
+
     # Construir perfil del usuario
-    perfil = construir_perfil_usuario(usuario_id)
+    if perfil is None:
+        perfil = construir_perfil_usuario(usuario_id)
+    
+    # Catálogo en memoria con el id de Libro de cada fila (compartido, no modificar)
+    matriz = obtener_matriz_catalogo()
     
-    # Obtener todos los libros del índice Whoosh
-    todos_libros = obtener_todos_libros()
+    # Filtrado colaborativo: vecinos precalculados de los libros valorados
+    filas_cf = np.empty(0, dtype=np.int64)
+    if modo == 'mixto':
+        filas_cf, scores_cf, origenes_cf = filas_colaborativas(matriz, colaborativo.afinidades(usuario_id))
     
     # CASO: Usuario sin perfil -> devolver los más populares
-    if not perfil['generos']:
-        # Calcular score de popularidad combinando valoración + votos
-        # Prioriza libros bien valorados con muchos votos
-        import math
-        
-        def score_popularidad(libro):
-            valoracion = libro.get('valoracion', 0) or 0
-            num_votos = libro.get('num_votos', 0) or 0
-            # Multiplicamos valoración por log de votos para balancear
-            return valoracion * math.log10(num_votos + 1)
+    if not perfil['generos'] and not len(filas_cf):
+        # Ranking precalculado por generación: basta saltarse los libros excluidos
+        filas = matriz.orden_populares[:n + len(perfil['excluidos'])]
+        filas = filas[~_mascara_excluidos(matriz, perfil['excluidos'], filas)][:n]
         
-        libros_ordenados = sorted(
-            todos_libros,
-            key=score_popularidad,
-            reverse=True
-        )
-        
-        # Excluir libros ya en la librería
         recomendaciones = []
-        for libro in libros_ordenados:
-            titulo_lower = libro.get('titulo', '').lower().strip()
-            if titulo_lower not in perfil['titulos_leidos']:
-                libro_rec = dict(libro)
-                # Score basado en popularidad real
-                libro_rec['score'] = round(score_popularidad(libro) * 10, 1)
-                libro_rec['motivo'] = 'Popular'
-                recomendaciones.append(libro_rec)
-                
-                if len(recomendaciones) >= n:
-                    break
+        for i in filas:
+            libro_rec = dict(matriz.libros[i])
+            # Score basado en popularidad real
+            libro_rec['score'] = round(float(matriz.score_populares[i]) * 10, 1)
+            libro_rec['motivo'] = 'Popular'
+            recomendaciones.append(libro_rec)
         
         return recomendaciones
     
-    # CASO: Usuario con perfil -> calcular scores personalizados
-    candidatos = []
-    
-    for libro in todos_libros:
-        titulo_lower = libro.get('titulo', '').lower().strip()
-        
-        # Excluir libros ya en la librería del usuario
-        if titulo_lower in perfil['titulos_leidos']:
-            continue
-        
-        # Calcular score
-        score = calcular_score(libro, perfil)
-        
-        # Solo incluir si tiene alguna relevancia
-        if score > 0:
-            libro_rec = dict(libro)
-            libro_rec['score'] = round(score, 1)
-            libro_rec['motivo'] = obtener_motivo(libro, perfil)
-            candidatos.append(libro_rec)
-    
-    # Ordenar por score descendente
-    candidatos.sort(key=lambda x: x['score'], reverse=True)
-    
-    return candidatos[:n]
+    # CASO: Usuario con perfil -> puntuar solo los libros que pueden ganar
+    # (los vecinos colaborativos se añaden a los candidatos)
+    filas = filas_candidatas(matriz, perfil, n)
+    if len(filas_cf):
+        filas = np.union1d(filas, filas_cf)
+    scores = puntuar_catalogo(matriz, perfil, filas)
+    
+    # Mezcla con el filtrado colaborativo
+    motivos_cf = {}
+    if len(filas_cf):
+        scores, aporte_cf = mezclar_scores(filas, scores, filas_cf, scores_cf, peso_colaborativo())
+        # El motivo es el libro valorado si el colaborativo aporta más que el contenido
+        for fila, origen in zip(filas_cf, origenes_cf):
+            j = np.searchsorted(filas, fila)
+            if origen >= 0 and aporte_cf[j] >= scores[j] - aporte_cf[j]:
+                motivos_cf[int(fila)] = f"Porque te gustó {matriz.libros[origen].get('titulo', '')}"
+    
+    # Excluir libros ya en la librería y los que no tienen ninguna relevancia
+    validos = (scores > 0) & ~_mascara_excluidos(matriz, perfil['excluidos'], filas)
+    
+    # Solo se materializan los libros ganadores
+    recomendaciones = []
+    for i, score in zip(*seleccionar_top(scores[validos], filas[validos], n)):
+        libro = matriz.libros[i]
+        libro_rec = dict(libro)
+        libro_rec['score'] = round(float(score), 1)
+        libro_rec['motivo'] = motivos_cf.get(int(i)) or obtener_motivo(libro, perfil)
+        recomendaciones.append(libro_rec)
+    
+    return recomendaciones
 
 
 # ============================================================================
@@ -293,11 +638,12 @@ def obtener_recomendaciones_para_vista(usuario_id, n=4):
     return recomendar_libros(usuario_id, n=n)
 
 
-def diagnosticar_perfil(usuario_id):
+def diagnosticar_perfil(usuario_id, perfil=None):
     """
     Genera información del perfil para mostrar al usuario.
     """
-    perfil = construir_perfil_usuario(usuario_id)
+    if perfil is None:
+        perfil = construir_perfil_usuario(usuario_id)
     
     tiene_perfil = len(perfil['generos']) > 0
     
@@ -315,6 +661,136 @@ def diagnosticar_perfil(usuario_id):
     }
 
 
+# ============================================================================
+# CACHÉ DE RECOMENDACIONES
+# ============================================================================
+
+# Con la caché por defecto (LocMemCache) cada proceso tiene la suya; con una
+# caché compartida (Redis, Memcached) la invalidación llega a todos los workers.
+CACHE_RECOMENDACIONES_TIMEOUT = 60 * 60
+
+
+def _clave_recomendaciones(usuario_id):
+    return f"recomendaciones:{usuario_id}"
+
+
+def _clave_version(usuario_id):
+    return f"recomendaciones:version:{usuario_id}"
+
+
+def _version_usuario(usuario_id):
+    """
+    Versión actual de la librería del usuario en la caché.
+
+    Si se ha perdido (expulsada o nunca creada) se genera una nueva, de forma
+    que ninguna entrada guardada antes pueda darse por válida.
+    """
+    clave = _clave_version(usuario_id)
+    version = cache.get(clave)
+    if version is None:
+        cache.add(clave, time.time_ns(), None)
+        version = cache.get(clave)
+    return version
+
+
+def invalidar_recomendaciones(usuario_id):
+    """Invalida las recomendaciones cacheadas de un usuario"""
+    cache.set(_clave_version(usuario_id), time.time_ns(), None)
+
+
+def version_vecinos(modo=None):
+    """
+    Versión de los vecinos colaborativos que usa el modo (por defecto el
+    configurado): None en modo 'contenido', que no los usa, y así no hace
+    falta consultarla.
+    """
+    if (modo or modo_recomendacion()) != 'mixto':
+        return None
+    return colaborativo.version_vecinos()
+
+
+def firma_recomendaciones():
+    """
+    Modo de recomendación y versión de los vecinos colaborativos: lo que,
+    además del índice y la librería del usuario, cambia las recomendaciones.
+    """
+    modo = modo_recomendacion()
+    return f"{modo}:{version_vecinos(modo)}"
+
+
+def _version_perfil(usuario_id):
+    """
+    Versión del perfil guardado (PerfilUsuario.actualizado). Se lee de la
+    base de datos, así que refleja también las reconstrucciones hechas en
+    otros procesos. Si el usuario aún no tiene perfil, se crea.
+    """
+    actualizado = (PerfilUsuario.objects.filter(usuario_id=usuario_id)
+                   .values_list('actualizado', flat=True).first())
+    if actualizado is None:
+        actualizado = reconstruir_perfil(usuario_id).actualizado
+    return actualizado
+
+
+def _recomendaciones_precalculadas(usuario_id, generacion, n, modo, vecinos, version_perfil):
+    """
+    (recomendaciones, perfil_info) guardadas por precompute_recommendations,
+    o None si no existen o se calcularon con otro índice, otro modo, otros
+    vecinos u otro perfil.
+    """
+    fila = RecomendacionPrecalculada.objects.filter(
+        usuario_id=usuario_id,
+        generacion=generacion,
+        modo=modo,
+        version_vecinos=vecinos,
+        n__gte=n,
+        perfil_actualizado=version_perfil
+    ).values_list('recomendaciones', 'perfil_info').first()
+    if fila is None:
+        return None
+    recomendaciones, perfil_info = fila
+    return recomendaciones[:n], perfil_info
+
+
+def obtener_recomendaciones_y_perfil(usuario_id, n=4):
+    """
+    Retorna (recomendaciones, perfil_info) construyendo el perfil una sola vez.
+
+    Usa las recomendaciones precalculadas si siguen siendo válidas y si no
+    las calcula en el momento. El resultado se cachea por usuario y generación
+    del índice, y sirve también para pedir menos recomendaciones. Se invalida al cambiar la librería del usuario (señales de
+    LibroUsuario), al reconstruir su perfil, al reindexar, al cambiar de modo
+    o al recalcular los vecinos.
+    """
+    generacion = obtener_catalogo().generacion
+    modo = modo_recomendacion()
+    vecinos = version_vecinos(modo)
+    version_perfil = _version_perfil(usuario_id)
+    version = (_version_usuario(usuario_id), version_perfil, modo, vecinos)
+
+    entrada = cache.get(_clave_recomendaciones(usuario_id))
+    if (entrada and entrada['generacion'] == generacion
+            and entrada['version'] == version and entrada['n'] >= n):
+        return entrada['recomendaciones'][:n], entrada['perfil_info']
+
+    precalculadas = _recomendaciones_precalculadas(usuario_id, generacion, n, modo, vecinos, version_perfil)
+    if precalculadas is not None:
+        recomendaciones, perfil_info = precalculadas
+    else:
+        perfil = construir_perfil_usuario(usuario_id)
+        recomendaciones = recomendar_libros(usuario_id, n=n, perfil=perfil, modo=modo)
+        perfil_info = diagnosticar_perfil(usuario_id, perfil=perfil)
+
+    cache.set(_clave_recomendaciones(usuario_id), {
+        'generacion': generacion,
+        'version': version,
+        'n': n,
+        'recomendaciones': recomendaciones,
+        'perfil_info': perfil_info,
+    }, CACHE_RECOMENDACIONES_TIMEOUT)
+
+    return recomendaciones, perfil_info
+
+
 # ============================================================================
 # PRUEBAS
 # ============================================================================
@@ -1,9 +1,13 @@
 # scraping.py
 from bs4 import BeautifulSoup
-import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import re
 import os
 import ssl
+import sys
+from . import extraccion
+from .descargas import Descargador, cache_http
 from .generos import normalizar_genero_quelibroleo, normalizar_genero_lecturalia
 
 # Evitar error SSL
@@ -11,9 +15,19 @@ if (not os.environ.get('PYTHONHTTPSVERIFY', '') and
     getattr(ssl, '_create_unverified_context', None)):
     ssl._create_default_https_context = ssl._create_unverified_context
 
+URL_LECTURALIA = 'https://www.lecturalia.com'
+URL_QUELIBROLEO = 'https://quelibroleo.com'
+
 PAGINAS_LECTURALIA = 2
 PAGINAS_QUELIBROLEO = 3
 
+# Incrementar al cambiar los parsers para no reutilizar resultados cacheados
+VERSION_PARSEO = 1
+
+# Motor de parseo: 'lxml' (main/extraccion.py, XPath precompilados) o
+# 'bs4' (BeautifulSoup, las funciones parsear_* de este módulo). Dan el mismo resultado.
+MOTOR_EXTRACCION = 'lxml'
+
 # Lista de géneros de QueLibroLeo (17 géneros -> 3 páginas / género)
 GENEROS_QUELIBROLEO = [
     'biografias-memorias',
@@ -36,193 +50,167 @@ GENEROS_QUELIBROLEO = [
 ]
 
 
-def extraer_libros_quelibroleo(generos=None):
-    """Extrae libros mejor valorados de QueLibroLeo por género
-    
-    Args:
-        generos: Lista de géneros a extraer. Si es None, extrae todos.
-    """
+def url_listado_quelibroleo(genero, pagina):
+    """URL de una página del ranking de un género de QueLibroLeo"""
+    return f"{URL_QUELIBROLEO}/mejores-genero/{genero}?sort=&page={pagina}"
+
+
+def url_listado_lecturalia(pagina):
+    """URL de una página del ranking de Lecturalia"""
+    return f"{URL_LECTURALIA}/libros/va/mejor-valorados/{pagina}"
+
+
+def parsear_listado_quelibroleo(html, genero):
+    """Extrae los libros de una página de listado de QueLibroLeo"""
     lista = []
-    generos_a_extraer = generos if generos else GENEROS_QUELIBROLEO
+    s = BeautifulSoup(html, 'lxml')
     
-    for genero in generos_a_extraer:
-        print(f"  Extrayendo género: {genero}...")
-        
-        for p in range(1, PAGINAS_QUELIBROLEO + 1):
-            url = f"https://quelibroleo.com/mejores-genero/{genero}?sort=&page={p}"
+    # Los libros están en: div.item
+    items = s.find_all('div', class_='item')
+    
+    for item in items:
+        try:
+            # URL del libro
+            enlace = item.find('a', class_='left_side')
+            if not enlace:
+                continue
+            url_libro = enlace.get('href', '')
             
-            try:
-                req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-                f = urllib.request.urlopen(req)
-                s = BeautifulSoup(f, 'lxml')
-                
-                # Los libros están en: div.item
-                items = s.find_all('div', class_='item')
-                
-                for item in items:
-                    try:
-                        # URL del libro
-                        enlace = item.find('a', class_='left_side')
-                        if not enlace:
-                            continue
-                        url_libro = enlace.get('href', '')
-                        
-                        # Portada: img dentro de a.left_side
-                        portada = ''
-                        img_tag = enlace.find('img')
-                        if img_tag:
-                            portada = img_tag.get('src', '')
-                        
-                        # Título: div.col-lg-8 a span b
-                        col_info = item.find('div', class_='col-lg-8')
-                        if not col_info:
-                            continue
-                        
-                        titulo_tag = col_info.find('b')
-                        titulo = titulo_tag.get_text(strip=True) if titulo_tag else ''
-                        
-                        # Autor: div.col-lg-8 small a
-                        autor_tag = col_info.find('small')
-                        if autor_tag:
-                            autor_link = autor_tag.find('a')
-                            autor = autor_link.get_text(strip=True) if autor_link else autor_tag.get_text(strip=True)
-                        else:
-                            autor = ''
-                        
-                        # Sinopsis: div.tab-pane div.text p
-                        sinopsis = ''
-                        text_div = item.find('div', class_='text')
-                        if text_div:
-                            p_tag = text_div.find('p')
-                            if p_tag:
-                                sinopsis = p_tag.get_text(strip=True)
-                                # Limpiar el enlace de "seguir leyendo"
-                                if sinopsis:
-                                    sinopsis = sinopsis.split('...')[0] + '...' if '...' in sinopsis else sinopsis
-                        if not sinopsis:
-                            sinopsis = 'No disponible'
-                        
-                        # Estadísticas: div.estadisticas
-                        estadisticas = item.find('div', class_='estadisticas')
-                        valoracion = 0.0
-                        num_votos = 0
-                        
-                        if estadisticas:
-                            # Nota media: span
-                            nota_span = estadisticas.find('span')
-                            if nota_span:
-                                nota_text = nota_span.get_text(strip=True).replace(',', '.')
-                                try:
-                                    valoracion = float(nota_text)
-                                except:
-                                    pass
-                            
-                            # Número de votos: i.numero_votos a
-                            votos_tag = estadisticas.find('i', class_='numero_votos')
-                            if votos_tag:
-                                votos_text = votos_tag.get_text(strip=True)
-                                num_votos = int(''.join(filter(str.isdigit, votos_text)))
-                        
-                        # Género normalizado usando el slug
-                        genero_normalizado = normalizar_genero_quelibroleo(genero)
-                        
-                        lista.append({
-                            'titulo': titulo,
-                            'autor': autor,
-                            'genero': genero_normalizado,
-                            'sinopsis': sinopsis,
-                            'valoracion': valoracion,
-                            'num_votos': num_votos,
-                            'url': url_libro,
-                            'portada': portada,
-                            'fuente': 'quelibroleo'
-                        })
-                        
-                    except Exception as e:
-                        print(f"    Error extrayendo libro: {e}")
-                        continue
-                        
-            except Exception as e:
-                print(f"    Error en página {p} de {genero}: {e}")
+            # Portada: img dentro de a.left_side
+            portada = ''
+            img_tag = enlace.find('img')
+            if img_tag:
+                portada = img_tag.get('src', '')
+            
+            # Título: div.col-lg-8 a span b
+            col_info = item.find('div', class_='col-lg-8')
+            if not col_info:
                 continue
+            
+            titulo_tag = col_info.find('b')
+            titulo = titulo_tag.get_text(strip=True) if titulo_tag else ''
+            
+            # Autor: div.col-lg-8 small a
+            autor_tag = col_info.find('small')
+            if autor_tag:
+                autor_link = autor_tag.find('a')
+                autor = autor_link.get_text(strip=True) if autor_link else autor_tag.get_text(strip=True)
+            else:
+                autor = ''
+            
+            # Sinopsis: div.tab-pane div.text p
+            sinopsis = ''
+            text_div = item.find('div', class_='text')
+            if text_div:
+                p_tag = text_div.find('p')
+                if p_tag:
+                    sinopsis = p_tag.get_text(strip=True)
+                    # Limpiar el enlace de "seguir leyendo"
+                    if sinopsis:
+                        sinopsis = sinopsis.split('...')[0] + '...' if '...' in sinopsis else sinopsis
+            if not sinopsis:
+                sinopsis = 'No disponible'
+            
+            # Estadísticas: div.estadisticas
+            estadisticas = item.find('div', class_='estadisticas')
+            valoracion = 0.0
+            num_votos = 0
+            
+            if estadisticas:
+                # Nota media: span
+                nota_span = estadisticas.find('span')
+                if nota_span:
+                    nota_text = nota_span.get_text(strip=True).replace(',', '.')
+                    try:
+                        valoracion = float(nota_text)
+                    except:
+                        pass
+                
+                # Número de votos: i.numero_votos a
+                votos_tag = estadisticas.find('i', class_='numero_votos')
+                if votos_tag:
+                    votos_text = votos_tag.get_text(strip=True)
+                    num_votos = int(''.join(filter(str.isdigit, votos_text)))
+            
+            # Género normalizado usando el slug
+            genero_normalizado = normalizar_genero_quelibroleo(genero)
+            
+            lista.append({
+                'titulo': titulo,
+                'autor': autor,
+                'genero': genero_normalizado,
+                'sinopsis': sinopsis,
+                'valoracion': valoracion,
+                'num_votos': num_votos,
+                'url': url_libro,
+                'portada': portada,
+                'fuente': 'quelibroleo'
+            })
+            
+        except Exception as e:
+            print(f"    Error extrayendo libro: {e}")
+            continue
     
     return lista
 
 
-def extraer_libros_lecturalia():
-    """Extrae libros mejor valorados de Lecturalia (listado + detalle de cada libro)"""
+def parsear_listado_lecturalia(html):
+    """
+    Extrae los libros de una página de listado de Lecturalia.
+
+    Retorna None si la página no contiene la lista de libros. Los libros no
+    incluyen aún los datos de la página de detalle.
+    """
     lista = []
+    s = BeautifulSoup(html, 'lxml')
     
-    for p in range(1, PAGINAS_LECTURALIA + 1):
-        url = f"https://www.lecturalia.com/libros/va/mejor-valorados/{p}"
-        
-        print(f"  Extrayendo página {p} de Lecturalia...")
-        
+    # Los libros están en: div.datalist.datalist--img > ul > li
+    datalist = s.find('div', class_='datalist--img')
+    if not datalist:
+        return None
+    
+    libros_li = datalist.find_all('li')
+    
+    for li in libros_li:
         try:
-            req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-            f = urllib.request.urlopen(req)
-            s = BeautifulSoup(f, 'lxml')
-            
-            # Los libros están en: div.datalist.datalist--img > ul > li
-            datalist = s.find('div', class_='datalist--img')
-            if not datalist:
-                print(f"  No se encontró la lista de libros en página {p}")
+            # Buscar los enlaces del libro
+            enlaces = li.find_all('a')
+            if len(enlaces) < 2:
                 continue
             
-            libros_li = datalist.find_all('li')
+            # Portada: div.cover img
+            portada = ''
+            cover_div = li.find('div', class_='cover')
+            if cover_div:
+                img_tag = cover_div.find('img')
+                if img_tag:
+                    portada = img_tag.get('src', '')
+            
+            # Primer enlace: título y URL del libro
+            titulo = enlaces[0].get_text(strip=True)
+            url_libro = enlaces[0].get('href', '')
+            if not url_libro.startswith('http'):
+                url_libro = URL_LECTURALIA + url_libro
+            
+            # Segundo enlace: autor
+            autor = enlaces[1].get_text(strip=True)
+            
+            lista.append({
+                'titulo': titulo,
+                'autor': autor,
+                'url': url_libro,
+                'portada': portada,
+            })
             
-            for li in libros_li:
-                try:
-                    # Buscar los enlaces del libro
-                    enlaces = li.find_all('a')
-                    if len(enlaces) < 2:
-                        continue
-                    
-                    # Portada: div.cover img
-                    portada = ''
-                    cover_div = li.find('div', class_='cover')
-                    if cover_div:
-                        img_tag = cover_div.find('img')
-                        if img_tag:
-                            portada = img_tag.get('src', '')
-                    
-                    # Primer enlace: título y URL del libro
-                    titulo = enlaces[0].get_text(strip=True)
-                    url_libro = enlaces[0].get('href', '')
-                    if not url_libro.startswith('http'):
-                        url_libro = 'https://www.lecturalia.com' + url_libro
-                    
-                    # Segundo enlace: autor
-                    autor = enlaces[1].get_text(strip=True)
-                    
-                    # Extraer detalles adicionales de la página del libro
-                    libro_detalle = extraer_detalle_libro(url_libro)
-                    
-                    lista.append({
-                        'titulo': titulo,
-                        'autor': autor,
-                        'genero': normalizar_genero_lecturalia(libro_detalle.get('genero', 'Sin género')),
-                        'sinopsis': libro_detalle.get('sinopsis', ''),
-                        'valoracion': libro_detalle.get('valoracion', 0.0),
-                        'num_votos': libro_detalle.get('num_votos', 0),
-                        'url': url_libro,
-                        'portada': portada,
-                        'fuente': 'lecturalia'
-                    })
-                    
-                except Exception as e:
-                    print(f"  Error extrayendo libro: {e}")
-                    continue
-                    
         except Exception as e:
-            print(f"  Error en página {p}: {e}")
+            print(f"  Error extrayendo libro: {e}")
             continue
     
     return lista
 
 
-def extraer_detalle_libro(url_libro):
-    """Extrae detalles adicionales de la página individual del libro"""
+def parsear_detalle_libro(html):
+    """Extrae género, sinopsis, valoración y votos de la página de un libro de Lecturalia"""
     detalle = {
         'genero': 'Sin género',
         'sinopsis': '',
@@ -230,104 +218,303 @@ def extraer_detalle_libro(url_libro):
         'num_votos': 0
     }
     
+    s = BeautifulSoup(html, 'lxml')
+    
+    # Buscar los datos en la ficha del libro (ul dentro de profile__data)
+    profile_data = s.find('div', class_='profile__data')
+    if profile_data:
+        items = profile_data.find_all('li')
+        for item in items:
+            texto = item.get_text()
+            
+            # Género/Temas: buscar el enlace después de "Temas:"
+            if 'Temas:' in texto:
+                enlace_genero = item.find('a')
+                if enlace_genero:
+                    detalle['genero'] = enlace_genero.get_text(strip=True)
+            
+            # Nota media: formato "8 / 10 (151 votos)"
+            if 'Nota media:' in texto:
+                # Extraer número antes de " / 10"
+                match = re.search(r'(\d+(?:[.,]\d+)?)\s*/\s*10\s*\((\d+)\s*votos?\)', texto)
+                if match:
+                    nota = match.group(1).replace(',', '.')
+                    detalle['valoracion'] = float(nota)
+                    detalle['num_votos'] = int(match.group(2))
+    
+    # Sinopsis: texto dentro de div.profile__text div.text
+    profile_text = s.find('div', class_='profile__text')
+    if profile_text:
+        text_div = profile_text.find('div', class_='text')
+        if text_div:
+            # Eliminar elementos que no queremos (h2, divs de publicidad, participantes)
+            for elemento in text_div.find_all(['h2', 'div']):
+                elemento.decompose()
+            
+            # Eliminar el párrafo de "Ha participado en esta ficha"
+            for p in text_div.find_all('p', class_='participate'):
+                p.decompose()
+            
+            # Obtener todo el texto restante
+            sinopsis = text_div.get_text(separator=' ', strip=True)
+            
+            detalle['sinopsis'] = sinopsis.strip() if sinopsis.strip() else 'No disponible'
+    else:
+        detalle['sinopsis'] = 'No disponible'
+    
+    return detalle
+
+
+def iterar_libros_quelibroleo(generos=None, descargador=None):
+    """Genera los libros mejor valorados de QueLibroLeo a medida que se parsean
+    
+    Args:
+        generos: Lista de géneros a extraer. Si es None, extrae todos.
+        descargador: Descargador compartido (si es None se crea uno)
+    """
+    generos_a_extraer = generos if generos else GENEROS_QUELIBROLEO
+    
+    paginas = [(genero, p) for genero in generos_a_extraer for p in range(1, PAGINAS_QUELIBROLEO + 1)]
+    urls = (url_listado_quelibroleo(genero, p) for genero, p in paginas)
+    
+    with _usar_descargador(descargador) as d:
+        # Las páginas se descargan en paralelo y se parsean en orden
+        for (genero, p), (url, html, error) in zip(paginas, d.descargar_varias(urls, 'listado')):
+            if p == 1:
+                print(f"  Extrayendo género: {genero}...")
+            if error:
+                print(f"    Error en página {p} de {genero}: {error}")
+                continue
+            try:
+                parsear = _parser('listado_quelibroleo')
+                libros_pagina = _parsear(d, f'quelibroleo-{genero}', html, lambda h, g=genero: parsear(h, g))
+            except Exception as e:
+                print(f"    Error en página {p} de {genero}: {e}")
+                continue
+            yield from libros_pagina
+
+
+def extraer_libros_quelibroleo(generos=None, descargador=None):
+    """Extrae libros mejor valorados de QueLibroLeo por género
+    
+    Args:
+        generos: Lista de géneros a extraer. Si es None, extrae todos.
+        descargador: Descargador compartido (si es None se crea uno)
+    """
+    return list(iterar_libros_quelibroleo(generos, descargador))
+
+
+def iterar_libros_lecturalia(descargador=None):
+    """Genera los libros mejor valorados de Lecturalia (listado + detalle) a medida que se parsean
+    
+    Los listados se descargan por adelantado y, de cada página, las fichas de
+    sus libros en paralelo; solo se retiene en memoria una página cada vez.
+    """
+    with _usar_descargador(descargador) as d:
+        urls = (url_listado_lecturalia(p) for p in range(1, PAGINAS_LECTURALIA + 1))
+        for p, (url, html, error) in enumerate(d.descargar_varias(urls, 'listado'), start=1):
+            print(f"  Extrayendo página {p} de Lecturalia...")
+            if error:
+                print(f"  Error en página {p}: {error}")
+                continue
+            try:
+                parciales = _parsear(d, 'lecturalia-listado', html, _parser('listado_lecturalia'))
+            except Exception as e:
+                print(f"  Error en página {p}: {e}")
+                continue
+            if parciales is None:
+                print(f"  No se encontró la lista de libros en página {p}")
+                continue
+            
+            # Páginas de detalle de los libros de esta página en paralelo
+            detalles = d.descargar_varias([libro['url'] for libro in parciales], 'detalle')
+            for libro, (url_libro, html_detalle, error_detalle) in zip(parciales, detalles):
+                libro_detalle = _detalle_desde_html(url_libro, html_detalle, error_detalle, d)
+                yield {
+                    'titulo': libro['titulo'],
+                    'autor': libro['autor'],
+                    'genero': normalizar_genero_lecturalia(libro_detalle.get('genero', 'Sin género')),
+                    'sinopsis': libro_detalle.get('sinopsis', ''),
+                    'valoracion': libro_detalle.get('valoracion', 0.0),
+                    'num_votos': libro_detalle.get('num_votos', 0),
+                    'url': libro['url'],
+                    'portada': libro['portada'],
+                    'fuente': 'lecturalia'
+                }
+
+
+def extraer_libros_lecturalia(descargador=None):
+    """Extrae libros mejor valorados de Lecturalia (listado + detalle de cada libro)"""
+    return list(iterar_libros_lecturalia(descargador))
+
+
+def _parser(nombre):
+    """Función parsear_<nombre> del motor indicado en MOTOR_EXTRACCION"""
+    modulo = extraccion if MOTOR_EXTRACCION == 'lxml' else sys.modules[__name__]
+    return getattr(modulo, f'parsear_{nombre}')
+
+
+def _parsear(descargador, tipo, html, funcion):
+    """Parsea una página reutilizando el resultado cacheado si su contenido no ha cambiado"""
+    return descargador.parsear(f"{tipo}-v{VERSION_PARSEO}", html, funcion)
+
+
+def _detalle_desde_html(url_libro, html, error=None, descargador=None):
+    """Parsea una página de detalle descargada; en caso de error usa los valores por defecto"""
     try:
-        req = urllib.request.Request(url_libro, headers={'User-Agent': 'Mozilla/5.0'})
-        f = urllib.request.urlopen(req)
-        s = BeautifulSoup(f, 'lxml')
-        
-        # Buscar los datos en la ficha del libro (ul dentro de profile__data)
-        profile_data = s.find('div', class_='profile__data')
-        if profile_data:
-            items = profile_data.find_all('li')
-            for item in items:
-                texto = item.get_text()
-                
-                # Género/Temas: buscar el enlace después de "Temas:"
-                if 'Temas:' in texto:
-                    enlace_genero = item.find('a')
-                    if enlace_genero:
-                        detalle['genero'] = enlace_genero.get_text(strip=True)
-                
-                # Nota media: formato "8 / 10 (151 votos)"
-                if 'Nota media:' in texto:
-                    # Extraer número antes de " / 10"
-                    match = re.search(r'(\d+(?:[.,]\d+)?)\s*/\s*10\s*\((\d+)\s*votos?\)', texto)
-                    if match:
-                        nota = match.group(1).replace(',', '.')
-                        detalle['valoracion'] = float(nota)
-                        detalle['num_votos'] = int(match.group(2))
-        
-        # Sinopsis: texto dentro de div.profile__text div.text
-        profile_text = s.find('div', class_='profile__text')
-        if profile_text:
-            text_div = profile_text.find('div', class_='text')
-            if text_div:
-                # Eliminar elementos que no queremos (h2, divs de publicidad, participantes)
-                for elemento in text_div.find_all(['h2', 'div']):
-                    elemento.decompose()
-                
-                # Eliminar el párrafo de "Ha participado en esta ficha"
-                for p in text_div.find_all('p', class_='participate'):
-                    p.decompose()
-                
-                # Obtener todo el texto restante
-                sinopsis = text_div.get_text(separator=' ', strip=True)
-                
-                detalle['sinopsis'] = sinopsis.strip() if sinopsis.strip() else 'No disponible'
-        else:
-            detalle['sinopsis'] = 'No disponible'
-        
+        if error:
+            raise error
+        if descargador:
+            return _parsear(descargador, 'lecturalia-detalle', html, _parser('detalle_libro'))
+        return _parser('detalle_libro')(html)
     except Exception as e:
         print(f"  Error extrayendo detalle de {url_libro}: {e}")
-    
-    return detalle
+        return {'genero': 'Sin género', 'sinopsis': '', 'valoracion': 0.0, 'num_votos': 0}
 
 
-def extraer_todos_libros(fuente='todo', generos_quelibroleo=None):
+def extraer_detalle_libro(url_libro):
+    """Extrae detalles adicionales de la página individual del libro"""
+    with Descargador(cache=cache_http()) as d:
+        try:
+            html = d.descargar(url_libro, 'detalle')
+        except Exception as e:
+            return _detalle_desde_html(url_libro, None, e)
+        return _detalle_desde_html(url_libro, html, descargador=d)
+
+
+@contextmanager
+def _usar_descargador(descargador):
+    """Usa el descargador recibido o crea uno temporal"""
+    if descargador is not None:
+        yield descargador
+    else:
+        with Descargador(cache=cache_http()) as d:
+            yield d
+
+
+def extraer_todos_libros(fuente='todo', generos_quelibroleo=None, al_terminar_fuente=None):
     """Extrae libros de las fuentes especificadas
     
+    Las dos fuentes se extraen a la vez (son hosts distintos) compartiendo el
+    mismo pool de descargas; el resultado mantiene Lecturalia primero.
+    
     Args:
         fuente: 'todo', 'lecturalia' o 'quelibroleo'
         generos_quelibroleo: Lista de géneros para QueLibroLeo (solo si fuente incluye quelibroleo)
+        al_terminar_fuente: Función opcional llamada con (nombre_fuente, num_libros) al terminar cada fuente
     """
     libros = []
     
-    # Primero Lecturalia 
-    if fuente in ['todo', 'lecturalia']:
-        print("Extrayendo de Lecturalia...")
-        libros.extend(extraer_libros_lecturalia())
-    
-    # Luego QueLibroLeo 
-    if fuente in ['todo', 'quelibroleo']:
-        print("Extrayendo de QueLibroLeo...")
-        libros.extend(extraer_libros_quelibroleo(generos_quelibroleo))
+    with Descargador(cache=cache_http()) as d, ThreadPoolExecutor(max_workers=2) as fuentes:
+        tareas = []
+        
+        # Primero Lecturalia 
+        if fuente in ['todo', 'lecturalia']:
+            print("Extrayendo de Lecturalia...")
+            tareas.append(('lecturalia', fuentes.submit(extraer_libros_lecturalia, d)))
+        
+        # Luego QueLibroLeo 
+        if fuente in ['todo', 'quelibroleo']:
+            print("Extrayendo de QueLibroLeo...")
+            tareas.append(('quelibroleo', fuentes.submit(extraer_libros_quelibroleo, generos_quelibroleo, d)))
+        
+        for nombre, tarea in tareas:
+            libros_fuente = tarea.result()
+            libros.extend(libros_fuente)
+            if al_terminar_fuente:
+                al_terminar_fuente(nombre, len(libros_fuente))
     
+    _mostrar_estadisticas(d)
     print(f"Total libros extraídos: {len(libros)}")
+    _limpiar_cache(d)
     return libros
 
 
-def filtrar_duplicados(libros):
-    """Filtra libros duplicados basándose en título normalizado
+def iterar_todos_libros(fuente='todo', generos_quelibroleo=None, al_terminar_fuente=None):
+    """Genera los libros de las fuentes especificadas a medida que se extraen
     
-    Mantiene el primer libro encontrado (prioriza Lecturalia si se extrae primero)
+    Versión en streaming de extraer_todos_libros: no acumula los libros, así
+    que la memoria no crece con el número de páginas. Las fuentes se recorren
+    una detrás de otra (Lecturalia primero, para que filtrar_duplicados_stream
+    le dé prioridad); dentro de cada fuente las descargas siguen en paralelo.
+    
+    Args: los mismos que extraer_todos_libros
+    """
+    fuentes = []
+    if fuente in ['todo', 'lecturalia']:
+        fuentes.append(('lecturalia', 'Lecturalia', lambda d: iterar_libros_lecturalia(d)))
+    if fuente in ['todo', 'quelibroleo']:
+        fuentes.append(('quelibroleo', 'QueLibroLeo', lambda d: iterar_libros_quelibroleo(generos_quelibroleo, d)))
+    
+    total = 0
+    with Descargador(cache=cache_http()) as d:
+        for nombre, titulo, iterar in fuentes:
+            print(f"Extrayendo de {titulo}...")
+            num_libros = 0
+            for libro in iterar(d):
+                num_libros += 1
+                yield libro
+            total += num_libros
+            if al_terminar_fuente:
+                al_terminar_fuente(nombre, num_libros)
+    
+    _mostrar_estadisticas(d)
+    print(f"Total libros extraídos: {total}")
+    _limpiar_cache(d)
+
+
+def _mostrar_estadisticas(descargador):
+    estadisticas = descargador.estadisticas
+    print(f"Páginas: {estadisticas['descargadas']} descargadas, "
+          f"{estadisticas['revalidadas']} sin cambios (304), {estadisticas['cache']} desde caché")
+
+
+def _limpiar_cache(descargador):
+    """Al terminar una extracción, borra de la caché HTTP lo que ya no se usa"""
+    if descargador.cache is None:
+        return
+    borrados = descargador.cache.limpiar(version_parseo=VERSION_PARSEO)
+    if borrados:
+        print(f"Caché HTTP: {borrados['entradas']} entradas, {borrados['cuerpos']} páginas y "
+              f"{borrados['parseados']} parseos sin uso eliminados")
+
+
+def normalizar_titulo(titulo):
+    """Título en minúsculas, sin puntuación y con los espacios normalizados"""
+    titulo_norm = titulo.lower().strip()
+    titulo_norm = re.sub(r'[^a-záéíóúñü0-9\s]', '', titulo_norm)
+    return ' '.join(titulo_norm.split())
+
+
+def filtrar_duplicados_stream(libros, estadisticas=None):
+    """Versión en streaming de filtrar_duplicados: genera los libros no repetidos
+    
+    Solo guarda los títulos normalizados ya vistos, no los libros. Si se pasa
+    un dict `estadisticas`, se va actualizando su clave 'duplicados'.
     """
     vistos = set()
-    unicos = []
-    duplicados = 0
+    if estadisticas is not None:
+        estadisticas.setdefault('duplicados', 0)
     
     for libro in libros:
-        # Normalizar título: minúsculas, sin espacios extra, sin puntuación
-        titulo_norm = libro['titulo'].lower().strip()
-        titulo_norm = re.sub(r'[^a-záéíóúñü0-9\s]', '', titulo_norm)
-        titulo_norm = ' '.join(titulo_norm.split())  # Normalizar espacios
-        
-        if titulo_norm not in vistos:
-            vistos.add(titulo_norm)
-            unicos.append(libro)
-        else:
-            duplicados += 1
+        titulo_norm = normalizar_titulo(libro['titulo'])
+        if titulo_norm in vistos:
+            if estadisticas is not None:
+                estadisticas['duplicados'] += 1
+            continue
+        vistos.add(titulo_norm)
+        yield libro
+
+
+def filtrar_duplicados(libros):
+    """Filtra libros duplicados basándose en título normalizado
+    
+    Mantiene el primer libro encontrado (prioriza Lecturalia si se extrae primero)
+    """
+    estadisticas = {}
+    unicos = list(filtrar_duplicados_stream(libros, estadisticas))
     
-    print(f"Duplicados eliminados: {duplicados}")
+    print(f"Duplicados eliminados: {estadisticas['duplicados']}")
     print(f"Libros únicos: {len(unicos)}")
     return unicos
 
@@ -380,28 +567,59 @@ def mostrar_libros(libros):
         print(f"  Sinopsis: {sinopsis}...")
 
 
-def ejecutar_scraping():
+def ejecutar_scraping(progreso=None):
     """
     Ejecuta el scraping completo y actualiza el índice.
+    
+    Los libros pasan en streaming de la extracción al filtrado de duplicados
+    y de ahí al índice, que hace commit cada TAM_LOTE_INDEXADO libros: la
+    memoria no depende del número de páginas y los primeros libros se pueden
+    buscar antes de que termine.
+    
+    Args:
+        progreso: Función opcional llamada con (porcentaje, mensaje, por_fuente)
+                  en cada fase, para informar del avance (ver main/tareas.py)
     """
-    from main.whoosh_utils import indexar_libros
+    from main.models import Libro
+    from main.whoosh_utils import indexar_incremental, obtener_catalogo, TAM_LOTE_INDEXADO
     
-    print("Iniciando scraping...")
+    por_fuente = {}
+    filtrado = {}
     
-    # Extraer libros de todas las fuentes
-    libros = extraer_todos_libros('todo')
-    libros = filtrar_duplicados(libros)
+    def notificar(porcentaje, mensaje):
+        if progreso:
+            progreso(porcentaje, mensaje, dict(por_fuente))
+    
+    def fuente_terminada(nombre, num_libros):
+        por_fuente[nombre] = num_libros
+        notificar(10 + 40 * len(por_fuente), f"{nombre}: {num_libros} libros extraídos")
+    
+    def lote_indexado(cambios):
+        escritos = cambios['nuevos'] + cambios['actualizados']
+        notificar(10 + 40 * len(por_fuente), f"{escritos} libros nuevos o actualizados indexados")
+    
+    print("Iniciando scraping...")
+    notificar(5, "Extrayendo e indexando libros de Lecturalia y QueLibroLeo")
     
-    print(f"{len(libros)} libros extraídos")
+    # Extraer -> quitar duplicados -> indexar, libro a libro
+    libros = iterar_todos_libros('todo', al_terminar_fuente=fuente_terminada)
+    libros = filtrar_duplicados_stream(libros, filtrado)
+    cambios = indexar_incremental(libros, tam_lote=TAM_LOTE_INDEXADO, al_confirmar_lote=lote_indexado)
     
-    # Indexar libros (crea índice nuevo)
-    indexar_libros(libros)
+    total = sum(cambios[clave] for clave in ('nuevos', 'actualizados', 'sin_cambios'))
     
-    print(f"Índice actualizado con {len(libros)} libros")
+    # Copiar a la tabla Libro los datos actualizados del catálogo
+    if cambios['nuevos'] or cambios['actualizados']:
+        Libro.objects.sincronizar(obtener_catalogo().libros)
+    print(f"Duplicados eliminados: {filtrado.get('duplicados', 0)}")
+    print(f"Índice actualizado con {total} libros")
+    notificar(100, f"{total} libros indexados correctamente")
     
     return {
-        'total': len(libros),
-        'mensaje': f'{len(libros)} libros indexados correctamente'
+        'total': total,
+        'por_fuente': por_fuente,
+        'cambios': cambios,
+        'mensaje': f'{total} libros indexados correctamente'
     }
 
 
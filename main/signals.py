@@ -0,0 +1,69 @@
+# signals.py
+import threading
+from contextlib import contextmanager
+
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from main.models import LibroUsuario
+from main.recommender import actualizar_perfil, invalidar_recomendaciones
+
+_estado_hilo = threading.local()
+
+
+@contextmanager
+def sin_actualizar_perfil():
+    """
+    Desactiva en este hilo la actualización del perfil por señales.
+
+    Para operaciones en bloque (ver main.libreria), que reconstruyen el
+    perfil una sola vez al terminar en lugar de actualizarlo fila a fila.
+    """
+    anterior = getattr(_estado_hilo, 'desactivado', False)
+    _estado_hilo.desactivado = True
+    try:
+        yield
+    finally:
+        _estado_hilo.desactivado = anterior
+
+
+def _desactivado():
+    return getattr(_estado_hilo, 'desactivado', False)
+
+
+def _estado_perfil(libro_usuario):
+    """Campos de un LibroUsuario que afectan al perfil"""
+    return {
+        'libro_id': libro_usuario.libro_id,
+        'estado': libro_usuario.estado,
+        'valoracion': libro_usuario.valoracion,
+    }
+
+
+@receiver(pre_save, sender=LibroUsuario)
+def libro_usuario_antes_de_guardar(sender, instance, **kwargs):
+    """Guarda el estado anterior del libro para actualizar el perfil por diferencia"""
+    if _desactivado():
+        return
+    anterior = None
+    if instance.pk:
+        anterior = LibroUsuario.objects.filter(pk=instance.pk).values('libro_id', 'estado', 'valoracion').first()
+    instance._estado_perfil_anterior = anterior
+
+
+@receiver(post_save, sender=LibroUsuario)
+def libro_usuario_guardado(sender, instance, **kwargs):
+    """Actualiza el perfil e invalida las recomendaciones cacheadas del dueño del libro"""
+    if _desactivado():
+        return
+    anterior = getattr(instance, '_estado_perfil_anterior', None)
+    actualizar_perfil(instance.usuario_id, anterior, _estado_perfil(instance))
+    invalidar_recomendaciones(instance.usuario_id)
+
+
+@receiver(post_delete, sender=LibroUsuario)
+def libro_usuario_eliminado(sender, instance, **kwargs):
+    """Quita el libro del perfil e invalida las recomendaciones cacheadas"""
+    if _desactivado():
+        return
+    actualizar_perfil(instance.usuario_id, _estado_perfil(instance), None)
+    invalidar_recomendaciones(instance.usuario_id)
@@ -0,0 +1,170 @@
+# tareas.py
+"""
+Cola de tareas en segundo plano respaldada por la base de datos.
+
+La vista de administración solo encola una TareaScraping; el comando
+`python manage.py procesar_tareas` la recoge, ejecuta el scraping fuera del
+ciclo de petición y va guardando el progreso para que la página de estado
+pueda consultarlo.
+
+Mientras ejecuta una tarea, el worker actualiza su latido desde un hilo
+cada INTERVALO_LATIDO, aunque el scraping pase mucho tiempo sin avanzar.
+Si un worker muere a mitad (reinicio, OOM), su tarea deja de latir y pasado
+TAREA_ABANDONADA se marca como error, de modo que se puede encolar otra.
+"""
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from main.models import TareaScraping
+
+# Tiempo sin latido tras el que una tarea en curso se da por abandonada
+TAREA_ABANDONADA = timedelta(minutes=30)
+
+# Segundos entre latidos de una tarea en curso (muy por debajo de TAREA_ABANDONADA)
+INTERVALO_LATIDO = 60
+
+
+def recuperar_abandonadas(limite=TAREA_ABANDONADA):
+    """
+    Marca como error las tareas en curso que llevan más de `limite` sin latir.
+
+    Returns:
+        int: Tareas recuperadas
+    """
+    ahora = timezone.now()
+    desde = ahora - limite
+    return TareaScraping.objects.filter(
+        Q(latido__lt=desde) | Q(latido__isnull=True, fecha_inicio__lt=desde),
+        estado='en_curso',
+    ).update(
+        estado='error',
+        mensaje='El worker dejó de responder: tarea abandonada',
+        fecha_fin=ahora,
+    )
+
+
+def encolar_scraping(usuario=None):
+    """
+    Encola un scraping, salvo que ya haya uno pendiente o en curso.
+
+    Returns:
+        tuple: (tarea, creada)
+    """
+    recuperar_abandonadas()
+    activa = TareaScraping.objects.filter(estado__in=['pendiente', 'en_curso']).first()
+    if activa:
+        return activa, False
+
+    tarea = TareaScraping.objects.create(
+        solicitada_por=usuario,
+        mensaje='En cola, esperando al worker'
+    )
+    return tarea, True
+
+
+def reclamar_siguiente():
+    """
+    Marca como en curso la tarea pendiente más antigua y la devuelve.
+
+    La actualización es condicional, así que si hay varios workers solo uno
+    consigue cada tarea. Retorna None si no hay tareas pendientes.
+    """
+    for tarea in TareaScraping.objects.filter(estado='pendiente').order_by('fecha_creacion'):
+        ahora = timezone.now()
+        reclamada = TareaScraping.objects.filter(pk=tarea.pk, estado='pendiente').update(
+            estado='en_curso',
+            fecha_inicio=ahora,
+            latido=ahora,
+            mensaje='Iniciando scraping'
+        )
+        if reclamada:
+            tarea.refresh_from_db()
+            return tarea
+    return None
+
+
+def latir(tarea_id):
+    """Actualiza el latido de una tarea si sigue en curso"""
+    TareaScraping.objects.filter(pk=tarea_id, estado='en_curso').update(latido=timezone.now())
+
+
+@contextmanager
+def latiendo(tarea_id, intervalo=None):
+    """Hace latir la tarea desde otro hilo mientras dura el bloque"""
+    parar = threading.Event()
+
+    def bucle():
+        try:
+            while not parar.wait(INTERVALO_LATIDO if intervalo is None else intervalo):
+                latir(tarea_id)
+        finally:
+            connection.close()
+
+    hilo = threading.Thread(target=bucle, name=f'latido-tarea-{tarea_id}', daemon=True)
+    hilo.start()
+    try:
+        yield
+    finally:
+        parar.set()
+        hilo.join()
+
+
+def ejecutar_tarea(tarea):
+    """Ejecuta una tarea ya reclamada y guarda su resultado"""
+    from main.scraping import ejecutar_scraping
+
+    def progreso(porcentaje, mensaje, por_fuente):
+        TareaScraping.objects.filter(pk=tarea.pk).update(
+            progreso=porcentaje,
+            latido=timezone.now(),
+            mensaje=mensaje[:300],
+            resultado={'por_fuente': por_fuente}
+        )
+
+    try:
+        with latiendo(tarea.pk):
+            resultado = ejecutar_scraping(progreso=progreso)
+    except Exception as e:
+        tarea.estado = 'error'
+        tarea.mensaje = f"Error durante el scraping: {e}"[:300]
+        tarea.error = traceback.format_exc()
+    else:
+        tarea.estado = 'completada'
+        tarea.progreso = 100
+        tarea.mensaje = resultado['mensaje'][:300]
+        tarea.resultado = resultado
+
+    tarea.fecha_fin = timezone.now()
+    tarea.save(update_fields=['estado', 'progreso', 'mensaje', 'resultado', 'error', 'fecha_fin'])
+    return tarea
+
+
+def procesar_pendientes():
+    """Procesa todas las tareas pendientes. Retorna cuántas se han ejecutado"""
+    recuperar_abandonadas()
+    procesadas = 0
+    while True:
+        tarea = reclamar_siguiente()
+        if tarea is None:
+            return procesadas
+        ejecutar_tarea(tarea)
+        procesadas += 1
+
+
+def estado_tarea(tarea):
+    """Representación JSON del estado de una tarea para la página de estado"""
+    return {
+        'id': tarea.pk,
+        'estado': tarea.estado,
+        'estado_display': tarea.get_estado_display(),
+        'progreso': tarea.progreso,
+        'mensaje': tarea.mensaje,
+        'por_fuente': tarea.resultado.get('por_fuente', {}),
+        'cambios': tarea.resultado.get('cambios'),
+        'total': tarea.resultado.get('total'),
+        'terminada': tarea.terminada,
+    }
@@ -1,3 +1,1317 @@
-from django.test import TestCase
+import csv
+import importlib
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from main import colaborativo, descargas, extraccion, importacion, libreria, precalculo, recommender, scraping, tareas, whoosh_utils
+from main.models import (Libro, LibroUsuario, PerfilUsuario, RecomendacionPrecalculada, TareaScraping, Valoracion,
+                         VecinoLibro, clave_libro)
+
+
+LIBROS_PRUEBA = [
+    {'titulo': 'El nombre del viento', 'autor': 'Patrick Rothfuss', 'genero': 'Ciencia Ficción y Fantasía',
+     'sinopsis': 'Kvothe cuenta su historia.', 'valoracion': 9.0, 'num_votos': 1500,
+     'url': 'https://example.com/nombre-del-viento', 'portada': '', 'fuente': 'lecturalia'},
+    {'titulo': 'Dune', 'autor': 'Frank Herbert', 'genero': 'Ciencia Ficción y Fantasía',
+     'sinopsis': 'Arrakis y la especia.', 'valoracion': 8.4, 'num_votos': 900,
+     'url': 'https://example.com/dune', 'portada': '', 'fuente': 'quelibroleo'},
+    {'titulo': 'Patria', 'autor': 'Fernando Aramburu', 'genero': 'Narrativa',
+     'sinopsis': 'Dos familias en el País Vasco.', 'valoracion': 8.0, 'num_votos': 300,
+     'url': 'https://example.com/patria', 'portada': '', 'fuente': 'lecturalia'},
+    {'titulo': 'El infinito en un junco', 'autor': 'Irene Vallejo', 'genero': 'Ensayo',
+     'sinopsis': 'Historia de los libros.', 'valoracion': 9.2, 'num_votos': 40,
+     'url': 'https://example.com/infinito', 'portada': '', 'fuente': 'quelibroleo'},
+    {'titulo': 'Los pilares de la tierra', 'autor': 'Ken Follett', 'genero': 'Histórica y Aventuras',
+     'sinopsis': 'Una catedral en la Inglaterra medieval.', 'valoracion': 8.8, 'num_votos': 2500,
+     'url': 'https://example.com/pilares', 'portada': '', 'fuente': 'quelibroleo'},
+]
+
+
+class IndiceTemporalMixin:
+    """Redirige el índice Whoosh a un directorio temporal con libros de prueba"""
+
+    def setUp(self):
+        super().setUp()
+        self._index_dir_original = whoosh_utils.INDEX_DIR
+        self._tmp = tempfile.mkdtemp()
+        whoosh_utils.INDEX_DIR = self._tmp
+        whoosh_utils.invalidar_catalogo()
+        whoosh_utils.limpiar_cache_busquedas()
+        whoosh_utils.indexar_libros([dict(libro) for libro in LIBROS_PRUEBA])
+
+    def tearDown(self):
+        whoosh_utils.cerrar_searchers()
+        whoosh_utils.INDEX_DIR = self._index_dir_original
+        whoosh_utils.invalidar_catalogo()
+        shutil.rmtree(self._tmp, ignore_errors=True)
+        super().tearDown()
+
+
+class CatalogoTests(IndiceTemporalMixin, TestCase):
+
+    def test_catalogo_contiene_todos_los_libros(self):
+        catalogo = whoosh_utils.obtener_catalogo()
+        self.assertEqual(len(catalogo.libros), len(LIBROS_PRUEBA))
+        self.assertEqual(catalogo.conteo_generos['Ciencia Ficción y Fantasía'], 2)
+        self.assertEqual(list(catalogo.generos), sorted({l['genero'] for l in LIBROS_PRUEBA}))
+        self.assertEqual(catalogo.por_url['https://example.com/dune']['autor'], 'Frank Herbert')
+
+    def test_catalogo_se_reutiliza_mientras_no_cambia_el_indice(self):
+        self.assertIs(whoosh_utils.obtener_catalogo(), whoosh_utils.obtener_catalogo())
+
+    def test_catalogo_se_recarga_tras_reindexar(self):
+        anterior = whoosh_utils.obtener_catalogo()
+        whoosh_utils.indexar_libros([dict(LIBROS_PRUEBA[0])])
+        actual = whoosh_utils.obtener_catalogo()
+        self.assertIsNot(anterior, actual)
+        self.assertNotEqual(anterior.generacion, actual.generacion)
+        self.assertEqual(len(actual.libros), 1)
+
+    def test_obtener_todos_libros_devuelve_copias(self):
+        libros = whoosh_utils.obtener_todos_libros()
+        libros[0]['titulo'] = 'Modificado'
+        self.assertNotEqual(whoosh_utils.obtener_catalogo().libros[0]['titulo'], 'Modificado')
+
+
+class BusquedaAgrupadaTests(IndiceTemporalMixin, TestCase):
+
+    def test_coincide_con_una_busqueda_por_genero(self):
+        agrupados = whoosh_utils.buscar_agrupado_por_genero(limite=50)
+        for genero in whoosh_utils.obtener_generos():
+            esperados = [l['url'] for l in whoosh_utils.buscar_por_genero(genero, limite=50)]
+            self.assertEqual([l['url'] for l in agrupados[genero]], esperados)
+
+    def test_respeta_limite_y_omite_generos_vacios(self):
+        agrupados = whoosh_utils.buscar_agrupado_por_genero(['Ciencia Ficción y Fantasía', 'Poesía y Teatro'], limite=1)
+        self.assertEqual(list(agrupados), ['Ciencia Ficción y Fantasía'])
+        self.assertEqual(len(agrupados['Ciencia Ficción y Fantasía']), 1)
+
+    def test_vistas_galeria_e_index(self):
+        self.assertContains(self.client.get('/galeria/'), 'Los pilares de la tierra')
+        self.assertEqual(self.client.get('/').status_code, 200)
+
+
+class BusquedaOrdenadaTests(IndiceTemporalMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Segundo segmento con un título con tilde y otro en minúscula (9.0 y 9.2 quedan en 4.5)
+        nuevos = [
+            {**LIBROS_PRUEBA[1], 'titulo': 'Ágata', 'url': 'https://example.com/agata', 'valoracion': 9.0, 'num_votos': 10},
+            {**LIBROS_PRUEBA[1], 'titulo': 'cien años de soledad', 'url': 'https://example.com/cien', 'valoracion': 7.0,
+             'num_votos': 5000},
+        ]
+        whoosh_utils.indexar_incremental([dict(l) for l in LIBROS_PRUEBA] + nuevos)
+
+    def titulos(self, **kwargs):
+        return [l['titulo'] for l in whoosh_utils.buscar_filtrado(**kwargs)]
+
+    def test_ordena_entre_segmentos_con_clave_secundaria(self):
+        self.assertEqual(self.titulos(orden=['-valoracion', 'titulo'], limite=3),
+                         ['Ágata', 'El infinito en un junco', 'El nombre del viento'])
+        self.assertEqual(self.titulos(orden=['-num_votos'], limite=2), ['cien años de soledad', 'Los pilares de la tierra'])
+
+    def test_titulo_ignora_tildes_y_mayusculas(self):
+        self.assertEqual(self.titulos(orden=['titulo'], limite=3), ['Ágata', 'cien años de soledad', 'Dune'])
+
+    def test_limite_se_aplica_despues_de_ordenar(self):
+        mejor = whoosh_utils.buscar_filtrado(orden=['-valoracion'], limite=1)[0]
+        self.assertEqual(mejor['valoracion'], max(l['valoracion'] for l in whoosh_utils.buscar_filtrado(limite=None)))
+        self.assertNotIn('titulo_orden', mejor)
+
+    def test_orden_desconocido(self):
+        with self.assertRaises(ValueError):
+            whoosh_utils.buscar_filtrado(orden=['-sinopsis'])
+
+    def test_vista_ordena_en_el_indice(self):
+        respuesta = self.client.get('/buscar-avanzado/', {'buscar': '1', 'ordenar': 'popularidad'})
+        self.assertEqual([l['titulo'] for l in respuesta.context['resultados']][:2],
+                         ['cien años de soledad', 'Los pilares de la tierra'])
+
+
+class PaginacionTests(IndiceTemporalMixin, TestCase):
+
+    def test_paginas_recorren_todos_los_resultados(self):
+        paginas = [whoosh_utils.buscar_filtrado_paginado(p, por_pagina=2, orden=['titulo']) for p in (1, 2, 3)]
+        self.assertEqual([p.paginas for p in paginas], [3, 3, 3])
+        self.assertEqual(paginas[0].total, len(LIBROS_PRUEBA))
+        titulos = [l['titulo'] for p in paginas for l in p.libros]
+        self.assertEqual(titulos, [l['titulo'] for l in whoosh_utils.buscar_filtrado(orden=['titulo'], limite=None)])
+        self.assertEqual((paginas[0].anterior, paginas[0].siguiente, paginas[2].siguiente), (None, 2, None))
+        # Una página fuera de rango devuelve la última
+        self.assertEqual(whoosh_utils.buscar_filtrado_paginado(9, por_pagina=2).pagina, 3)
+
+    def test_modo_tarjeta_no_carga_la_sinopsis(self):
+        pagina = whoosh_utils.buscar_por_genero('Ciencia Ficción y Fantasía', pagina=1, por_pagina=1,
+                                                campos_resultado=whoosh_utils.CAMPOS_TARJETA)
+        self.assertEqual((pagina.total, len(pagina.libros)), (2, 1))
+        self.assertEqual(set(pagina.libros[0]), set(whoosh_utils.CAMPOS_TARJETA))
+
+    def test_vistas_paginadas_y_sinopsis_bajo_demanda(self):
+        respuesta = self.client.get('/galeria/', {'genero': 'Ciencia Ficción y Fantasía'})
+        self.assertEqual(respuesta.context['pagina'].total, 2)
+        self.assertNotContains(respuesta, 'Arrakis y la especia.')
+
+        respuesta = self.client.get('/libro/sinopsis/', {'url': 'https://example.com/dune'})
+        self.assertEqual(respuesta.json(), {'sinopsis': 'Arrakis y la especia.'})
+        self.assertEqual(self.client.get('/libro/sinopsis/', {'url': 'https://example.com/no'}).status_code, 404)
+
+
+class CacheBusquedasTests(IndiceTemporalMixin, TestCase):
+
+    def buscar(self, **kwargs):
+        with mock.patch.object(whoosh_utils, 'usar_searcher', wraps=whoosh_utils.usar_searcher) as usar:
+            libros = whoosh_utils.buscar_filtrado(**kwargs)
+        return libros, usar.call_count
+
+    def test_filtros_equivalentes_comparten_entrada(self):
+        libros, busquedas = self.buscar(query_str='historia', generos=['Narrativa', 'Ensayo'], valoracion_min=4)
+        self.assertEqual(busquedas, 1)
+        mismos, busquedas = self.buscar(query_str='  historia ', generos=['Ensayo', 'Narrativa', 'Ensayo'],
+                                        valoracion_min=4.0, campos=['sinopsis', 'autor', 'titulo'])
+        self.assertEqual((mismos, busquedas), (libros, 0))
+        self.assertEqual(self.buscar(query_str='historia', valoracion_min=4)[1], 1)
+
+    def test_devuelve_copias_y_se_invalida_al_reindexar(self):
+        libros, _ = self.buscar(generos=['Ensayo'])
+        libros[0]['titulo'] = 'Modificado'
+        self.assertEqual(self.buscar(generos=['Ensayo'])[0][0]['titulo'], 'El infinito en un junco')
+
+        whoosh_utils.indexar_incremental([dict(l) for l in LIBROS_PRUEBA if l['genero'] != 'Ensayo'])
+        self.assertEqual(self.buscar(generos=['Ensayo']), ([], 1))
+
+    @override_settings(BOOKWISE_CACHE_BUSQUEDAS='default')
+    def test_cache_de_django_compartida(self):
+        cache.clear()
+        self.buscar(fuente='lecturalia')
+        whoosh_utils.limpiar_cache_busquedas()
+        self.assertEqual(self.buscar(fuente='lecturalia')[1], 0)
+
+    @override_settings(BOOKWISE_CACHE_BUSQUEDAS_TTL=0)
+    def test_ttl_cero_desactiva(self):
+        self.buscar(fuente='lecturalia')
+        self.assertEqual(self.buscar(fuente='lecturalia')[1], 1)
+
+
+class ApiTests(IndiceTemporalMixin, TestCase):
+
+    def test_cursor_recorre_el_catalogo(self):
+        urls = []
+        parametros = {'orden': '-num_votos', 'limite': 2, 'campos': 'url,titulo'}
+        while True:
+            datos = self.client.get('/api/libros/', parametros).json()
+            self.assertEqual(datos['total'], len(LIBROS_PRUEBA))
+            self.assertTrue(all(set(l) == {'url', 'titulo'} for l in datos['libros']))
+            urls.extend(l['url'] for l in datos['libros'])
+            if not datos['siguiente']:
+                break
+            parametros = {'orden': '-num_votos', 'campos': 'url,titulo', 'cursor': datos['siguiente']}
+        esperadas = [l['url'] for l in sorted(LIBROS_PRUEBA, key=lambda l: -l['num_votos'])]
+        self.assertEqual(urls, esperadas)
+
+    def test_parametros_y_cursor_invalidos(self):
+        self.assertEqual(self.client.get('/api/libros/', {'campos': 'hash_contenido'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/libros/', {'orden': 'sinopsis'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/libros/', {'cursor': 'xx'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/libros/', {'votos_min': '99999999999999999999'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/libros/', {'valoracion_min': 'nan'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/libros/', {'valoracion_max': 'inf'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/libros/', {'votos_min': str(2 ** 31 - 1)}).status_code, 200)
+
+        cursor = self.client.get('/api/libros/', {'limite': 1}).json()['siguiente']
+        whoosh_utils.indexar_libros([dict(l) for l in LIBROS_PRUEBA])
+        self.assertEqual(self.client.get('/api/libros/', {'cursor': cursor}).status_code, 400)
+
+    def test_etag_y_cache_control(self):
+        respuesta = self.client.get('/api/generos/')
+        self.assertIn('max-age=', respuesta['Cache-Control'])
+        self.assertEqual(len(respuesta.json()['generos']), len({l['genero'] for l in LIBROS_PRUEBA}))
+        self.assertEqual(self.client.get('/api/generos/', HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 304)
+
+        whoosh_utils.indexar_libros([dict(l) for l in LIBROS_PRUEBA])
+        self.assertEqual(self.client.get('/api/generos/', HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 200)
+
+    def test_recomendaciones_del_usuario(self):
+        self.assertEqual(self.client.get('/api/recomendaciones/').status_code, 401)
+        usuario = User.objects.create_user('lector', password='secreta')
+        self.client.force_login(usuario)
+        respuesta = self.client.get('/api/recomendaciones/', {'n': 2, 'campos': 'titulo'})
+        self.assertIn('private', respuesta['Cache-Control'])
+        recomendaciones = respuesta.json()['recomendaciones']
+        self.assertEqual(len(recomendaciones), 2)
+        self.assertEqual(set(recomendaciones[0]), {'titulo', 'score', 'motivo'})
+
+        # El ETag cambia al cambiar de modo o, en modo mixto, al recalcular los
+        # vecinos (la primera petición crea el perfil, así que se toma el de la segunda)
+        etag = self.client.get('/api/recomendaciones/', {'n': 2, 'campos': 'titulo'})['ETag']
+        self.assertEqual(self.client.get('/api/recomendaciones/', {'n': 2, 'campos': 'titulo'},
+                                         HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with override_settings(BOOKWISE_MODO_RECOMENDACION='mixto'):
+            respuesta = self.client.get('/api/recomendaciones/', {'n': 2, 'campos': 'titulo'}, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(respuesta.status_code, 200)
+            libro, vecino = (Libro.objects.desde_catalogo(libro) for libro in LIBROS_PRUEBA[:2])
+            VecinoLibro.objects.create(libro=libro, vecino=vecino, similitud=0.5)
+            self.assertEqual(self.client.get('/api/recomendaciones/', {'n': 2, 'campos': 'titulo'},
+                                             HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 200)
+
+
+class GestorSearchersTests(IndiceTemporalMixin, TestCase):
+
+    def test_reutiliza_el_searcher_si_el_indice_no_cambia(self):
+        with whoosh_utils.usar_searcher() as primero:
+            pass
+        with whoosh_utils.usar_searcher() as segundo:
+            self.assertIs(primero, segundo)
+            self.assertEqual(segundo.doc_count(), len(LIBROS_PRUEBA))
+
+    def test_ve_los_cambios_tras_reindexar(self):
+        with whoosh_utils.usar_searcher() as searcher:
+            self.assertEqual(searcher.doc_count(), len(LIBROS_PRUEBA))
+        whoosh_utils.indexar_libros([dict(LIBROS_PRUEBA[0])])
+        self.assertEqual(whoosh_utils.contar_libros(), 1)
+        self.assertEqual(len(whoosh_utils.buscar_filtrado(query_str='Dune', campos=['titulo'])), 0)
+
+    def test_searchers_simultaneos_son_distintos(self):
+        with whoosh_utils.usar_searcher() as a, whoosh_utils.usar_searcher() as b:
+            self.assertIsNot(a, b)
+
+
+class RecomendadorTests(IndiceTemporalMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario = User.objects.create_user('lector', password='secreta')
+
+    def guardar(self, indice, estado='leido', valoracion=5.0):
+        libro = Libro.objects.desde_catalogo(LIBROS_PRUEBA[indice])
+        return LibroUsuario.objects.create(
+            usuario=self.usuario, libro=libro, estado=estado,
+            valoracion=valoracion if estado == 'leido' else None)
+
+    def referencia(self, n):
+        """Implementación libro a libro con calcular_score()"""
+        perfil = recommender.construir_perfil_usuario(self.usuario.id)
+        urls_excluidas = set(Libro.objects.filter(id__in=perfil['excluidos']).values_list('url', flat=True))
+        candidatos = []
+        for libro in whoosh_utils.obtener_todos_libros():
+            if libro['url'] in urls_excluidas:
+                continue
+            score = recommender.calcular_score(libro, perfil)
+            if score > 0:
+                candidatos.append((round(score, 1), libro['url']))
+        candidatos.sort(key=lambda c: c[0], reverse=True)
+        return candidatos[:n]
+
+    def test_motor_vectorizado_coincide_con_calcular_score(self):
+        self.guardar(0)
+        self.guardar(2, valoracion=4.0)
+        recomendaciones = recommender.recomendar_libros(self.usuario.id, n=10)
+        self.assertEqual([(r['score'], r['url']) for r in recomendaciones], self.referencia(10))
+        self.assertEqual(recomendaciones[0]['titulo'], 'Dune')
+        self.assertEqual(recomendaciones[0]['motivo'], 'Te gusta: Ciencia Ficción y Fantasía')
+
+    def test_excluye_libros_de_la_libreria(self):
+        self.guardar(0)
+        self.guardar(1, estado='por_leer')
+        titulos = [r['titulo'] for r in recommender.recomendar_libros(self.usuario.id, n=10)]
+        self.assertNotIn('Dune', titulos)
+        self.assertNotIn('El nombre del viento', titulos)
+
+    def perfil_guardado(self):
+        perfil = PerfilUsuario.objects.get(usuario=self.usuario)
+        return perfil.generos, perfil.autores, perfil.excluidos, perfil.num_libros
+
+    def test_perfil_incremental_coincide_con_reconstruido(self):
+        primero = self.guardar(0)
+        segundo = self.guardar(1, estado='por_leer')
+        tercero = self.guardar(2, valoracion=4.0)
+        segundo.estado, segundo.valoracion = 'leido', 5.0
+        segundo.save()
+        primero.valoracion = 3.0
+        primero.save()
+        tercero.delete()
+
+        incremental = self.perfil_guardado()
+        self.assertEqual(incremental[3], 1)
+        recommender.reconstruir_perfil(self.usuario.id)
+        self.assertEqual(self.perfil_guardado(), incremental)
+
+    def test_cambio_de_genero_en_el_catalogo_no_descuadra_el_perfil(self):
+        libro = self.guardar(0)
+        self.guardar(1)
+        Libro.objects.sincronizar([dict(LIBROS_PRUEBA[0], genero='Narrativa')])
+        incremental = self.perfil_guardado()
+        self.assertEqual(incremental[0], {'Narrativa': 2, 'Ciencia Ficción y Fantasía': 2})
+
+        libro.delete()
+        incremental = self.perfil_guardado()
+        recommender.reconstruir_perfil(self.usuario.id)
+        self.assertEqual(self.perfil_guardado(), incremental)
+
+        Libro.objects.desde_catalogo(dict(LIBROS_PRUEBA[1], autor='Brian Herbert'))
+        self.assertEqual(self.perfil_guardado()[1], {'Brian Herbert': 2})
+
+    def test_construir_perfil_no_recorre_la_libreria(self):
+        for indice in range(4):
+            self.guardar(indice)
+        with self.assertNumQueries(1):
+            perfil = recommender.construir_perfil_usuario(self.usuario.id)
+        self.assertEqual(perfil['num_libros_perfil'], 4)
+
+    def test_comando_reconstruye_perfiles(self):
+        self.guardar(0)
+        PerfilUsuario.objects.filter(usuario=self.usuario).update(generos={}, num_libros=0)
+        call_command('reconstruir_perfiles', stdout=io.StringIO())
+        self.assertEqual(self.perfil_guardado()[3], 1)
+        self.assertIn(LIBROS_PRUEBA[0]['genero'], self.perfil_guardado()[0])
+
+    def test_candidatos_podados_coinciden_con_todo_el_catalogo(self):
+        aleatorio = random.Random(7)
+        generos = ['Narrativa', 'Poesía', 'Ensayo', 'Terror', 'Humor', 'Historia', 'Romántica']
+        autores = [f'Autor {i}' for i in range(25)]
+        whoosh_utils.indexar_libros([
+            {'titulo': f'Libro {i}', 'autor': aleatorio.choice(autores), 'genero': aleatorio.choice(generos),
+             'sinopsis': '', 'valoracion': aleatorio.choice([0, 6.0, 7.5, 9.0, 10.0]),
+             'num_votos': aleatorio.choice([0, 5, 50, 999, 5000]), 'url': f'https://example.com/{i}',
+             'portada': '', 'fuente': 'lecturalia'}
+            for i in range(300)
+        ])
+        matriz = recommender.obtener_matriz_catalogo()
+
+        populares = matriz.libro_ids[matriz.orden_popularidad[:20]].tolist()
+        for prueba in range(20):
+            # La mitad de los perfiles solo tienen géneros que no están en el catálogo: se rellena con populares
+            perfil = {
+                'generos': set(aleatorio.sample(generos, aleatorio.randint(1, 5))) if prueba % 2 else {'Western'},
+                'autores': set(aleatorio.sample(autores, aleatorio.randint(0, 3))),
+                'excluidos': set(aleatorio.sample(matriz.libro_ids.tolist(), 30) + populares[:prueba]),
+            }
+            todas = np.arange(len(matriz.libros))
+            scores = recommender.puntuar_catalogo(matriz, perfil)
+            validos = (scores > 0) & ~recommender._mascara_excluidos(matriz, perfil['excluidos'], todas)
+            esperadas, _ = recommender.seleccionar_top(scores[validos], todas[validos], 10)
+
+            recomendaciones = recommender.recomendar_libros(self.usuario.id, n=10, perfil=perfil)
+            self.assertEqual([r['url'] for r in recomendaciones], [matriz.libros[i]['url'] for i in esperadas])
+
+    def test_usuario_sin_perfil_recibe_populares(self):
+        recomendaciones = recommender.recomendar_libros(self.usuario.id, n=2)
+        self.assertEqual([r['titulo'] for r in recomendaciones], ['Los pilares de la tierra', 'El nombre del viento'])
+        self.assertTrue(all(r['motivo'] == 'Popular' for r in recomendaciones))
+
+    def test_populares_saltan_los_libros_de_la_libreria(self):
+        self.guardar(4, estado='por_leer')
+        recomendaciones = recommender.recomendar_libros(self.usuario.id, n=10)
+
+        esperados = sorted(whoosh_utils.obtener_todos_libros(), key=recommender.score_popularidad, reverse=True)
+        esperados = [l for l in esperados if l['url'] != LIBROS_PRUEBA[4]['url']]
+        self.assertEqual([r['url'] for r in recomendaciones], [l['url'] for l in esperados])
+        self.assertEqual([r['score'] for r in recomendaciones],
+                         [round(recommender.score_popularidad(l) * 10, 1) for l in esperados])
+
+
+class LibroTests(IndiceTemporalMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario = User.objects.create_user('lector', password='secreta')
+        self.client.force_login(self.usuario)
+
+    def test_agregar_libro_usa_el_catalogo_y_no_duplica(self):
+        libro = LIBROS_PRUEBA[1]
+        for _ in range(2):
+            self.client.post('/mi-libreria/agregar/', {'url': libro['url'], 'titulo': 'Otro título'})
+
+        guardado = LibroUsuario.objects.get(usuario=self.usuario)
+        self.assertEqual((guardado.titulo, guardado.autor), ('Dune', 'Frank Herbert'))
+        self.assertEqual(guardado.libro.clave, clave_libro(libro['url']))
+
+    def test_sincronizar_inserta_y_actualiza(self):
+        Libro.objects.desde_catalogo(dict(LIBROS_PRUEBA[0], sinopsis='Antigua'))
+        self.assertEqual(Libro.objects.sincronizar(LIBROS_PRUEBA, tam_lote=2), len(LIBROS_PRUEBA))
+        self.assertEqual(Libro.objects.count(), len(LIBROS_PRUEBA))
+        self.assertEqual(Libro.objects.get(url=LIBROS_PRUEBA[0]['url']).sinopsis, LIBROS_PRUEBA[0]['sinopsis'])
+
+
+class CacheRecomendacionesTests(IndiceTemporalMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.usuario = User.objects.create_user('lector', password='secreta')
+        self.libro = LibroUsuario.objects.create(
+            usuario=self.usuario, libro=Libro.objects.desde_catalogo(LIBROS_PRUEBA[0]),
+            estado='leido', valoracion=5.0)
+
+    def obtener(self, n=4):
+        with mock.patch.object(recommender, 'construir_perfil_usuario',
+                               wraps=recommender.construir_perfil_usuario) as construir:
+            recomendaciones, perfil_info = recommender.obtener_recomendaciones_y_perfil(self.usuario.id, n=n)
+        return recomendaciones, perfil_info, construir.call_count
+
+    def test_perfil_se_construye_una_vez_y_se_cachea(self):
+        recomendaciones, perfil_info, llamadas = self.obtener()
+        self.assertEqual(llamadas, 1)
+        self.assertTrue(perfil_info['tiene_perfil'])
+        self.assertEqual(self.obtener(), (recomendaciones, perfil_info, 0))
+
+        # Pedir menos recomendaciones reutiliza la entrada; pedir más la recalcula
+        self.assertEqual(self.obtener(n=2), (recomendaciones[:2], perfil_info, 0))
+        self.assertEqual(self.obtener(n=4)[2], 0)
+        recomendaciones, _, llamadas = self.obtener(n=10)
+        self.assertEqual((len(recomendaciones), llamadas), (4, 1))
+        self.assertEqual(self.obtener(n=3)[2], 0)
+
+    def test_cambios_en_la_libreria_invalidan(self):
+        self.obtener()
+        self.libro.valoracion = 2.0
+        self.libro.save()
+        _, perfil_info, llamadas = self.obtener()
+        self.assertEqual(llamadas, 1)
+        self.assertFalse(perfil_info['tiene_perfil'])
+
+        self.libro.delete()
+        self.assertEqual(self.obtener()[2], 1)
+
+    def test_perfil_reconstruido_en_otro_proceso_invalida(self):
+        self.obtener()
+        # Otro proceso reconstruye el perfil: la caché local no se entera
+        PerfilUsuario.objects.filter(usuario=self.usuario).update(actualizado=timezone.now() + timedelta(seconds=1))
+        self.assertEqual(self.obtener()[2], 1)
+        self.assertEqual(self.obtener()[2], 0)
+
+    def test_sirve_las_recomendaciones_precalculadas(self):
+        call_command('precompute_recommendations', '--procesos', '1', stdout=io.StringIO())
+        fila = RecomendacionPrecalculada.objects.get(usuario=self.usuario)
+        self.assertEqual(fila.generacion, whoosh_utils.obtener_catalogo().generacion)
+
+        recomendaciones, perfil_info, llamadas = self.obtener()
+        self.assertEqual(llamadas, 0)
+        self.assertEqual(recomendaciones, recommender.recomendar_libros(self.usuario.id, n=4))
+
+        # Las de otro modo no sirven
+        cache.clear()
+        with override_settings(BOOKWISE_MODO_RECOMENDACION='mixto'):
+            self.assertEqual(self.obtener()[2], 1)
+
+        # Al cambiar el perfil dejan de ser válidas
+        self.libro.valoracion = 4.0
+        self.libro.save()
+        self.assertEqual(self.obtener()[2], 1)
+
+    def test_precalculo_en_varios_procesos(self):
+        usuarios = [self.usuario.id] + [User.objects.create_user(f'lector{i}').id for i in range(4)]
+        pools = []
+
+        class PoolEnProceso:
+            """Sustituye a ProcessPoolExecutor: la base de datos de los tests está en memoria"""
+
+            def __init__(self, max_workers, initializer):
+                pools.append(max_workers)
+                initializer()
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def submit(self, funcion, *args):
+                futuro = Future()
+                futuro.set_result(funcion(*args))
+                return futuro
+
+        avances = []
+        with mock.patch.object(precalculo, 'ProcessPoolExecutor', PoolEnProceso), \
+                mock.patch.object(whoosh_utils, 'cerrar_searchers', wraps=whoosh_utils.cerrar_searchers) as cerrar:
+            total = precalculo.precalcular_recomendaciones(usuarios, n=3, procesos=2, tam_lote=2,
+                                                           al_terminar_lote=avances.append)
+        self.assertEqual(total, 5)
+        self.assertEqual(pools, [2])
+        # Un aviso por lote (as_completed no garantiza el orden de los lotes)
+        self.assertEqual((len(avances), avances[-1]), (3, 5))
+        cerrar.assert_called_once()
+
+        guardadas = dict(RecomendacionPrecalculada.objects.values_list('usuario_id', 'recomendaciones'))
+        self.assertEqual(set(guardadas), set(usuarios))
+        self.assertEqual(guardadas[self.usuario.id], recommender.recomendar_libros(self.usuario.id, n=3))
+
+    def test_reindexar_invalida(self):
+        self.obtener()
+        whoosh_utils.indexar_libros([dict(l) for l in LIBROS_PRUEBA[1:]])
+        _, _, llamadas = self.obtener()
+        self.assertEqual(llamadas, 1)
+
+
+class LibreriaEnBloqueTests(IndiceTemporalMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.usuario = User.objects.create_user('lector', password='secreta')
+        self.client.login(username='lector', password='secreta')
+
+    def perfil_guardado(self):
+        perfil = PerfilUsuario.objects.get(usuario=self.usuario)
+        return perfil.generos, perfil.autores, sorted(perfil.excluidos), perfil.num_libros
+
+    def test_agregar_en_bloque_sin_duplicados(self):
+        LibroUsuario.objects.create(usuario=self.usuario, libro=Libro.objects.desde_catalogo(LIBROS_PRUEBA[0]))
+        libros = [dict(l, estado='leido', valoracion=4.0) for l in LIBROS_PRUEBA] + [dict(LIBROS_PRUEBA[1])]
+
+        # Libros, ids, ya existentes, filas de la librería y el perfil: no crece con el número de libros
+        with self.assertNumQueries(11):
+            self.assertEqual(libreria.agregar_libros(self.usuario.id, libros), 4)
+        self.assertEqual(LibroUsuario.objects.filter(usuario=self.usuario).count(), 5)
+        self.assertEqual(Libro.objects.count(), 5)
+        self.assertEqual(libreria.agregar_libros(self.usuario.id, libros), 0)
+
+        incremental = self.perfil_guardado()
+        recommender.reconstruir_perfil(self.usuario.id)
+        self.assertEqual(self.perfil_guardado(), incremental)
+
+    def test_operaciones_invalidan_recomendaciones(self):
+        recommender.obtener_recomendaciones_y_perfil(self.usuario.id)
+        libreria.agregar_libros(self.usuario.id, [dict(LIBROS_PRUEBA[0], estado='leido', valoracion=5.0)])
+        recomendados, _ = recommender.obtener_recomendaciones_y_perfil(self.usuario.id)
+        self.assertEqual(recomendados[0]['titulo'], 'Dune')
+
+    def test_vistas_marcar_y_eliminar(self):
+        self.client.post('/mi-libreria/lote/agregar/', {'url': [l['url'] for l in LIBROS_PRUEBA[:3]] + ['https://x']})
+        ids = dict(LibroUsuario.objects.filter(usuario=self.usuario).values_list('libro__titulo', 'id'))
+        self.assertEqual(len(ids), 3)
+        # La valoración media del catálogo no pasa a ser la del usuario
+        self.assertEqual(set(LibroUsuario.objects.filter(usuario=self.usuario).values_list('estado', 'valoracion')),
+                         {('por_leer', None)})
+
+        respuesta = self.client.post('/mi-libreria/lote/marcar-leidos/', {
+            'libro_id': [ids['Dune'], ids['Patria']], 'valoracion': '3',
+            f"valoracion_{ids['Dune']}": '4.5',
+        })
+        self.assertRedirects(respuesta, '/mi-libreria/', fetch_redirect_response=False)
+        leidos = dict(LibroUsuario.objects.filter(estado='leido').values_list('libro__titulo', 'valoracion'))
+        self.assertEqual(leidos, {'Dune': 4.5, 'Patria': 3.0})
+        self.assertEqual(self.perfil_guardado()[3], 1)
+
+        otro = User.objects.create_user('otro', password='secreta')
+        ajeno = LibroUsuario.objects.create(usuario=otro, libro_id=Libro.objects.get(titulo='Dune').id)
+        self.client.post('/mi-libreria/lote/eliminar/', {'libro_id': [ids['Dune'], ids['Patria'], ajeno.id]})
+        self.assertEqual(list(LibroUsuario.objects.filter(usuario=self.usuario).values_list('id', flat=True)),
+                         [ids['El nombre del viento']])
+        self.assertTrue(LibroUsuario.objects.filter(id=ajeno.id).exists())
+        self.assertEqual(self.perfil_guardado()[3], 0)
+
+    def test_volver_solo_a_este_sitio(self):
+        for siguiente, destino in (('/buscar/?q=dune', '/buscar/?q=dune'), ('https://malicioso.example/', '/mi-libreria/'),
+                                   ('//malicioso.example/', '/mi-libreria/')):
+            respuesta = self.client.post('/mi-libreria/lote/eliminar/', {'next': siguiente})
+            self.assertRedirects(respuesta, destino, fetch_redirect_response=False)
+
+    def test_valoraciones_fuera_de_rango(self):
+        libreria.agregar_por_url(self.usuario.id, [LIBROS_PRUEBA[0]['url']])
+        fila = LibroUsuario.objects.get(usuario=self.usuario)
+        for valoracion in (0.5, 99.0, float('nan'), float('inf')):
+            with self.assertRaises(ValueError):
+                libreria.marcar_leidos(self.usuario.id, {fila.id: valoracion})
+            with self.assertRaises(ValueError):
+                libreria.agregar_libros(self.usuario.id, [dict(LIBROS_PRUEBA[1], valoracion=valoracion)])
+
+        # Desde el formulario, una valoración que no está en la lista se ignora
+        for valor in ('0.5', '99', 'nan', 'inf'):
+            self.client.post('/mi-libreria/lote/marcar-leidos/', {'libro_id': [fila.id], 'valoracion': valor})
+            self.client.post(f'/mi-libreria/marcar-leido/{fila.id}/', {'valoracion': valor})
+        fila.refresh_from_db()
+        self.assertEqual((fila.estado, fila.valoracion), ('leido', None))
+
+
+CSV_GOODREADS = (
+    'Book Id,Title,Author,Author l-f,My Rating,Exclusive Shelf\n'
+    '1,"Dune (Dune, #1)",Frank Herbert,"Herbert, Frank",5,read\n'
+    '2,Patria,Fernando Aramburu,"Aramburu, Fernando",0,to-read\n'
+    '3,El nombre del viento,Otro Autor,"Autor, Otro",4,read\n'
+    '4,Un libro que no existe,Nadie,"Nadie",3,read\n'
+    '5,El infinito en un junco,Irene Vallejo,"Vallejo, Irene",4,read\n'
+)
+
+
+class ImportacionTests(IndiceTemporalMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario = User.objects.create_user('lector', password='secreta')
+
+    def libreria_usuario(self):
+        return {t: (e, v) for t, e, v in LibroUsuario.objects.filter(usuario=self.usuario)
+                .values_list('libro__titulo', 'estado', 'valoracion')}
+
+    def test_emparejar_por_titulo_y_autor(self):
+        self.assertEqual(importacion.emparejar('DUNE', 'Herbert, Frank')['url'], LIBROS_PRUEBA[1]['url'])
+        self.assertEqual(importacion.emparejar('Dune (Dune, #1)', '')['titulo'], 'Dune')
+        self.assertIsNone(importacion.emparejar('Dune', 'Otro Autor'))
+        self.assertIsNone(importacion.emparejar('Duna', 'Frank Herbert'))
+        # El índice se construye una vez por generación
+        self.assertIs(importacion.indice_catalogo(), importacion.indice_catalogo())
+
+    def test_importa_por_lotes(self):
+        with mock.patch.object(libreria, 'agregar_libros', wraps=libreria.agregar_libros) as agregar:
+            resumen = importacion.importar_csv(self.usuario.id, io.StringIO(CSV_GOODREADS), tam_lote=2)
+        self.assertEqual(agregar.call_count, 2)
+        self.assertEqual(resumen, {'filas': 5, 'encontrados': 3, 'añadidos': 3,
+                                   'no_encontrados': ['El nombre del viento', 'Un libro que no existe']})
+        self.assertEqual(self.libreria_usuario(), {
+            'Dune': ('leido', 5.0), 'Patria': ('por_leer', None), 'El infinito en un junco': ('leido', 4.0),
+        })
+        self.assertEqual(PerfilUsuario.objects.get(usuario=self.usuario).num_libros, 2)
+
+        # Reimportar no duplica
+        self.assertEqual(importacion.importar_csv(self.usuario.id, io.StringIO(CSV_GOODREADS))['añadidos'], 0)
+
+    def test_csv_propio_sin_estado(self):
+        csv_propio = 'titulo,autor,valoracion\nPatria,Aramburu,3.5\nDune,Herbert,\n'
+        importacion.importar_csv(self.usuario.id, io.StringIO(csv_propio))
+        self.assertEqual(self.libreria_usuario(), {'Patria': ('leido', 3.5), 'Dune': ('por_leer', None)})
+
+    def test_vista_y_comando(self):
+        self.client.login(username='lector', password='secreta')
+        fichero = SimpleUploadedFile('goodreads.csv', CSV_GOODREADS.encode('utf-8-sig'), content_type='text/csv')
+        respuesta = self.client.post('/mi-libreria/importar/', {'fichero': fichero})
+        self.assertRedirects(respuesta, '/mi-libreria/', fetch_redirect_response=False)
+        self.assertEqual(len(self.libreria_usuario()), 3)
+
+        fichero = SimpleUploadedFile('malo.csv', b'isbn,autor\n123,Nadie\n', content_type='text/csv')
+        self.client.post('/mi-libreria/importar/', {'fichero': fichero})
+        self.assertEqual(len(self.libreria_usuario()), 3)
+
+        # Un campo más largo que csv.field_size_limit() no da un error 500
+        enorme = b'titulo\n"' + b'x' * (csv.field_size_limit() + 1) + b'"\n'
+        fichero = SimpleUploadedFile('enorme.csv', enorme, content_type='text/csv')
+        respuesta = self.client.post('/mi-libreria/importar/', {'fichero': fichero})
+        self.assertRedirects(respuesta, '/mi-libreria/', fetch_redirect_response=False)
+
+        otro = User.objects.create_user('otro', password='secreta')
+        ruta = os.path.join(self._tmp, 'goodreads.csv')
+        with open(ruta, 'w', encoding='utf-8') as f:
+            f.write(CSV_GOODREADS)
+        salida = io.StringIO()
+        call_command('importar_libreria', 'otro', ruta, stdout=salida)
+        self.assertIn('3 libros añadidos', salida.getvalue())
+        self.assertEqual(LibroUsuario.objects.filter(usuario=otro).count(), 3)
+
+        with open(ruta, 'wb') as f:
+            f.write(enorme)
+        with self.assertRaises(CommandError):
+            call_command('importar_libreria', 'otro', ruta, stdout=io.StringIO())
+
+
+class ColaborativoTests(IndiceTemporalMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.libros = [Libro.objects.desde_catalogo(libro) for libro in LIBROS_PRUEBA]
+        # Quienes leen El nombre del viento también leen Patria (y les gusta)
+        for i in range(3):
+            lector = User.objects.create_user(f'lector{i}')
+            self.guardar(lector, 0, 5.0)
+            self.guardar(lector, 2, 5.0 if i else 4.0)
+        otro = User.objects.create_user('otro')
+        Valoracion.objects.create(usuario=otro, libro=self.libros[0], puntuacion=10.0)
+        Valoracion.objects.create(usuario=otro, libro=self.libros[2], puntuacion=8.0)
+        self.usuario = User.objects.create_user('usuario')
+        self.guardar(self.usuario, 0, 5.0)
+
+    def guardar(self, usuario, indice, valoracion):
+        return LibroUsuario.objects.create(usuario=usuario, libro=self.libros[indice],
+                                           estado='leido', valoracion=valoracion)
+
+    def test_similitud_coincide_con_calculo_denso(self):
+        generador = np.random.default_rng(7)
+        densa = generador.choice([0, 0, 0, 1, 2.5, 4, 5], size=(30, 12))
+        similitud = colaborativo.similitudes(colaborativo.sparse.csr_matrix(densa), min_comunes=2).toarray()
+
+        normas = np.linalg.norm(densa, axis=0)
+        comunes = (densa > 0).T.astype(float) @ (densa > 0).astype(float)
+        esperada = (densa.T @ densa) / np.outer(normas, normas) * comunes / (comunes + colaborativo.AMORTIGUACION)
+        esperada[(comunes < 2) | np.eye(12, dtype=bool)] = 0
+        np.testing.assert_allclose(similitud, np.nan_to_num(esperada))
+
+        vecinos = list(colaborativo.top_vecinos(colaborativo.sparse.csr_matrix(similitud), k=3))
+        self.assertTrue(all(sum(1 for f, _, _ in vecinos if f == fila) <= 3 for fila in range(12)))
+
+    def test_valoraciones_de_libreria_y_valoracion(self):
+        self.guardar(User.objects.get(username='otro'), 0, 3.0)
+        valoraciones = colaborativo.leer_valoraciones()
+        otro = User.objects.get(username='otro').id
+        self.assertEqual(valoraciones[(otro, self.libros[0].id)], 3.0)
+        self.assertEqual(valoraciones[(otro, self.libros[2].id)], 4.0)
+
+    def test_modo_mixto_recomienda_lo_que_leen_lectores_parecidos(self):
+        call_command('calcular_vecinos', stdout=io.StringIO())
+        self.assertTrue(VecinoLibro.objects.filter(libro=self.libros[0], vecino=self.libros[2]).exists())
+
+        with self.assertNumQueries(3):
+            afinidades = colaborativo.afinidades(self.usuario.id)
+        self.assertEqual(list(afinidades), [self.libros[2].id])
+
+        contenido = recommender.recomendar_libros(self.usuario.id, n=2, modo='contenido')
+        self.assertEqual(contenido[0]['titulo'], 'Dune')
+        mixto = recommender.recomendar_libros(self.usuario.id, n=2, modo='mixto')
+        self.assertEqual(mixto[0]['titulo'], 'Patria')
+        self.assertEqual(mixto[0]['motivo'], 'Porque te gustó El nombre del viento')
+        with self.assertRaises(ValueError):
+            recommender.recomendar_libros(self.usuario.id, modo='otro')
+
+    def test_recalcular_vecinos_invalida_la_cache(self):
+        with override_settings(BOOKWISE_MODO_RECOMENDACION='mixto'):
+            precalculo.precalcular_lote([self.usuario.id], n=2)
+            antes, _ = recommender.obtener_recomendaciones_y_perfil(self.usuario.id, n=2)
+            self.assertEqual(antes[0]['titulo'], 'Dune')
+            # La versión de los vecinos está en la base de datos: la caché y la
+            # fila precalculada dejan de valer sin avisar a ningún proceso
+            call_command('calcular_vecinos', stdout=io.StringIO())
+            self.assertTrue(RecomendacionPrecalculada.objects.filter(usuario=self.usuario).exists())
+            despues, _ = recommender.obtener_recomendaciones_y_perfil(self.usuario.id, n=2)
+            self.assertEqual(despues[0]['titulo'], 'Patria')
+
+            precalculo.precalcular_lote([self.usuario.id], n=2)
+            fila = RecomendacionPrecalculada.objects.get(usuario=self.usuario)
+            self.assertEqual(fila.version_vecinos, colaborativo.version_vecinos())
+            self.assertEqual(fila.recomendaciones[0]['titulo'], 'Patria')
+
+
+# Páginas guardadas (recortadas) de las fuentes del scraping
+
+HTML_LISTADO_QUELIBROLEO = """
+<html><body><nav><a href="/">Inicio</a></nav>
+<div class="item">
+  <a class="left_side" href="https://quelibroleo.com/dune"><img src="https://img.example.com/dune.jpg"></a>
+  <div class="col-lg-8"><a href="https://quelibroleo.com/dune"><span><b>Dune</b></span></a>
+    <small><a href="/autor/frank-herbert">Frank Herbert</a></small></div>
+  <div class="tab-pane"><div class="text"><p>Arrakis y la especia... <a>seguir leyendo</a></p></div></div>
+  <div class="estadisticas"><span>8,4</span><i class="numero_votos"><a>1.234 votos</a></i></div>
+</div>
+<div class="item">
+  <a class="left_side" href="https://quelibroleo.com/sin-datos"></a>
+  <div class="col-lg-8"><b>Sin datos</b><small>Anónimo</small></div>
+</div>
+<div class="item"><p>Publicidad</p></div>
+</body></html>
+"""
+
+HTML_LISTADO_LECTURALIA = """
+<html><body>
+<div class="datalist datalist--img"><ul>
+  <li><div class="cover"><img src="https://img.example.com/patria.jpg"></div>
+      <a href="/libro/1/patria">Patria</a> <a href="/autor/2/fernando-aramburu">Fernando Aramburu</a></li>
+  <li><a href="https://www.lecturalia.com/libro/3/solo">Solo un enlace</a></li>
+</ul></div>
+</body></html>
+"""
+
+HTML_DETALLE_LECTURALIA = """
+<html><body>
+<div class="profile__data"><ul>
+  <li>Editorial: <a>Tusquets</a></li>
+  <li>Temas: <a>Narrativa</a>, <a>Drama</a></li>
+  <li>Nota media: 8,5 / 10 (151 votos)</li>
+</ul></div>
+<div class="profile__text"><div class="text">
+  <h2>Resumen y sinopsis</h2>
+  <p>Dos familias en el <b>País Vasco</b>.</p>
+  <div class="ads">Publicidad</div>
+  <p>Treinta años de silencio.</p>
+  <p class="participate">Ha participado en esta ficha: alguien</p>
+</div></div>
+</body></html>
+"""
+
+
+class ServidorLocal:
+    """Servidor HTTP local que sirve páginas guardadas en lugar de las fuentes reales"""
+
+    def __init__(self, paginas):
+        self.paginas = paginas
+        self.peticiones = []
+        self.no_modificadas = []
+        self.fallos_pendientes = {}
+        servidor = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            def do_GET(self):
+                servidor.peticiones.append(self.path)
+                if servidor.fallos_pendientes.get(self.path):
+                    servidor.fallos_pendientes[self.path] -= 1
+                    self.send_error(503)
+                    return
+                html = servidor.paginas.get(self.path)
+                if html is None:
+                    self.send_error(404)
+                    return
+                etag = '"%x"' % zlib.crc32(html.encode('utf-8'))
+                if self.headers.get('If-None-Match') == etag:
+                    servidor.no_modificadas.append(self.path)
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(html.encode('utf-8'))
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Manejador)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def cerrar(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class ServidorLocalMixin:
+    """Apunta el scraping a un ServidorLocal con las páginas guardadas"""
+
+    def setUp(self):
+        super().setUp()
+        self.servidor = ServidorLocal({
+            '/libros/va/mejor-valorados/1': HTML_LISTADO_LECTURALIA,
+            '/libro/1/patria': HTML_DETALLE_LECTURALIA,
+            '/mejores-genero/ciencia?sort=&page=1': HTML_LISTADO_QUELIBROLEO,
+        })
+        for nombre, valor in [('URL_LECTURALIA', self.servidor.url), ('URL_QUELIBROLEO', self.servidor.url),
+                              ('PAGINAS_LECTURALIA', 1), ('PAGINAS_QUELIBROLEO', 2)]:
+            parche = mock.patch.object(scraping, nombre, valor)
+            parche.start()
+            self.addCleanup(parche.stop)
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, True)
+        for nombre, valor in [('RETARDO_CORTESIA', 0), ('ESPERA_REINTENTO', 0), ('CACHE_DIR', self.cache_dir)]:
+            parche = mock.patch.object(descargas, nombre, valor)
+            parche.start()
+            self.addCleanup(parche.stop)
+        self.addCleanup(self.servidor.cerrar)
+
+
+class ScrapingTests(ServidorLocalMixin, TestCase):
+
+    def test_extrae_ambas_fuentes_contra_servidor_local(self):
+        libros = scraping.extraer_todos_libros('todo', ['ciencia'])
+        self.assertEqual([l['titulo'] for l in libros], ['Patria', 'Dune', 'Sin datos'])
+
+        patria, dune = libros[0], libros[1]
+        self.assertEqual(patria['url'], self.servidor.url + '/libro/1/patria')
+        self.assertEqual(patria['genero'], 'Narrativa')
+        self.assertEqual((patria['valoracion'], patria['num_votos']), (8.5, 151))
+        self.assertEqual(patria['sinopsis'], 'Dos familias en el País Vasco . Treinta años de silencio.')
+        self.assertEqual(dune['autor'], 'Frank Herbert')
+        self.assertEqual(dune['sinopsis'], 'Arrakis y la especia...')
+        self.assertEqual((dune['valoracion'], dune['num_votos']), (8.4, 1234))
+        self.assertEqual(libros[2]['sinopsis'], 'No disponible')
+
+    def test_reintenta_errores_transitorios(self):
+        self.servidor.fallos_pendientes['/libro/1/patria'] = 2
+        libros = scraping.extraer_libros_lecturalia()
+        self.assertEqual(libros[0]['genero'], 'Narrativa')
+        self.assertEqual(self.servidor.peticiones.count('/libro/1/patria'), 3)
+
+    def test_pipeline_en_streaming_filtra_duplicados(self):
+        estadisticas = {}
+        libros = scraping.iterar_todos_libros('todo', ['ciencia'])
+        libros = list(scraping.filtrar_duplicados_stream(
+            [*libros, {'titulo': '¡Patria!', 'url': 'otra'}], estadisticas))
+        self.assertEqual([l['titulo'] for l in libros], ['Patria', 'Dune', 'Sin datos'])
+        self.assertEqual(estadisticas, {'duplicados': 1})
+
+    def test_descargas_limitadas_a_la_ventana(self):
+        lanzadas = []
+
+        def urls():
+            for n in range(10):
+                lanzadas.append(n)
+                yield f'{self.servidor.url}/no-existe/{n}'
+
+        with descargas.Descargador() as d:
+            resultados = d.descargar_varias(urls(), ventana=3)
+            next(resultados)
+            self.assertEqual(len(lanzadas), 3)
+            self.assertEqual(len(list(resultados)), 9)
+
+    def test_no_reintenta_errores_definitivos(self):
+        with descargas.Descargador() as d:
+            resultados = list(d.descargar_varias([self.servidor.url + '/no-existe']))
+        self.assertIsNone(resultados[0][1])
+        self.assertEqual(self.servidor.peticiones, ['/no-existe'])
+
+    def test_respeta_el_limite_de_conexiones_por_host(self):
+        activas = []
+        maximo = []
+        lock = threading.Lock()
+        pedir_original = descargas.urllib.request.urlopen
+
+        def urlopen_lento(*args, **kwargs):
+            with lock:
+                activas.append(1)
+                maximo.append(len(activas))
+            try:
+                threading.Event().wait(0.02)
+                return pedir_original(*args, **kwargs)
+            finally:
+                with lock:
+                    activas.pop()
+
+        with mock.patch.object(descargas.urllib.request, 'urlopen', urlopen_lento):
+            with descargas.Descargador(max_hilos=8, max_por_host=2) as d:
+                list(d.descargar_varias([self.servidor.url + '/libro/1/patria'] * 10))
+        self.assertLessEqual(max(maximo), 2)
+
+
+class IndexadoIncrementalTests(IndiceTemporalMixin, TestCase):
+
+    def test_sin_cambios_no_crea_generacion(self):
+        generacion = whoosh_utils.generacion_indice()
+        cambios = whoosh_utils.indexar_incremental([dict(l) for l in LIBROS_PRUEBA])
+        self.assertEqual(cambios['sin_cambios'], len(LIBROS_PRUEBA))
+        self.assertEqual(whoosh_utils.generacion_indice(), generacion)
+
+    def test_generacion_cambia_con_cada_commit(self):
+        generacion = whoosh_utils.generacion_indice()
+        whoosh_utils.indexar_incremental([dict(LIBROS_PRUEBA[0], sinopsis='Otra')], eliminar_ausentes=False)
+        nueva = whoosh_utils.generacion_indice()
+        self.assertNotEqual(nueva, generacion)
+        self.assertEqual(nueva.split(':')[0], whoosh_utils.version_actual())
+
+        shutil.rmtree(whoosh_utils.directorio_actual())
+        self.assertIsNone(whoosh_utils.generacion_indice())
+
+    def test_actualiza_anade_y_elimina(self):
+        libros = [dict(l) for l in LIBROS_PRUEBA[1:]]
+        libros[0]['sinopsis'] = 'Sinopsis nueva sobre gusanos de arena.'
+        libros.append({'titulo': 'Rayuela', 'autor': 'Julio Cortázar', 'genero': 'Narrativa', 'sinopsis': 'París.',
+                       'valoracion': 8.0, 'num_votos': 10, 'url': 'https://example.com/rayuela',
+                       'portada': '', 'fuente': 'lecturalia'})
+
+        cambios = whoosh_utils.indexar_incremental(libros)
+        self.assertEqual(cambios, {'nuevos': 1, 'actualizados': 1, 'sin_cambios': 3, 'eliminados': 1})
+
+        catalogo = whoosh_utils.obtener_catalogo()
+        self.assertEqual(len(catalogo.libros), len(libros))
+        self.assertNotIn(LIBROS_PRUEBA[0]['url'], catalogo.por_url)
+        self.assertEqual(len(whoosh_utils.buscar_filtrado(query_str='gusanos', campos=['sinopsis'])), 1)
+        self.assertEqual(len(whoosh_utils.buscar_filtrado(query_str='Rayuela', campos=['titulo'])), 1)
+
+    def test_por_lotes_consume_un_generador(self):
+        libros = [dict(l, url=l['url'] + '-2') for l in LIBROS_PRUEBA[:3]]
+        lotes = []
+        generacion = whoosh_utils.obtener_catalogo().generacion
+
+        cambios = whoosh_utils.indexar_incremental((l for l in libros), tam_lote=2,
+                                                   al_confirmar_lote=lotes.append)
+        self.assertEqual(cambios, {'nuevos': 3, 'actualizados': 0, 'sin_cambios': 0, 'eliminados': 5})
+        # Un commit intermedio con los dos primeros libros
+        self.assertEqual(lotes, [{'nuevos': 2, 'actualizados': 0, 'sin_cambios': 0, 'eliminados': 0}])
+        self.assertNotEqual(whoosh_utils.obtener_catalogo().generacion, generacion)
+        self.assertEqual(sorted(whoosh_utils.obtener_catalogo().por_url), sorted(l['url'] for l in libros))
+
+    def test_schema_distinto_reconstruye(self):
+        shutil.rmtree(self._tmp)
+        cambios = whoosh_utils.indexar_incremental([dict(LIBROS_PRUEBA[0])])
+        self.assertEqual(cambios['nuevos'], 1)
+        self.assertEqual(whoosh_utils.contar_libros(), 1)
+
+
+class IndexadoParaleloTests(IndiceTemporalMixin, TestCase):
+
+    def test_opciones_del_writer_desde_settings(self):
+        self.assertEqual(whoosh_utils.opciones_writer_reconstruccion(), {'limitmb': whoosh_utils.LIMITMB_RECONSTRUCCION})
+        with override_settings(BOOKWISE_WHOOSH_PROCS=3, BOOKWISE_WHOOSH_LIMITMB=64, BOOKWISE_WHOOSH_MULTISEGMENT=True):
+            self.assertEqual(whoosh_utils.opciones_writer_reconstruccion(),
+                             {'procs': 3, 'limitmb': 64, 'multisegment': True})
+            self.assertEqual(whoosh_utils.opciones_writer_reconstruccion(procs=1), {'limitmb': 64})
+
+    def test_varios_procesos_indexan_lo_mismo(self):
+        libros = [dict(LIBROS_PRUEBA[i % len(LIBROS_PRUEBA)], url=f'https://example.com/{i}', num_votos=i * 7 % 300)
+                  for i in range(300)]
+        whoosh_utils.indexar_libros(libros)
+        esperados = [l['url'] for l in whoosh_utils.buscar_filtrado(orden=['-num_votos'], limite=None)]
+
+        for multisegment in (False, True):
+            ix = whoosh_utils.indexar_libros(libros, procs=2, multisegment=multisegment)
+            self.assertEqual(ix.doc_count(), len(libros))
+            self.assertEqual([l['url'] for l in whoosh_utils.buscar_filtrado(orden=['-num_votos'], limite=None)],
+                             esperados)
+
+    def test_comando_benchmark(self):
+        salida = io.StringIO()
+        version = whoosh_utils.version_actual()
+        call_command('benchmark_indexado', libros=50, procs=[1, 2], stdout=salida)
+        self.assertIn('Más rápido', salida.getvalue())
+        self.assertEqual(whoosh_utils.version_actual(), version)
+        self.assertEqual(whoosh_utils.contar_libros(), len(LIBROS_PRUEBA))
+
+
+class VersionesIndiceTests(IndiceTemporalMixin, TestCase):
+
+    def versiones(self):
+        return sorted(n for n in os.listdir(self._tmp) if n.startswith('v'))
+
+    def test_migracion_0004_lee_la_version_actual_sin_whoosh_utils(self):
+        migracion = importlib.import_module('main.migrations.0004_libro')
+        base = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, base, ignore_errors=True)
+        os.symlink(self._tmp, os.path.join(base, 'Index'))
+        with override_settings(BASE_DIR=base):
+            self.assertEqual(migracion._directorio_indice(),
+                             os.path.join(base, 'Index', whoosh_utils.version_actual()))
+            catalogo = migracion._catalogo_por_titulo()
+        self.assertEqual(catalogo['dune']['url'], LIBROS_PRUEBA[1]['url'])
+        self.assertEqual(len(catalogo), len(LIBROS_PRUEBA))
+
+    def test_busquedas_usan_la_version_anterior_mientras_se_reconstruye(self):
+        vistos = []
+
+        class LibrosObservados(list):
+            def __iter__(self):
+                for libro in super().__iter__():
+                    vistos.append(whoosh_utils.contar_libros())
+                    yield libro
+
+        whoosh_utils.indexar_libros(LibrosObservados(dict(l) for l in LIBROS_PRUEBA[:2]))
+        self.assertEqual(vistos, [len(LIBROS_PRUEBA)] * 2)
+        self.assertEqual(whoosh_utils.contar_libros(), 2)
+
+    def test_error_al_reconstruir_conserva_el_indice(self):
+        anterior = whoosh_utils.version_actual()
+        with self.assertRaises(KeyError):
+            whoosh_utils.indexar_libros([dict(LIBROS_PRUEBA[0]), {'titulo': 'Sin url'}])
+        self.assertEqual(whoosh_utils.version_actual(), anterior)
+        self.assertEqual(self.versiones(), [anterior])
+        self.assertEqual(whoosh_utils.contar_libros(), len(LIBROS_PRUEBA))
+
+    def test_se_conservan_las_versiones_recientes(self):
+        for _ in range(3):
+            whoosh_utils.indexar_libros([dict(l) for l in LIBROS_PRUEBA])
+        self.assertEqual(len(self.versiones()), whoosh_utils.VERSIONES_CONSERVADAS)
+        self.assertEqual(self.versiones()[-1], whoosh_utils.version_actual())
+
+    def test_migra_un_indice_sin_versiones(self):
+        shutil.rmtree(self._tmp)
+        os.makedirs(self._tmp)
+        ix = whoosh_utils.create_in(self._tmp, whoosh_utils.get_schema())
+        with ix.writer() as writer:
+            writer.add_document(**whoosh_utils.documento_libro(LIBROS_PRUEBA[0]))
+        self.assertEqual(whoosh_utils.contar_libros(), 1)
+
+        # El pool de searchers aún tiene abierto el índice antiguo: se borra en la siguiente reconstrucción
+        whoosh_utils.indexar_libros([dict(l) for l in LIBROS_PRUEBA])
+        self.assertEqual(whoosh_utils.contar_libros(), len(LIBROS_PRUEBA))
+        self.assertIn('MAIN_WRITELOCK', os.listdir(self._tmp))
+        whoosh_utils.indexar_libros([dict(l) for l in LIBROS_PRUEBA])
+        self.assertEqual(sorted(os.listdir(self._tmp)), sorted(['ACTUAL'] + self.versiones()))
+
+
+class CacheHttpTests(ServidorLocalMixin, TestCase):
+
+    def test_paginas_vigentes_no_se_vuelven_a_pedir(self):
+        primera = scraping.extraer_todos_libros('todo', ['ciencia'])
+        peticiones = len(self.servidor.peticiones)
+        self.assertEqual(scraping.extraer_todos_libros('todo', ['ciencia']), primera)
+        # Solo se repite la página 2 de QueLibroLeo, que dio 404 y no se cacheó
+        self.assertEqual(self.servidor.peticiones[peticiones:], ['/mejores-genero/ciencia?sort=&page=2'])
+
+    def test_paginas_caducadas_se_revalidan_sin_reparsear(self):
+        primera = scraping.extraer_libros_lecturalia()
+        with mock.patch.dict(descargas.TTL_POR_TIPO, {'listado': 0, 'detalle': 0}), \
+                mock.patch.object(extraccion, 'parsear_detalle_libro') as parsear:
+            self.assertEqual(scraping.extraer_libros_lecturalia(), primera)
+        parsear.assert_not_called()
+        self.assertEqual(sorted(self.servidor.no_modificadas), ['/libro/1/patria', '/libros/va/mejor-valorados/1'])
+
+    def test_contenido_nuevo_se_descarga_y_parsea(self):
+        scraping.extraer_libros_lecturalia()
+        self.servidor.paginas['/libro/1/patria'] = HTML_DETALLE_LECTURALIA.replace('8,5 / 10', '9 / 10')
+        with mock.patch.dict(descargas.TTL_POR_TIPO, {'detalle': 0}):
+            libros = scraping.extraer_libros_lecturalia()
+        self.assertEqual(libros[0]['valoracion'], 9.0)
+
+    def test_limpieza_borra_cuerpos_y_parseos_sin_uso(self):
+        cache_http = descargas.CacheHttp(self.cache_dir)
+        url = self.servidor.url + '/libro/1/patria'
+        antigua = cache_http.guardar(url, b'version antigua')
+        cache_http.parseado('detalle-v1', b'version antigua', lambda c: 'antiguo')
+        nueva = cache_http.guardar(url, b'version nueva')
+        cache_http.parseado('detalle-v1', b'version nueva', lambda c: 'nuevo')
+        cache_http.parseado('detalle-v0', b'version nueva', lambda c: 'otra version')
+        otra = cache_http.guardar(self.servidor.url + '/vieja', b'sin usar')
+
+        # Dentro del margen no se toca nada (otro proceso podría estar escribiendo)
+        self.assertEqual(cache_http.limpiar(version_parseo=1), {})
+
+        with open(cache_http._ruta_entrada(otra['url']), 'w', encoding='utf-8') as f:
+            json.dump(dict(otra, fecha=0), f)
+        borrados = cache_http.limpiar(version_parseo=1, margen=-1)
+        self.assertEqual(borrados, {'entradas': 1, 'cuerpos': 2, 'parseados': 2})
+        self.assertEqual(cache_http.cuerpo(cache_http.entrada(url)), b'version nueva')
+        self.assertFalse(os.path.exists(cache_http._ruta('cuerpos', antigua['hash'])))
+        self.assertFalse(os.path.exists(cache_http._ruta('parseados', 'detalle-v0')))
+        self.assertEqual(cache_http.parseado('detalle-v1', b'version nueva', lambda c: 'reparseado'), 'nuevo')
+        self.assertEqual(nueva['hash'], cache_http.entrada(url)['hash'])
+
+    def test_modo_solo_cache_no_usa_la_red(self):
+        url = self.servidor.url + '/libro/1/patria'
+        with descargas.Descargador(cache=descargas.CacheHttp(self.cache_dir)) as d:
+            d.descargar(url)
+        self.servidor.peticiones.clear()
+        with descargas.Descargador(cache=descargas.CacheHttp(self.cache_dir), solo_cache=True) as d:
+            self.assertIn(b'Nota media', d.descargar(url))
+            with self.assertRaises(LookupError):
+                d.descargar(self.servidor.url + '/no-cacheada')
+        self.assertEqual(self.servidor.peticiones, [])
+
+
+class ExtraccionLxmlTests(TestCase):
+    """El motor lxml debe dar exactamente lo mismo que los parsers con BeautifulSoup"""
+
+    PAGINAS_RARAS = [
+        '',
+        '<html><body><p>Página sin libros</p></body></html>',
+        # Comentarios, scripts, clases con espacios y elementos anidados
+        """<div class=" item  destacado"><a class="left_side" href="/x"><img src="a.jpg"></a>
+           <div class="col-lg-8"><b>Tí<!-- c -->tulo <i>largo</i></b><small>Sin enlace</small></div>
+           <div class="text"><p><script>var x;</script>Texto   con espacios</p></div>
+           <div class="estadisticas"><span>n/a</span></div></div>
+           <div class="item"><a class="left_side" href="/y"></a><div class="col-lg-8"></div>
+           <div class="estadisticas"><i class="numero_votos">sin votos</i></div></div>""",
+        """<div class="profile__data"><ul><li>Temas:</li><li>Nota media: 7 / 10 (1 voto)</li></ul></div>
+           <div class="profile__text"><div class="text"><div>Anuncio</div>Antes<h2>T</h2> después
+           <p class="participate x">fuera</p><p>  </p></div></div>""",
+        '<div class="profile__text"><div class="text"><h2>Solo título</h2></div></div>',
+        '<div class="datalist datalist--img"><ul><li><a href="http://a/b">T</a><a>A</a></li><li></li></ul></div>',
+    ]
+
+    def comparar(self, html):
+        html_bytes = html.encode('utf-8')
+        self.assertEqual(extraccion.parsear_listado_quelibroleo(html_bytes, 'humor'),
+                         scraping.parsear_listado_quelibroleo(html_bytes, 'humor'))
+        self.assertEqual(extraccion.parsear_listado_lecturalia(html_bytes),
+                         scraping.parsear_listado_lecturalia(html_bytes))
+        self.assertEqual(extraccion.parsear_detalle_libro(html_bytes),
+                         scraping.parsear_detalle_libro(html_bytes))
+
+    def test_paridad_con_paginas_guardadas(self):
+        for html in [HTML_LISTADO_QUELIBROLEO, HTML_LISTADO_LECTURALIA, HTML_DETALLE_LECTURALIA]:
+            with self.subTest(html=html[:60]):
+                self.comparar(html)
+
+    def test_paridad_con_marcado_irregular(self):
+        for html in self.PAGINAS_RARAS:
+            with self.subTest(html=html[:60]):
+                self.comparar(html)
+
+    def test_paridad_con_otra_codificacion(self):
+        html = '<meta charset="iso-8859-1">' + HTML_DETALLE_LECTURALIA
+        html_bytes = html.encode('iso-8859-1')
+        self.assertEqual(extraccion.parsear_detalle_libro(html_bytes), scraping.parsear_detalle_libro(html_bytes))
+        self.assertIn('País', extraccion.parsear_detalle_libro(html_bytes)['sinopsis'])
+
+
+class TareasScrapingTests(ServidorLocalMixin, IndiceTemporalMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user('admin', password='secreta', is_staff=True)
+        self.client.force_login(self.admin)
+
+    def test_la_vista_solo_encola(self):
+        with mock.patch.object(scraping, 'ejecutar_scraping') as ejecutar:
+            respuesta = self.client.post('/administracion/scraping/')
+        ejecutar.assert_not_called()
+        tarea = TareaScraping.objects.get()
+        self.assertEqual(tarea.estado, 'pendiente')
+        self.assertRedirects(respuesta, f'/administracion/scraping/{tarea.id}/')
+        self.assertContains(self.client.get(f'/administracion/scraping/{tarea.id}/'), 'procesar_tareas')
+
+        # Una segunda petición no encola otra tarea
+        self.client.post('/administracion/scraping/')
+        self.assertEqual(TareaScraping.objects.count(), 1)
+
+    def test_worker_ejecuta_y_guarda_progreso(self):
+        tarea, _ = tareas.encolar_scraping(self.admin)
+        with mock.patch.object(scraping, 'GENEROS_QUELIBROLEO', ['ciencia']):
+            call_command('procesar_tareas', '--una-vez', stdout=io.StringIO())
+
+        tarea.refresh_from_db()
+        self.assertEqual(tarea.estado, 'completada')
+        self.assertEqual(tarea.progreso, 100)
+        self.assertEqual(tarea.resultado['por_fuente'], {'lecturalia': 1, 'quelibroleo': 2})
+        self.assertEqual(whoosh_utils.contar_libros(), 3)
+
+        estado = self.client.get(f'/administracion/scraping/{tarea.id}/estado/').json()
+        self.assertTrue(estado['terminada'])
+        self.assertEqual(estado['total'], 3)
+
+    def test_error_queda_registrado(self):
+        tarea, _ = tareas.encolar_scraping(self.admin)
+        with mock.patch.object(scraping, 'iterar_todos_libros', side_effect=RuntimeError('sin red')):
+            tareas.procesar_pendientes()
+        tarea.refresh_from_db()
+        self.assertEqual(tarea.estado, 'error')
+        self.assertIn('sin red', tarea.mensaje)
+
+    def test_la_tarea_late_aunque_no_avance(self):
+        tarea, _ = tareas.encolar_scraping(self.admin)
+        latido = threading.Event()
+
+        def scraping_sin_progreso(progreso):
+            self.assertTrue(latido.wait(5))
+            return {'mensaje': 'Hecho'}
+
+        with mock.patch.object(tareas, 'INTERVALO_LATIDO', 0.01), \
+                mock.patch.object(tareas, 'latir', side_effect=lambda tarea_id: latido.set()) as latir, \
+                mock.patch.object(scraping, 'ejecutar_scraping', scraping_sin_progreso):
+            tareas.procesar_pendientes()
+            latidos = latir.call_count
+            time.sleep(0.05)
+
+        latir.assert_called_with(tarea.pk)
+        # Al terminar la tarea el hilo se detiene
+        self.assertEqual(latir.call_count, latidos)
+        tarea.refresh_from_db()
+        self.assertEqual(tarea.estado, 'completada')
+
+    def test_tarea_abandonada_por_un_worker_muerto(self):
+        tarea, _ = tareas.encolar_scraping(self.admin)
+        self.assertEqual(tareas.reclamar_siguiente(), tarea)
+        # El worker muere: la tarea se queda en curso y sin latir
+        self.assertFalse(tareas.encolar_scraping(self.admin)[1])
+
+        hace_rato = timezone.now() - tareas.TAREA_ABANDONADA - timedelta(minutes=1)
+        TareaScraping.objects.filter(pk=tarea.pk).update(latido=hace_rato)
+        nueva, creada = tareas.encolar_scraping(self.admin)
+        self.assertTrue(creada)
+        tarea.refresh_from_db()
+        self.assertEqual(tarea.estado, 'error')
+        self.assertIn('abandonada', tarea.mensaje)
+        self.assertEqual(tareas.reclamar_siguiente(), nueva)
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 from django.views.generic import TemplateView
 
 urlpatterns = [
@@ -9,10 +9,21 @@ urlpatterns = [
     path('mi-libreria/agregar/', views.agregar_libro, name='agregar_libro'),
     path('mi-libreria/marcar-leido/<int:libro_id>/', views.marcar_leido, name='marcar_leido'),
     path('mi-libreria/eliminar/<int:libro_id>/', views.eliminar_libro, name='eliminar_libro'),
+    path('mi-libreria/lote/agregar/', views.agregar_libros_lote, name='agregar_libros_lote'),
+    path('mi-libreria/lote/marcar-leidos/', views.marcar_leidos_lote, name='marcar_leidos_lote'),
+    path('mi-libreria/lote/eliminar/', views.eliminar_libros_lote, name='eliminar_libros_lote'),
+    path('mi-libreria/importar/', views.importar_libreria, name='importar_libreria'),
     path('buscar-avanzado/', views.buscar_avanzado, name='buscar_avanzado'),
+    path('libro/sinopsis/', views.sinopsis_libro, name='sinopsis_libro'),
     path('login/', views.login_view, name='login'),
     path('registro/', views.registro_view, name='registro'),
     path('logout/', views.logout_view, name='logout'),
+    # API JSON
+    path('api/libros/', api.libros, name='api_libros'),
+    path('api/generos/', api.generos, name='api_generos'),
+    path('api/recomendaciones/', api.recomendaciones, name='api_recomendaciones'),
     # Administración
     path('administracion/scraping/', views.realizar_scraping, name='realizar_scraping'),
+    path('administracion/scraping/<int:tarea_id>/', views.estado_scraping, name='estado_scraping'),
+    path('administracion/scraping/<int:tarea_id>/estado/', views.estado_scraping_json, name='estado_scraping_json'),
 ]
@@ -1,13 +1,36 @@
+import csv
+import io
+
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth import authenticate, login as auth_login, logout as auth_logout
 from django.contrib.auth.models import User
 from django.contrib import messages
 from django.utils import timezone
-from main.whoosh_utils import obtener_generos, buscar_por_genero, buscar_filtrado
-from main.models import LibroUsuario
-from main.recommender import obtener_recomendaciones_para_vista, diagnosticar_perfil
-from main.scraping import ejecutar_scraping
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.utils.text import Truncator
+from django.views.decorators.http import require_GET, require_POST
+from main import libreria
+from main.importacion import importar_csv
+from main.whoosh_utils import (CAMPOS_TARJETA, POR_PAGINA, obtener_catalogo, obtener_generos, buscar_por_genero,
+                               buscar_filtrado_paginado, buscar_agrupado_por_genero)
+from main.models import Libro, LibroUsuario, TareaScraping
+from main.recommender import obtener_recomendaciones_y_perfil
+from main.tareas import encolar_scraping, estado_tarea
+
+# Opciones de "ordenar" de la búsqueda avanzada (relevancia no necesita orden)
+ORDENES_BUSQUEDA = {
+    'valoracion': ['-valoracion', 'titulo'],
+    'popularidad': ['-num_votos', 'titulo'],
+    'titulo': ['titulo'],
+}
+
+# Libros de cada género en la galería completa (el resto, en la página del género)
+LIBROS_POR_GENERO_GALERIA = 12
+
+# Valoraciones que se pueden elegir al marcar varios libros como leídos
+VALORES_VALORACION = ['1', '1.5', '2', '2.5', '3', '3.5', '4', '4.5', '5']
 
 
 def is_admin(user):
@@ -15,27 +38,35 @@ def is_admin(user):
     return user.is_staff or user.is_superuser
 
 
+def numero_pagina(request):
+    """Página pedida en ?pagina= (1 si falta o no es válida)"""
+    try:
+        return max(1, int(request.GET.get('pagina', 1)))
+    except ValueError:
+        return 1
+
+
+def parametros_sin_pagina(request):
+    """Query string actual sin ?pagina=, para los enlaces de paginación"""
+    parametros = request.GET.copy()
+    parametros.pop('pagina', None)
+    return parametros.urlencode()
+
+
 def index(request):
     """Vista principal - Descubrir"""
-    generos = obtener_generos()
-
     # Obtener un libro representativo para cada género
-    categorias = []
-    for genero in generos:
-        libros = buscar_por_genero(genero, limite=1)
-        if libros:
-            categorias.append({
-                'nombre': genero,
-                'libro': libros[0]
-            })
+    categorias = [
+        {'nombre': genero, 'libro': libros[0]}
+        for genero, libros in buscar_agrupado_por_genero(limite=1).items()
+    ]
 
     # Obtener recomendaciones personalizadas si el usuario está autenticado
     recomendaciones = []
     perfil_info = None
     
     if request.user.is_authenticated:
-        recomendaciones = obtener_recomendaciones_para_vista(request.user.id, n=4)
-        perfil_info = diagnosticar_perfil(request.user.id)
+        recomendaciones, perfil_info = obtener_recomendaciones_y_perfil(request.user.id, n=4)
 
     return render(request, 'main/index.html', {
         'categorias': categorias,
@@ -48,26 +79,36 @@ def galeria(request):
     """Vista Galería - Catálogo de libros por categoría"""
     generos = obtener_generos()
     genero_filtrado = request.GET.get('genero', None)
+    pagina = None
     
-    # Si hay un género específico, mostrar solo ese
+    # Si hay un género específico, mostrar solo ese, paginado
     if genero_filtrado:
-        libros = buscar_por_genero(genero_filtrado, limite=50)
-        libros_por_genero = {genero_filtrado: libros} if libros else {}
+        pagina = buscar_por_genero(genero_filtrado, pagina=numero_pagina(request), por_pagina=POR_PAGINA,
+                                   campos_resultado=CAMPOS_TARJETA)
+        libros_por_genero = {genero_filtrado: pagina.libros} if pagina.libros else {}
     else:
-        # Mostrar todos los géneros
-        libros_por_genero = {}
-        for genero in generos:
-            libros = buscar_por_genero(genero, limite=50)
-            if libros:
-                libros_por_genero[genero] = libros
+        # Mostrar los primeros libros de todos los géneros
+        libros_por_genero = buscar_agrupado_por_genero(generos, limite=LIBROS_POR_GENERO_GALERIA,
+                                                       campos_resultado=CAMPOS_TARJETA)
     
     return render(request, 'main/galeria.html', {
         'libros_por_genero': libros_por_genero,
         'generos': generos,
-        'genero_filtrado': genero_filtrado
+        'genero_filtrado': genero_filtrado,
+        'pagina': pagina,
+        'parametros': parametros_sin_pagina(request),
     })
 
 
+@require_GET
+def sinopsis_libro(request):
+    """Sinopsis de un libro del catálogo en JSON; los listados la piden al abrir el detalle"""
+    libro = obtener_catalogo().por_url.get(request.GET.get('url', ''))
+    if libro is None:
+        return JsonResponse({'error': 'Libro no encontrado'}, status=404)
+    return JsonResponse({'sinopsis': Truncator(libro.get('sinopsis', '')).words(80)})
+
+
 def mi_libreria(request):
     """Vista Mi Librería"""
     if not request.user.is_authenticated:
@@ -77,13 +118,14 @@ def mi_libreria(request):
             'no_autenticado': True
         })
     
-    libros_usuario = LibroUsuario.objects.filter(usuario=request.user)
+    libros_usuario = LibroUsuario.objects.filter(usuario=request.user).select_related('libro')
     por_leer = libros_usuario.filter(estado='por_leer')
     leidos = libros_usuario.filter(estado='leido')
     
     return render(request, 'main/mi_libreria.html', {
         'por_leer': por_leer,
-        'leidos': leidos
+        'leidos': leidos,
+        'valores_valoracion': VALORES_VALORACION,
     })
 
 
@@ -91,22 +133,27 @@ def mi_libreria(request):
 def agregar_libro(request):
     """Agregar libro a la librería del usuario"""
     if request.method == 'POST':
-        titulo = request.POST.get('titulo')
-        autor = request.POST.get('autor', '')
-        portada = request.POST.get('portada', '')
-        genero = request.POST.get('genero', '')
-        sinopsis = request.POST.get('sinopsis', '')
+        url = request.POST.get('url', '')
         
-        # Verificar si ya existe
-        if not LibroUsuario.objects.filter(usuario=request.user, titulo=titulo).exists():
-            LibroUsuario.objects.create(
+        # Los datos del libro se toman del catálogo; los del formulario solo
+        # se usan si el libro ya no está en el índice
+        datos = obtener_catalogo().por_url.get(url) if url else None
+        if datos is None:
+            datos = {
+                'url': url,
+                'titulo': request.POST.get('titulo', ''),
+                'autor': request.POST.get('autor', ''),
+                'portada': request.POST.get('portada', ''),
+                'genero': request.POST.get('genero', ''),
+                'sinopsis': request.POST.get('sinopsis', ''),
+            }
+        
+        if datos['titulo']:
+            libro = Libro.objects.desde_catalogo(datos)
+            LibroUsuario.objects.get_or_create(
                 usuario=request.user,
-                titulo=titulo,
-                autor=autor,
-                portada=portada,
-                genero=genero,
-                sinopsis=sinopsis,
-                estado='por_leer'
+                libro=libro,
+                defaults={'estado': 'por_leer'}
             )
         
         # Redirigir a donde venía o a mi librería
@@ -122,11 +169,11 @@ def marcar_leido(request, libro_id):
     libro = get_object_or_404(LibroUsuario, id=libro_id, usuario=request.user)
     
     if request.method == 'POST':
-        valoracion = request.POST.get('valoracion')
+        valoracion = _valoracion(request.POST.get('valoracion'))
         libro.estado = 'leido'
         libro.fecha_leido = timezone.now()
-        if valoracion:
-            libro.valoracion = float(valoracion)
+        if valoracion is not None:
+            libro.valoracion = valoracion
         libro.save()
     
     return redirect('mi_libreria')
@@ -140,6 +187,84 @@ def eliminar_libro(request, libro_id):
     return redirect('mi_libreria')
 
 
+def _valoracion(valor):
+    """Valoración de un formulario (None si viene vacía o no es una de VALORES_VALORACION)"""
+    return float(valor) if valor in VALORES_VALORACION else None
+
+
+def _ids_seleccionados(request):
+    return [int(i) for i in request.POST.getlist('libro_id') if i.isdigit()]
+
+
+def _volver(request):
+    """Redirige a next si es una url de este sitio y, si no, a Mi Librería"""
+    siguiente = request.POST.get('next')
+    if siguiente and url_has_allowed_host_and_scheme(siguiente, allowed_hosts={request.get_host()},
+                                                     require_https=request.is_secure()):
+        return redirect(siguiente)
+    return redirect('mi_libreria')
+
+
+@login_required
+@require_POST
+def agregar_libros_lote(request):
+    """Añade a la librería todos los libros del catálogo enviados (campo url repetido)"""
+    añadidos = libreria.agregar_por_url(request.user.id, request.POST.getlist('url'))
+    messages.success(request, f'{añadidos} libros añadidos a tu librería')
+    return _volver(request)
+
+
+@login_required
+@require_POST
+def marcar_leidos_lote(request):
+    """
+    Marca como leídos los libros seleccionados (campo libro_id repetido).
+
+    Cada libro toma la valoración de valoracion_<id> o, si no la tiene, la
+    común del campo valoracion.
+    """
+    comun = _valoracion(request.POST.get('valoracion'))
+    valoraciones = {
+        libro_id: _valoracion(request.POST.get(f'valoracion_{libro_id}')) or comun
+        for libro_id in _ids_seleccionados(request)
+    }
+    marcados = libreria.marcar_leidos(request.user.id, valoraciones) if valoraciones else 0
+    messages.success(request, f'{marcados} libros marcados como leídos')
+    return _volver(request)
+
+
+@login_required
+@require_POST
+def eliminar_libros_lote(request):
+    """Elimina de la librería los libros seleccionados (campo libro_id repetido)"""
+    ids = _ids_seleccionados(request)
+    eliminados = libreria.eliminar_libros(request.user.id, ids) if ids else 0
+    messages.success(request, f'{eliminados} libros eliminados de tu librería')
+    return _volver(request)
+
+
+@login_required
+@require_POST
+def importar_libreria(request):
+    """Importa a la librería un CSV subido (export de Goodreads o propio)"""
+    subido = request.FILES.get('fichero')
+    if subido is None:
+        messages.error(request, 'Selecciona un fichero CSV')
+        return redirect('mi_libreria')
+
+    # Se lee en streaming desde el fichero subido, sin cargarlo entero
+    fichero = io.TextIOWrapper(subido.file, encoding='utf-8-sig', newline='')
+    try:
+        resumen = importar_csv(request.user.id, fichero)
+    except (csv.Error, UnicodeDecodeError, ValueError) as e:
+        messages.error(request, f'No se pudo importar el fichero: {e}')
+        return redirect('mi_libreria')
+
+    messages.success(request, f"{resumen['añadidos']} libros importados "
+                              f"({resumen['encontrados']} de {resumen['filas']} encontrados en el catálogo)")
+    return redirect('mi_libreria')
+
+
 def login_view(request):
     """Vista Login"""
     if request.user.is_authenticated:
@@ -197,7 +322,7 @@ def logout_view(request):
 def buscar_avanzado(request):
     """Vista de Búsqueda Avanzada con filtros"""
     generos_disponibles = obtener_generos()
-    resultados = []
+    pagina = None
     busqueda_realizada = False
 
     # Preservar parámetros de búsqueda para mantener estado del formulario
@@ -233,29 +358,24 @@ def buscar_avanzado(request):
             val_min = None
 
         # Ejecutar búsqueda
-        resultados = buscar_filtrado(
+        pagina = buscar_filtrado_paginado(
+            pagina=numero_pagina(request),
+            orden=ORDENES_BUSQUEDA.get(ordenar_por),
+            campos_resultado=CAMPOS_TARJETA,
             query_str=texto_busqueda,
             campos=campos,
             generos=generos_seleccionados if generos_seleccionados else None,
             valoracion_min=val_min,
             fuente=fuente if fuente else None,
-            limite=50
         )
 
-        # Ordenar resultados si se especifica
-        if ordenar_por != 'relevancia' and resultados:
-            if ordenar_por == 'valoracion':
-                resultados = sorted(resultados, key=lambda x: x.get('valoracion', 0), reverse=True)
-            elif ordenar_por == 'popularidad':
-                resultados = sorted(resultados, key=lambda x: x.get('num_votos', 0), reverse=True)
-            elif ordenar_por == 'titulo':
-                resultados = sorted(resultados, key=lambda x: x.get('titulo', ''))
-
     return render(request, 'main/buscar_avanzado.html', {
         'generos': generos_disponibles,
-        'resultados': resultados,
+        'resultados': pagina.libros if pagina else [],
         'busqueda_realizada': busqueda_realizada,
-        'num_resultados': len(resultados),
+        'num_resultados': pagina.total if pagina else 0,
+        'pagina': pagina,
+        'parametros': parametros_sin_pagina(request),
         # Preservar estado del formulario
         'q': texto_busqueda,
         'valoracion_min': valoracion_min,
@@ -275,18 +395,33 @@ def buscar_avanzado(request):
 @login_required
 @user_passes_test(is_admin)
 def realizar_scraping(request):
-    """Ejecuta el scraping y actualiza el índice Whoosh"""
+    """Encola el scraping para que lo ejecute el worker en segundo plano"""
     if request.method == 'POST':
-        try:
-            
-            # Ejecutar scraping
-            resultado = ejecutar_scraping()
-            
-            messages.success(
-                request, 
-                f"Scraping completado: {resultado.get('total', 0)} libros indexados"
-            )
-        except Exception as e:
-            messages.error(request, f"Error durante el scraping: {str(e)}")
+        tarea, creada = encolar_scraping(request.user)
+        if creada:
+            messages.success(request, "Scraping encolado. Puedes seguir su progreso en esta página.")
+        else:
+            messages.info(request, "Ya hay un scraping en curso")
+        return redirect('estado_scraping', tarea_id=tarea.id)
     
     return redirect('index')
+
+
+@login_required
+@user_passes_test(is_admin)
+def estado_scraping(request, tarea_id):
+    """Página de progreso de una tarea de scraping"""
+    tarea = get_object_or_404(TareaScraping, id=tarea_id)
+    return render(request, 'main/estado_scraping.html', {
+        'tarea': tarea,
+        'estado': estado_tarea(tarea),
+        'tareas_recientes': TareaScraping.objects.exclude(id=tarea.id)[:5],
+    })
+
+
+@login_required
+@user_passes_test(is_admin)
+def estado_scraping_json(request, tarea_id):
+    """Estado de una tarea de scraping en JSON, consultado periódicamente por la página de progreso"""
+    tarea = get_object_or_404(TareaScraping, id=tarea_id)
+    return JsonResponse(estado_tarea(tarea))
@@ -1,13 +1,55 @@
 # whoosh_utils.py
+import hashlib
+import json
 import os
-from whoosh.index import create_in, open_dir, exists_in
+import shutil
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from types import MappingProxyType
+from whoosh.index import create_in, open_dir, exists_in, EmptyIndexError
+from whoosh import columns, sorting
 from whoosh.fields import Schema, TEXT, ID, NUMERIC, KEYWORD
 from whoosh.qparser import QueryParser, MultifieldParser
 from whoosh.query import Every, And, Or, Term, NumericRange
 from .scraping import extraer_todos_libros, filtrar_duplicados
 
-# Directorio del índice
+# Directorio del índice. Cada reconstrucción se escribe en un subdirectorio
+# nuevo (una versión) y el fichero ACTUAL indica cuál se está usando
 INDEX_DIR = os.path.join(os.path.dirname(__file__), '..', 'Index')
+FICHERO_VERSION_ACTUAL = 'ACTUAL'
+
+# Versiones que se conservan al reconstruir (la actual y las anteriores más
+# recientes, que pueden seguir abiertas en otros procesos)
+VERSIONES_CONSERVADAS = 2
+
+# Writer de las reconstrucciones completas. El índice nuevo no se sirve hasta
+# que está completo, así que puede escribirse con mucha memoria y en varios
+# procesos. Se pueden cambiar en settings con BOOKWISE_WHOOSH_PROCS,
+# BOOKWISE_WHOOSH_LIMITMB y BOOKWISE_WHOOSH_MULTISEGMENT.
+PROCS_RECONSTRUCCION = 1
+LIMITMB_RECONSTRUCCION = 256
+MULTISEGMENTO_RECONSTRUCCION = False
+
+# En modo incremental, cada cuántas generaciones se fusionan todos los segmentos
+OPTIMIZAR_CADA = 10
+
+# En la indexación por lotes, cuántos libros escritos entre commits
+TAM_LOTE_INDEXADO = 500
+
+
+def _ajuste(nombre, defecto):
+    """Valor de settings.<nombre>, o `defecto` si no existe o Django no está configurado"""
+    try:
+        from django.conf import settings
+    except ImportError:
+        return defecto
+    if not settings.configured:
+        return defecto
+    return getattr(settings, nombre, defecto)
 
 
 def normalizar_valoracion(valoracion):
@@ -22,88 +64,585 @@ def normalizar_valoracion(valoracion):
     return round(valor_5 * 2) / 2
 
 
+# Campos que necesita la tarjeta de un libro en los listados (todo menos la sinopsis)
+CAMPOS_TARJETA = ('url', 'titulo', 'autor', 'portada', 'genero', 'valoracion', 'num_votos', 'fuente')
+
+# Libros por página en las búsquedas paginadas
+POR_PAGINA = 24
+
+# Claves de ordenación admitidas por buscar_filtrado() y el campo del índice que usan
+CAMPOS_ORDEN = {
+    'valoracion': 'valoracion',
+    'num_votos': 'num_votos',
+    'titulo': 'titulo_orden',
+}
+
+
+def _columna_float():
+    """
+    Columna para ordenar por un NUMERIC float.
+
+    Whoosh 2.7 guarda los float en la columna como enteros ordenables pero usa
+    NaN como valor por defecto, que no se puede empaquetar; los libros sin
+    valor se ordenan como 0.0.
+    """
+    campo = NUMERIC(numtype=float)
+    return columns.NumericColumn(campo.sortable_typecode, default=campo.to_column_value(0.0))
+
+
+def clave_orden_titulo(titulo):
+    """Título en minúsculas y sin tildes, para ordenar alfabéticamente"""
+    descompuesto = unicodedata.normalize('NFKD', titulo.casefold())
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).strip()
+
+
 def get_schema():
-    """Define el schema del índice de libros"""
+    """
+    Define el schema del índice de libros.
+
+    valoracion, num_votos y titulo_orden se guardan también en columnas para
+    que las búsquedas puedan ordenar dentro de Whoosh sin leer los campos
+    almacenados de cada resultado.
+    """
     return Schema(
         titulo=TEXT(stored=True),
+        titulo_orden=ID(sortable=True),
         autor=TEXT(stored=True),
         genero=TEXT(stored=True),
         sinopsis=TEXT(stored=True),
-        valoracion=NUMERIC(stored=True, numtype=float),
-        num_votos=NUMERIC(stored=True, numtype=int),
+        valoracion=NUMERIC(stored=True, numtype=float, sortable=_columna_float()),
+        num_votos=NUMERIC(stored=True, numtype=int, sortable=True),
         url=ID(stored=True, unique=True),
         portada=ID(stored=True),
-        fuente=KEYWORD(stored=True)
+        fuente=KEYWORD(stored=True),
+        hash_contenido=ID(stored=True)
     )
 
 
+def firma_schema(schema):
+    """
+    Representación comparable de un schema.
+
+    Los FieldType de Whoosh comparan sus columnas por identidad, así que un
+    schema con campos ordenables nunca es igual al leído del disco; aquí las
+    columnas se comparan por tipo y configuración.
+    """
+    firma = []
+    for nombre, campo in schema.items():
+        columna = campo.column_type
+        if columna is not None:
+            columna = (type(columna).__name__, sorted(vars(columna).items()))
+        atributos = {k: v for k, v in vars(campo).items()
+                     if not k.startswith('_') and k not in ('column_type', 'analyzer', 'format')}
+        firma.append((nombre, type(campo).__name__, repr(sorted(atributos.items())),
+                      type(campo.format).__name__, columna))
+    return firma
+
+
+# VERSIONES DEL ÍNDICE
+
+def version_actual():
+    """Nombre de la versión en uso (None si no hay o es un índice antiguo sin versiones)"""
+    try:
+        with open(os.path.join(INDEX_DIR, FICHERO_VERSION_ACTUAL), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def directorio_actual():
+    """
+    Directorio del índice en uso.
+
+    Sin fichero ACTUAL es INDEX_DIR, donde guardaban el índice las versiones
+    anteriores de la aplicación; sigue funcionando hasta la próxima reconstrucción.
+    """
+    version = version_actual()
+    return os.path.join(INDEX_DIR, version) if version else INDEX_DIR
+
+
+def _nueva_version():
+    """Crea un índice vacío en un directorio de versión nuevo, sin activarlo"""
+    version = f"v{time.time_ns()}-{os.getpid()}"
+    directorio = os.path.join(INDEX_DIR, version)
+    os.makedirs(directorio)
+    return version, create_in(directorio, get_schema())
+
+
+def activar_version(version):
+    """
+    Pasa a usar la versión indicada.
+
+    Se escribe el nombre en un fichero temporal y se renombra sobre ACTUAL
+    (os.replace es atómico), así que cualquier proceso ve o la versión
+    anterior completa o la nueva completa. Después se borran las versiones
+    antiguas.
+    """
+    temporal = os.path.join(INDEX_DIR, f"{FICHERO_VERSION_ACTUAL}.{os.getpid()}.tmp")
+    with open(temporal, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(temporal, os.path.join(INDEX_DIR, FICHERO_VERSION_ACTUAL))
+    invalidar_catalogo()
+    eliminar_versiones_antiguas()
+
+
+def eliminar_versiones_antiguas(conservar=VERSIONES_CONSERVADAS):
+    """
+    Borra las versiones más antiguas y los ficheros de un índice sin versiones.
+
+    Se conservan las `conservar` más recientes (siempre incluida la actual) y
+    la que tenga abierta el pool de searchers de este proceso. Una versión que
+    no se puede borrar (ficheros en uso en Windows) se intenta de nuevo en la
+    siguiente reconstrucción.
+    """
+    actual = version_actual()
+    if actual is None:
+        return
+
+    versiones = sorted((nombre for nombre in os.listdir(INDEX_DIR)
+                        if nombre.startswith('v') and os.path.isdir(os.path.join(INDEX_DIR, nombre))),
+                       reverse=True)
+    en_uso = {actual, os.path.basename(_gestor_searchers.directorio or '')}
+    for version in versiones[conservar:]:
+        if version not in en_uso:
+            shutil.rmtree(os.path.join(INDEX_DIR, version), ignore_errors=True)
+
+    # Índice de antes de las versiones, guardado directamente en INDEX_DIR
+    if _gestor_searchers.directorio != INDEX_DIR:
+        for nombre in os.listdir(INDEX_DIR):
+            ruta = os.path.join(INDEX_DIR, nombre)
+            if os.path.isfile(ruta) and (nombre.endswith(('.toc', '.seg')) or nombre.startswith('MAIN_')):
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    pass
+
+
 def crear_indice():
-    """Crea el directorio y el índice vacío"""
-    if not os.path.exists(INDEX_DIR):
-        os.makedirs(INDEX_DIR)
-    
-    schema = get_schema()
-    ix = create_in(INDEX_DIR, schema)
-    print(f"Índice creado en: {INDEX_DIR}")
+    """Crea un índice vacío en una versión nueva y pasa a usarlo"""
+    version, ix = _nueva_version()
+    activar_version(version)
+    print(f"Índice creado en: {os.path.join(INDEX_DIR, version)}")
     return ix
 
 
 def abrir_indice():
-    """Abre el índice existente"""
-    if exists_in(INDEX_DIR):
-        return open_dir(INDEX_DIR)
+    """Abre el índice en uso (lo crea vacío si no existe)"""
+    directorio = directorio_actual()
+    if exists_in(directorio):
+        return open_dir(directorio)
     else:
         return crear_indice()
 
 
-def indexar_libros(libros):
-    """Indexa una lista de libros en Whoosh"""
-    ix = crear_indice()
-    writer = ix.writer()
+def documento_libro(libro):
+    """Convierte un libro del scraping en los campos del documento Whoosh"""
+    documento = {
+        'titulo': libro['titulo'],
+        'titulo_orden': clave_orden_titulo(libro['titulo']),
+        'autor': libro['autor'],
+        'genero': libro['genero'],
+        'sinopsis': libro['sinopsis'],
+        'valoracion': normalizar_valoracion(float(libro.get('valoracion', 0))),
+        'num_votos': int(libro.get('num_votos', 0)),
+        'url': libro['url'],
+        'portada': libro.get('portada', ''),
+        'fuente': libro['fuente']
+    }
+    contenido = json.dumps(documento, sort_keys=True, ensure_ascii=False)
+    documento['hash_contenido'] = hashlib.sha1(contenido.encode('utf-8')).hexdigest()
+    return documento
+
+
+def opciones_writer_reconstruccion(procs=None, limitmb=None, multisegment=None):
+    """
+    Argumentos de ix.writer() para una reconstrucción completa.
+
+    Los valores no indicados salen de settings (BOOKWISE_WHOOSH_*) o de las
+    constantes del módulo. Con procs > 1 Whoosh reparte los documentos entre
+    varios procesos (MpWriter), cada uno con `limitmb` MB; con multisegment
+    cada proceso deja su propio segmento en lugar de fusionarlos al final
+    (commit más rápido; la siguiente optimización del modo incremental los junta).
+    """
+    if procs is None:
+        procs = _ajuste('BOOKWISE_WHOOSH_PROCS', PROCS_RECONSTRUCCION)
+    if limitmb is None:
+        limitmb = _ajuste('BOOKWISE_WHOOSH_LIMITMB', LIMITMB_RECONSTRUCCION)
+    if multisegment is None:
+        multisegment = _ajuste('BOOKWISE_WHOOSH_MULTISEGMENT', MULTISEGMENTO_RECONSTRUCCION)
+
+    opciones = {'limitmb': limitmb}
+    if procs and procs > 1:
+        opciones.update(procs=procs, multisegment=multisegment)
+    return opciones
+
+
+def indexar_libros(libros, incremental=False, **opciones_writer):
+    """
+    Indexa una lista de libros en Whoosh.
+
+    Por defecto reconstruye el índice desde cero en una versión nueva, con
+    el writer de opciones_writer_reconstruccion() (se le pueden pasar procs,
+    limitmb y multisegment). Con incremental=True actualiza el índice
+    existente (ver indexar_incremental).
+    """
+    if incremental:
+        indexar_incremental(libros)
+        return abrir_indice()
+
+    # Se escribe en una versión nueva: las búsquedas siguen usando la anterior
+    # completa hasta que se activa
+    version, ix = _nueva_version()
+    writer = ix.writer(**opciones_writer_reconstruccion(**opciones_writer))
     
-    for libro in libros:
-        writer.add_document(
-            titulo=libro['titulo'],
-            autor=libro['autor'],
-            genero=libro['genero'],
-            sinopsis=libro['sinopsis'],
-            valoracion=normalizar_valoracion(float(libro.get('valoracion', 0))),
-            num_votos=int(libro.get('num_votos', 0)),
-            url=libro['url'],
-            portada=libro.get('portada', ''),
-            fuente=libro['fuente']
-        )
+    num_libros = 0
+    try:
+        for libro in libros:
+            writer.add_document(**documento_libro(libro))
+            num_libros += 1
+    except Exception:
+        writer.cancel()
+        shutil.rmtree(os.path.join(INDEX_DIR, version), ignore_errors=True)
+        raise
     
     writer.commit()
-    print(f"Indexados {len(libros)} libros")
+    activar_version(version)
+    print(f"Indexados {num_libros} libros")
     return ix
 
 
+def indexar_incremental(libros, eliminar_ausentes=True, tam_lote=None, al_confirmar_lote=None):
+    """
+    Actualiza el índice existente en lugar de reconstruirlo.
+
+    Usa update_document() con la url como clave y solo reescribe los libros
+    cuyo hash de contenido ha cambiado; con eliminar_ausentes borra los que ya
+    no aparecen en `libros`. Si nada cambia no se hace commit (la generación
+    del índice y las cachés que dependen de ella siguen siendo válidas).
+    El índice nunca queda vacío mientras se actualiza.
+
+    `libros` puede ser un generador y se consume una sola vez: los hashes
+    anteriores se consultan libro a libro y solo se guardan las urls vistas.
+    Con tam_lote se hace commit cada vez que se han escrito tam_lote libros,
+    así los primeros son buscables antes de que termine el scraping;
+    al_confirmar_lote(estadisticas) se llama después de cada uno de esos commits.
+
+    Si el índice no existe o su schema no coincide con get_schema() se
+    reconstruye desde cero en una versión nueva, que solo se activa al
+    terminar (los commits por lotes no son visibles hasta entonces).
+
+    Returns:
+        dict: Número de libros nuevos, actualizados, sin cambios y eliminados
+    """
+    directorio = directorio_actual()
+    version_nueva = None
+    if not exists_in(directorio) or firma_schema(open_dir(directorio).schema) != firma_schema(get_schema()):
+        print("Schema distinto o índice inexistente: reconstruyendo desde cero")
+        version_nueva, ix = _nueva_version()
+    else:
+        ix = open_dir(directorio)
+
+    generacion_inicial = ix.latest_generation()
+    estadisticas = {'nuevos': 0, 'actualizados': 0, 'sin_cambios': 0, 'eliminados': 0}
+    vistos = set()
+    pendientes = 0
+
+    # El searcher se queda en el estado anterior a la actualización aunque haya commits por lotes
+    with ix.searcher() as anterior:
+        writer = ix.writer()
+        try:
+            for libro in libros:
+                documento = documento_libro(libro)
+                url = documento['url']
+                if url in vistos:
+                    continue
+                vistos.add(url)
+
+                campos = anterior.document(url=url)
+                if campos is None:
+                    estadisticas['nuevos'] += 1
+                elif campos.get('hash_contenido') != documento['hash_contenido']:
+                    estadisticas['actualizados'] += 1
+                else:
+                    estadisticas['sin_cambios'] += 1
+                    continue
+                writer.update_document(**documento)
+                pendientes += 1
+
+                if tam_lote and pendientes >= tam_lote:
+                    writer.commit()
+                    invalidar_catalogo()
+                    pendientes = 0
+                    if al_confirmar_lote:
+                        al_confirmar_lote(dict(estadisticas))
+                    writer = ix.writer()
+
+            if eliminar_ausentes:
+                for url in anterior.reader().lexicon('url'):
+                    url = url.decode('utf-8')
+                    # El léxico incluye términos de documentos ya borrados
+                    if url not in vistos and anterior.document_number(url=url) is not None:
+                        writer.delete_by_term('url', url)
+                        estadisticas['eliminados'] += 1
+                        pendientes += 1
+        except Exception:
+            writer.cancel()
+            if version_nueva:
+                shutil.rmtree(os.path.join(INDEX_DIR, version_nueva), ignore_errors=True)
+            raise
+
+    if pendientes:
+        # Fusión completa de segmentos cada OPTIMIZAR_CADA generaciones
+        optimizar = (ix.latest_generation() + 1) // OPTIMIZAR_CADA > generacion_inicial // OPTIMIZAR_CADA
+        writer.commit(optimize=optimizar)
+        invalidar_catalogo()
+    else:
+        writer.cancel()
+
+    if version_nueva:
+        activar_version(version_nueva)
+
+    print(f"Índice actualizado: {estadisticas['nuevos']} nuevos, {estadisticas['actualizados']} actualizados, "
+          f"{estadisticas['sin_cambios']} sin cambios, {estadisticas['eliminados']} eliminados")
+    return estadisticas
+
+
+# (directorio, índice) que usa generacion_indice(): abrir el índice lee el
+# TOC, así que se reutiliza mientras no cambie la versión en uso
+_indice_generacion = None
+
+
+def generacion_indice():
+    """
+    Devuelve un identificador de la versión actual del índice (None si no existe).
+
+    Combina la versión en uso con el número de generación del TOC y su fecha
+    de modificación (un índice sin versiones reinicia la numeración al
+    reconstruirse). El índice se abre una vez por versión; después solo se
+    lee el fichero ACTUAL y se lista el directorio, sin abrir ningún segmento.
+    """
+    global _indice_generacion
+
+    version = version_actual()
+    directorio = os.path.join(INDEX_DIR, version) if version else INDEX_DIR
+    try:
+        abierto = _indice_generacion
+        if abierto is None or abierto[0] != directorio:
+            abierto = _indice_generacion = (directorio, open_dir(directorio))
+        ix = abierto[1]
+        gen = ix.latest_generation()
+        if gen < 0:
+            return None
+        mtime = ix.last_modified()
+    except (OSError, EmptyIndexError):
+        # No hay índice, o la versión se ha borrado mientras se leía
+        return None
+
+    if version:
+        return f"{version}:{gen}-{mtime}"
+    return f"{gen}-{mtime}"
+
+
+# POOL DE SEARCHERS
+
+MAX_SEARCHERS_LIBRES = 8
+
+
+class GestorSearchers:
+    """
+    Mantiene searchers abiertos entre peticiones en lugar de abrir uno nuevo
+    (y releer TOC y segmentos) en cada búsqueda.
+
+    Los searchers de Whoosh no deben compartirse entre hilos, así que cada
+    hilo toma uno del pool en exclusiva y lo devuelve al terminar. Al tomarlo
+    se compara con la generación actual del índice y solo se refresca si ha
+    habido un commit desde que se abrió.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._libres = []
+        self._ix = None
+        self._dir = None
+
+    @property
+    def directorio(self):
+        """Directorio del índice abierto por el pool (None si no hay ninguno)"""
+        return self._dir
+
+    def _tomar(self):
+        generacion = generacion_indice()
+        directorio = directorio_actual()
+        with self._lock:
+            if self._ix is None or self._dir != directorio or generacion is None:
+                # Primera vez, versión nueva del índice o índice recreado
+                self._cerrar_libres()
+                self._ix = abrir_indice()
+                self._dir = directorio_actual()
+                generacion = generacion_indice()
+            ix = self._ix
+            directorio = self._dir
+            if self._libres:
+                searcher, gen_searcher = self._libres.pop()
+            else:
+                searcher, gen_searcher = None, None
+
+        if searcher is None:
+            return ix.searcher(), generacion, directorio
+
+        if gen_searcher != generacion:
+            nuevo = searcher.refresh()
+            if nuevo is searcher:
+                # Mismo número de generación tras reconstruir el índice desde cero
+                searcher.close()
+                nuevo = ix.searcher()
+            searcher = nuevo
+
+        return searcher, generacion, directorio
+
+    def _devolver(self, searcher, generacion, directorio):
+        with self._lock:
+            # Los searchers de una versión que ya no está en uso se cierran
+            if self._dir == directorio and len(self._libres) < MAX_SEARCHERS_LIBRES:
+                self._libres.append((searcher, generacion))
+                return
+        searcher.close()
+
+    def _cerrar_libres(self):
+        for searcher, _ in self._libres:
+            searcher.close()
+        self._libres = []
+
+    @contextmanager
+    def searcher(self):
+        """Presta un searcher actualizado durante el bloque with"""
+        searcher, generacion, directorio = self._tomar()
+        try:
+            yield searcher
+        except Exception:
+            searcher.close()
+            raise
+        else:
+            self._devolver(searcher, generacion, directorio)
+
+    def cerrar(self):
+        """Cierra todos los searchers libres y olvida el índice abierto"""
+        with self._lock:
+            self._cerrar_libres()
+            self._ix = None
+            self._dir = None
+
+
+_gestor_searchers = GestorSearchers()
+
+
+def usar_searcher():
+    """Context manager que presta un searcher del pool del proceso"""
+    return _gestor_searchers.searcher()
+
+
+def cerrar_searchers():
+    """Cierra los searchers abiertos por este proceso"""
+    _gestor_searchers.cerrar()
+
+
+# CATÁLOGO EN MEMORIA
+
+@dataclass(frozen=True)
+class Catalogo:
+    """
+    Instantánea inmutable del índice, compartida por todo el proceso.
+
+    Los libros son dicts con los campos almacenados en Whoosh; se comparten
+    entre peticiones, así que no deben modificarse (copiarlos con dict()).
+    """
+    generacion: str
+    libros: tuple
+    generos: tuple
+    conteo_generos: MappingProxyType
+    por_genero: MappingProxyType
+    por_url: MappingProxyType
+    por_titulo: MappingProxyType
+
+
+_catalogo = None
+_catalogo_lock = threading.Lock()
+
+
+def _cargar_catalogo(generacion):
+    """Lee todos los campos almacenados del índice y construye el catálogo"""
+    with usar_searcher() as searcher:
+        libros = tuple(dict(fields) for fields in searcher.all_stored_fields())
+
+    por_genero = {}
+    por_url = {}
+    por_titulo = {}
+    for libro in libros:
+        if libro.get('genero'):
+            por_genero.setdefault(libro['genero'], []).append(libro)
+        if libro.get('url'):
+            por_url[libro['url']] = libro
+        titulo = libro.get('titulo', '').lower().strip()
+        if titulo:
+            por_titulo.setdefault(titulo, libro)
+
+    generos = tuple(sorted(por_genero))
+
+    return Catalogo(
+        generacion=generacion,
+        libros=libros,
+        generos=generos,
+        conteo_generos=MappingProxyType({g: len(por_genero[g]) for g in generos}),
+        por_genero=MappingProxyType({g: tuple(por_genero[g]) for g in generos}),
+        por_url=MappingProxyType(por_url),
+        por_titulo=MappingProxyType(por_titulo),
+    )
+
+
+def obtener_catalogo():
+    """
+    Retorna el catálogo en memoria, recargándolo solo si el índice ha cambiado.
+
+    Se carga una vez por proceso y generación del índice: tras indexar_libros()
+    (en este u otro proceso) la generación cambia y la siguiente llamada lo relee.
+    """
+    global _catalogo
+
+    generacion = generacion_indice()
+    catalogo = _catalogo
+    if catalogo is not None and catalogo.generacion == generacion:
+        return catalogo
+
+    with _catalogo_lock:
+        # Otro hilo puede haberlo recargado mientras esperábamos
+        if _catalogo is None or _catalogo.generacion != generacion:
+            if generacion is None:
+                abrir_indice()
+                generacion = generacion_indice()
+            _catalogo = _cargar_catalogo(generacion)
+        return _catalogo
+
+
+def invalidar_catalogo():
+    """Descarta el catálogo en memoria de este proceso"""
+    global _catalogo
+    with _catalogo_lock:
+        _catalogo = None
+
+
 def obtener_todos_libros():
     """Retorna todos los libros del índice"""
-    ix = abrir_indice()
-    with ix.searcher() as searcher:
-        results = searcher.search(Every(), limit=None)
-        libros = [dict(hit) for hit in results]
-    
-    return libros
+    return [dict(libro) for libro in obtener_catalogo().libros]
 
 
 def obtener_generos():
     """Retorna lista de géneros únicos"""
-    libros = obtener_todos_libros()
-    generos = set()
-    for libro in libros:
-        if libro.get('genero'):
-            generos.add(libro['genero'])
-
-    return sorted(list(generos))
+    return list(obtener_catalogo().generos)
 
 
 def contar_libros():
     """Retorna el número de libros indexados"""
-    ix = abrir_indice()
-    with ix.searcher() as searcher:
+    with usar_searcher() as searcher:
         return searcher.doc_count()
 
 
@@ -113,15 +652,177 @@ def limpiar_indice():
     writer = ix.writer()
     writer.delete_by_query(Every())
     writer.commit()
+    invalidar_catalogo()
     print("Índice limpiado")
 
+# CACHÉ DE BÚSQUEDAS
+
+# Por defecto cada proceso guarda en memoria los resultados de sus últimas
+# búsquedas. Con BOOKWISE_CACHE_BUSQUEDAS = '<alias>' en settings se usa esa
+# caché de Django (Redis, Memcached...) y se comparte entre workers.
+# BOOKWISE_CACHE_BUSQUEDAS_TTL = 0 desactiva la caché.
+CACHE_BUSQUEDAS_MAX = 256
+CACHE_BUSQUEDAS_TTL = 5 * 60
+
+
+class CacheBusquedas:
+    """LRU con caducidad, segura entre hilos, para los resultados de este proceso"""
+
+    def __init__(self, maximo=CACHE_BUSQUEDAS_MAX):
+        self.maximo = maximo
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return None
+            caduca, valor = entrada
+            if caduca < time.monotonic():
+                del self._entradas[clave]
+                return None
+            self._entradas.move_to_end(clave)
+            return valor
+
+    def guardar(self, clave, valor, ttl):
+        with self._lock:
+            self._entradas[clave] = (time.monotonic() + ttl, valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.maximo:
+                self._entradas.popitem(last=False)
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+
+_cache_busquedas = CacheBusquedas()
+
+
+def _config_cache_busquedas():
+    """(caché de Django o None, ttl) según los ajustes BOOKWISE_CACHE_BUSQUEDAS*"""
+    alias = _ajuste('BOOKWISE_CACHE_BUSQUEDAS', None)
+    ttl = _ajuste('BOOKWISE_CACHE_BUSQUEDAS_TTL', CACHE_BUSQUEDAS_TTL)
+    if alias:
+        from django.core.cache import caches
+        return caches[alias], ttl
+    return None, ttl
+
+
+def clave_busqueda(generacion, tipo, **parametros):
+    """
+    Clave de caché de una búsqueda: generación del índice y parámetros normalizados.
+
+    Búsquedas equivalentes comparten clave aunque los géneros o los campos
+    lleguen en otro orden, repetidos o con espacios de más. El orden de
+    `orden` sí se respeta, porque cambia el resultado.
+    """
+    normalizados = {}
+    for nombre, valor in parametros.items():
+        if nombre == 'query_str':
+            valor = ' '.join((valor or '').split())
+        elif nombre == 'campos':
+            valor = sorted(set(valor or ['titulo', 'autor', 'sinopsis']))
+        elif nombre == 'generos':
+            valor = sorted({g.strip() for g in valor}) if valor else None
+        elif nombre in ('valoracion_min', 'valoracion_max') and valor is not None:
+            valor = float(valor)
+        elif nombre in ('orden', 'campos_resultado') and valor is not None:
+            valor = list(valor)
+        normalizados[nombre] = valor
+    contenido = json.dumps([tipo, normalizados], sort_keys=True, ensure_ascii=False)
+    return f"busqueda:{generacion}:{hashlib.sha1(contenido.encode('utf-8')).hexdigest()}"
+
+
+def _busqueda_cacheada(tipo, calcular, **parametros):
+    """
+    Resultado de calcular() cacheado por generación del índice y parámetros.
+
+    Al reindexar cambia la generación y con ella todas las claves, así que no
+    hace falta invalidar nada: las entradas antiguas caducan o salen del LRU.
+    """
+    compartida, ttl = _config_cache_busquedas()
+    generacion = generacion_indice()
+    if not ttl or generacion is None:
+        return calcular()
+
+    clave = clave_busqueda(generacion, tipo, **parametros)
+    resultado = compartida.get(clave) if compartida is not None else _cache_busquedas.obtener(clave)
+    if resultado is None:
+        resultado = calcular()
+        if compartida is not None:
+            compartida.set(clave, resultado, ttl)
+        else:
+            _cache_busquedas.guardar(clave, resultado, ttl)
+    return resultado
+
+
+def limpiar_cache_busquedas():
+    """Vacía la caché de búsquedas de este proceso"""
+    _cache_busquedas.limpiar()
+
+
 # BÚSQUEDAS AVANZADAS
 
-def buscar_filtrado(query_str="", campos=None, generos=None, valoracion_min=None,
-                    valoracion_max=None, votos_min=None, fuente=None, limite=20):
+def _consulta_filtrada(searcher, query_str="", campos=None, generos=None, valoracion_min=None,
+                       valoracion_max=None, votos_min=None, fuente=None):
+    """Construye la consulta de buscar_filtrado() combinando los filtros con AND"""
+    filtros = []
+
+    # Búsqueda de texto general en los campos especificados
+    if query_str:
+        parser = MultifieldParser(campos or ['titulo', 'autor', 'sinopsis'], searcher.schema)
+        text_query = parser.parse(query_str)
+        filtros.append(text_query)
+
+    # Filtro por géneros
+    if generos and len(generos) > 0:
+        genero_parser = QueryParser("genero", searcher.schema)
+        genero_queries = [genero_parser.parse(f'"{g}"') for g in generos]
+        filtros.append(Or(genero_queries))
+
+    # Filtro por valoración
+    if valoracion_min is not None or valoracion_max is not None:
+        min_val = valoracion_min if valoracion_min is not None else 0.0
+        max_val = valoracion_max if valoracion_max is not None else 5.0
+        filtros.append(NumericRange("valoracion", min_val, max_val))
+
+    # Filtro por votos mínimos
+    if votos_min is not None:
+        filtros.append(NumericRange("num_votos", votos_min, None))
+
+    # Filtro por fuente
+    if fuente:
+        filtros.append(Term("fuente", fuente))
+
+    # Combinar todos los filtros con AND
+    if filtros:
+        return And(filtros)
+    return Every()
+
+
+def _resultado(hit, campos_resultado=None):
+    """Campos almacenados de un resultado (solo campos_resultado si se indica)"""
+    if campos_resultado is None:
+        return dict(hit)
+    campos = hit.fields()
+    return {campo: campos[campo] for campo in campos_resultado if campo in campos}
+
+
+def buscar_filtrado(query_str="", campos=None, generos=None, valoracion_min=None, valoracion_max=None,
+                    votos_min=None, fuente=None, limite=20, orden=None, campos_resultado=None):
     """
     Búsqueda con múltiples filtros combinados.
 
+    Sin `orden` los resultados salen por relevancia. Con `orden` se ordenan
+    dentro de Whoosh usando las columnas del índice, así que `limite` se
+    aplica después de ordenar (los mejor valorados de todos los que cumplen
+    los filtros, no de los más relevantes).
+
+    Los resultados se cachean por generación del índice y filtros
+    normalizados (ver _busqueda_cacheada()).
+
     Args:
         query_str: Texto a buscar (opcional)
         campos: Lista de campos donde buscar (por defecto: ['titulo', 'autor', 'sinopsis'])
@@ -131,53 +832,140 @@ def buscar_filtrado(query_str="", campos=None, generos=None, valoracion_min=None
         votos_min: Número mínimo de votos
         fuente: Fuente específica ('quelibroleo' o 'lecturalia')
         limite: Número máximo de resultados
+        orden: Lista de claves de CAMPOS_ORDEN; con '-' delante el orden es
+            descendente (ej: ['-valoracion', 'titulo'])
+        campos_resultado: Campos a devolver de cada libro (ej: CAMPOS_TARJETA);
+            por defecto todos los almacenados
     """
+    ordenar_por = criterio_orden(orden) if orden else None
+
+    def calcular():
+        with usar_searcher() as searcher:
+            query_final = _consulta_filtrada(searcher, query_str, campos, generos, valoracion_min,
+                                             valoracion_max, votos_min, fuente)
+            results = searcher.search(query_final, limit=limite, sortedby=ordenar_por)
+            return [_resultado(hit, campos_resultado) for hit in results]
+
+    libros = _busqueda_cacheada(
+        'filtrado', calcular, query_str=query_str, campos=campos, generos=generos,
+        valoracion_min=valoracion_min, valoracion_max=valoracion_max, votos_min=votos_min,
+        fuente=fuente, limite=limite, orden=orden, campos_resultado=campos_resultado,
+    )
+    # Copias: las listas cacheadas se comparten entre peticiones
+    return [dict(libro) for libro in libros]
 
-    ix = abrir_indice()
-    with ix.searcher() as searcher:
-        filtros = []
-
-        # Búsqueda de texto general en los campos especificados
-        if query_str:
-            parser = MultifieldParser(campos, ix.schema)
-            text_query = parser.parse(query_str)
-            filtros.append(text_query)
-
-        # Filtro por géneros
-        if generos and len(generos) > 0:
-            genero_parser = QueryParser("genero", ix.schema)
-            genero_queries = [genero_parser.parse(f'"{g}"') for g in generos]
-            filtros.append(Or(genero_queries))
-
-        # Filtro por valoración
-        if valoracion_min is not None or valoracion_max is not None:
-            min_val = valoracion_min if valoracion_min is not None else 0.0
-            max_val = valoracion_max if valoracion_max is not None else 5.0
-            filtros.append(NumericRange("valoracion", min_val, max_val))
-
-        # Filtro por votos mínimos
-        if votos_min is not None:
-            filtros.append(NumericRange("num_votos", votos_min, None))
-
-        # Filtro por fuente
-        if fuente:
-            filtros.append(Term("fuente", fuente))
-
-        # Combinar todos los filtros con AND
-        if filtros:
-            query_final = And(filtros)
-        else:
-            query_final = Every()
 
-        results = searcher.search(query_final, limit=limite)
-        libros = [dict(hit) for hit in results]
+@dataclass(frozen=True)
+class PaginaResultados:
+    """Una página de resultados de búsqueda"""
+    libros: list
+    pagina: int
+    paginas: int
+    total: int
+    por_pagina: int
+
+    @property
+    def anterior(self):
+        return self.pagina - 1 if self.pagina > 1 else None
+
+    @property
+    def siguiente(self):
+        return self.pagina + 1 if self.pagina < self.paginas else None
+
+
+def buscar_filtrado_paginado(pagina=1, por_pagina=POR_PAGINA, orden=None, campos_resultado=None, **filtros):
+    """
+    Como buscar_filtrado(), pero devuelve solo la página pedida.
+
+    Usa search_page() de Whoosh: solo se leen los campos almacenados de los
+    libros de esa página. Una página mayor que la última devuelve la última.
+
+    Args:
+        pagina: Número de página, empezando en 1
+        por_pagina: Libros por página
+        filtros: Los mismos filtros que buscar_filtrado()
+
+    Returns:
+        PaginaResultados
+    """
+    ordenar_por = criterio_orden(orden) if orden else None
+
+    def calcular():
+        with usar_searcher() as searcher:
+            query_final = _consulta_filtrada(searcher, **filtros)
+            resultados = searcher.search_page(query_final, max(1, pagina), pagelen=por_pagina, sortedby=ordenar_por)
+            libros = [_resultado(hit, campos_resultado) for hit in resultados]
+
+        return PaginaResultados(
+            libros=libros,
+            pagina=max(1, resultados.pagenum),
+            paginas=resultados.pagecount,
+            total=resultados.total,
+            por_pagina=por_pagina,
+        )
 
-    return libros
+    resultado = _busqueda_cacheada('paginado', calcular, pagina=pagina, por_pagina=por_pagina, orden=orden,
+                                   campos_resultado=campos_resultado, **filtros)
+    return replace(resultado, libros=[dict(libro) for libro in resultado.libros])
+
+
+def criterio_orden(orden):
+    """
+    Convierte una lista de claves de ordenación en el sortedby de Whoosh.
+
+    Raises:
+        ValueError: Si alguna clave no está en CAMPOS_ORDEN
+    """
+    facetas = []
+    for clave in orden:
+        descendente = clave.startswith('-')
+        nombre = clave.lstrip('-')
+        if nombre not in CAMPOS_ORDEN:
+            raise ValueError(f"Orden no válido: {clave!r} (opciones: {', '.join(CAMPOS_ORDEN)})")
+        facetas.append(sorting.FieldFacet(CAMPOS_ORDEN[nombre], reverse=descendente))
+    return sorting.MultiFacet(facetas)
 
 
-def buscar_por_genero(genero, limite=50):
-    """Busca libros de un género específico usando búsqueda filtrada"""
-    return buscar_filtrado(generos=[genero], limite=limite)
+def buscar_por_genero(genero, limite=50, pagina=None, por_pagina=POR_PAGINA, campos_resultado=None):
+    """
+    Busca libros de un género específico usando búsqueda filtrada.
+
+    Con `pagina` devuelve un PaginaResultados en lugar de los primeros
+    `limite` libros.
+    """
+    if pagina is not None:
+        return buscar_filtrado_paginado(pagina, por_pagina, campos_resultado=campos_resultado, generos=[genero])
+    return buscar_filtrado(generos=[genero], limite=limite, campos_resultado=campos_resultado)
+
+
+def buscar_agrupado_por_genero(generos=None, limite=50, campos_resultado=None):
+    """
+    Retorna {genero: [libros]} con los primeros `limite` libros de cada género.
+
+    Sustituye a llamar a buscar_por_genero() una vez por género: los grupos
+    salen del catálogo en memoria, que se construye con una única pasada del
+    searcher por generación del índice. Mantiene el orden del índice dentro de
+    cada género y omite los géneros sin libros.
+
+    Args:
+        generos: Géneros a incluir, en el orden deseado (por defecto: todos)
+        limite: Número máximo de libros por género (None para todos)
+        campos_resultado: Campos a devolver de cada libro (por defecto todos)
+    """
+    catalogo = obtener_catalogo()
+    if generos is None:
+        generos = catalogo.generos
+
+    agrupados = {}
+    for genero in generos:
+        libros = catalogo.por_genero.get(genero)
+        if libros:
+            libros = libros[:limite]
+            if campos_resultado is not None:
+                libros = [{c: libro[c] for c in campos_resultado if c in libro} for libro in libros]
+            agrupados[genero] = list(libros)
+
+    return agrupados
 
 if __name__ == '__main__':
     